@@ -11,6 +11,7 @@ from productos.models import (
     ImagenProducto,
 )
 from pedidos.models import Pedido
+from pedidos.services import TRANSICIONES_PERMITIDAS, transicion_permitida
 
 
 class ProductoForm(forms.ModelForm):
@@ -86,6 +87,20 @@ class MarcaForm(forms.ModelForm):
 
 
 class PedidoEstadoForm(forms.ModelForm):
+    """Solo ofrece el estado actual y los que ``TRANSICIONES_PERMITIDAS`` admite desde él."""
+
     class Meta:
         model = Pedido
         fields = ["estado"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        actual = self.instance.estado
+        permitidos = {actual} | {
+            destino
+            for destino in TRANSICIONES_PERMITIDAS.get(actual, ())
+            if transicion_permitida(self.instance, destino)
+        }
+        self.fields["estado"].choices = [
+            (valor, etiqueta) for valor, etiqueta in Pedido.Estados.choices if valor in permitidos
+        ]
@@ -0,0 +1,93 @@
+"""
+Indicadores del panel.
+
+Se calculan con una agregación condicional por tabla y se guardan en la caché. Pasado
+``PANEL_INDICADORES_TTL`` se siguen sirviendo los valores guardados mientras un hilo los
+recalcula, así que el panel no espera a la base de datos salvo la primera vez. La caché
+es la compartida del proyecto (``CACHES``), así que la marca de refresco es común a todos
+los workers y solo uno recalcula cada vez.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from informes.acumulados import ESTADOS_CONTABLES
+from pedidos.models import Pedido
+from productos.models import Producto
+
+logger = logging.getLogger(__name__)
+
+CLAVE_CACHE = "admin_panel:indicadores"
+CLAVE_REFRESCO = "admin_panel:indicadores:refrescando"
+
+
+def calcular_indicadores() -> Dict[str, Any]:
+    ahora = timezone.localtime()
+    inicio_dia = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio_semana = inicio_dia - timedelta(days=inicio_dia.weekday())
+    # Mismo criterio que los informes de ventas: los pendientes aún no están cobrados.
+    contables = Q(estado__in=ESTADOS_CONTABLES)
+
+    pedidos = Pedido.objects.aggregate(
+        pedidos_pendientes=Count("id", filter=Q(estado=Pedido.Estados.PENDIENTE)),
+        pedidos_procesando=Count("id", filter=Q(estado=Pedido.Estados.PROCESANDO)),
+        pedidos_enviados=Count("id", filter=Q(estado=Pedido.Estados.ENVIADO)),
+        pedidos_entregados=Count("id", filter=Q(estado=Pedido.Estados.ENTREGADO)),
+        ingresos_hoy=Sum("total", filter=contables & Q(fecha_creacion__gte=inicio_dia)),
+        ingresos_semana=Sum("total", filter=contables & Q(fecha_creacion__gte=inicio_semana)),
+        ticket_medio=Avg("total", filter=contables),
+    )
+    productos = Producto.objects.aggregate(
+        productos_total=Count("id"),
+        productos_stock_bajo=Count(
+            "id", filter=Q(stock__lte=getattr(settings, "PANEL_UMBRAL_STOCK_BAJO", 5))
+        ),
+    )
+    for clave in ("ingresos_hoy", "ingresos_semana", "ticket_medio"):
+        pedidos[clave] = Decimal(pedidos[clave] or 0).quantize(Decimal("0.01"))
+    return {**pedidos, **productos, "calculado_en": ahora}
+
+
+def _guardar(indicadores: Dict[str, Any]) -> None:
+    ttl = getattr(settings, "PANEL_INDICADORES_TTL", 60)
+    # Se conserva bastante más que el TTL para poder servir valores antiguos al refrescar.
+    cache.set(CLAVE_CACHE, {"datos": indicadores, "marca": time.time()}, ttl * 10)
+
+
+def _refrescar() -> None:
+    try:
+        _guardar(calcular_indicadores())
+    except Exception:  # pragma: no cover - se reintenta en la siguiente visita
+        logger.exception("No se pudieron recalcular los indicadores del panel")
+    finally:
+        cache.delete(CLAVE_REFRESCO)
+        close_old_connections()
+
+
+def _refrescar_en_segundo_plano() -> None:
+    # cache.add es atómico en la caché compartida: solo un hilo de un worker recalcula a la vez.
+    if cache.add(CLAVE_REFRESCO, True, 60):
+        threading.Thread(target=_refrescar, name="indicadores-panel", daemon=True).start()
+
+
+def obtener_indicadores() -> Dict[str, Any]:
+    guardado = cache.get(CLAVE_CACHE)
+    if guardado is None:
+        indicadores = calcular_indicadores()
+        _guardar(indicadores)
+        return indicadores
+    if time.time() - guardado["marca"] > getattr(settings, "PANEL_INDICADORES_TTL", 60):
+        _refrescar_en_segundo_plano()
+    return guardado["datos"]
@@ -0,0 +1,255 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from pedidos import exportacion
+from pedidos.models import ItemPedido, Pedido
+from productos.models import Categoria, Marca, Producto
+
+from admin_panel import indicadores, views
+
+User = get_user_model()
+
+
+class PedidoListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", password="clave-segura", is_staff=True
+        )
+        producto = Producto.objects.create(
+            nombre="Modelo Panel",
+            precio=Decimal("20.00"),
+            marca=Marca.objects.create(nombre="Panel"),
+            categoria=Categoria.objects.create(nombre="Panel"),
+            stock=100,
+        )
+        for indice in range(5):
+            pedido = Pedido.objects.create(
+                numero_pedido=f"PANEL{indice}",
+                total=Decimal("40.00"),
+                estado=Pedido.Estados.ENVIADO if indice % 2 else Pedido.Estados.PENDIENTE,
+                metodo_pago=Pedido.MetodosPago.TARJETA,
+                direccion_envio="Calle Panel",
+                telefono="600000000",
+            )
+            for _ in range(2):
+                ItemPedido.objects.create(
+                    pedido=pedido,
+                    producto=producto,
+                    cantidad=1,
+                    precio_unitario=Decimal("20.00"),
+                    total=Decimal("20.00"),
+                )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    @mock.patch.object(views, "PEDIDOS_POR_PAGINA", 2)
+    def test_pagina_por_cursor_sin_repetir_pedidos(self):
+        vistos = []
+        url = reverse("admin_panel:pedidos_list")
+        consulta = ""
+        while True:
+            respuesta = self.client.get(f"{url}?{consulta}")
+            vistos += [pedido.numero_pedido for pedido in respuesta.context["pedidos"]]
+            consulta = respuesta.context["siguiente"]
+            if not consulta:
+                break
+
+        self.assertEqual(vistos, [f"PANEL{indice}" for indice in reversed(range(5))])
+
+    def test_anota_articulos_y_filtra_en_servidor(self):
+        respuesta = self.client.get(
+            reverse("admin_panel:pedidos_list"),
+            {"estado": Pedido.Estados.ENVIADO, "metodo_pago": Pedido.MetodosPago.TARJETA},
+        )
+
+        pedidos = respuesta.context["pedidos"]
+        self.assertEqual([pedido.numero_pedido for pedido in pedidos], ["PANEL3", "PANEL1"])
+        self.assertEqual(pedidos[0].num_articulos, 2)
+        self.assertIsNone(respuesta.context["siguiente"])
+
+    def test_exporta_csv_en_streaming_con_los_filtros(self):
+        respuesta = self.client.get(
+            reverse("admin_panel:pedidos_exportar"), {"estado": Pedido.Estados.ENVIADO}
+        )
+
+        self.assertTrue(respuesta.streaming)
+        self.assertIn("attachment", respuesta["Content-Disposition"])
+        lineas = b"".join(respuesta.streaming_content).decode().splitlines()
+        self.assertTrue(lineas[0].startswith("id,numero_pedido,"))
+        self.assertEqual(len(lineas), 1 + 4)
+        self.assertTrue(all(",PANEL1," in linea or ",PANEL3," in linea for linea in lineas[1:]))
+
+    async def test_exporta_en_streaming_con_asgi_sin_leerlo_entero(self):
+        await self.async_client.aforce_login(self.staff)
+        producidos = []
+        exportar = views.exportar
+
+        def contar(*args, **kwargs):
+            for trozo in exportar(*args, **kwargs):
+                producidos.append(trozo)
+                yield trozo
+
+        with mock.patch.object(views, "exportar", contar), mock.patch.object(exportacion, "TROZOS_POR_BLOQUE", 2):
+            respuesta = await self.async_client.get(reverse("admin_panel:pedidos_exportar"))
+            self.assertTrue(respuesta.is_async)
+            flujo = aiter(respuesta.streaming_content)
+
+            primero = await anext(flujo)
+            # Solo se ha generado el primer bloque (cabecera y una fila) de las 11 líneas.
+            self.assertEqual(len(producidos), 2)
+            resto = b"".join([bloque async for bloque in flujo])
+
+        self.assertEqual(len(producidos), 11)
+        lineas = (primero + resto).decode().splitlines()
+        self.assertTrue(lineas[0].startswith("id,numero_pedido,"))
+        self.assertEqual(len(lineas), 11)
+
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", password="clave-segura", is_staff=True
+        )
+        for indice, estado in enumerate(
+            [
+                Pedido.Estados.PENDIENTE,
+                Pedido.Estados.PROCESANDO,
+                Pedido.Estados.ENVIADO,
+                Pedido.Estados.CANCELADO,
+            ]
+        ):
+            Pedido.objects.create(
+                numero_pedido=f"DASH{indice}",
+                total=Decimal("30.00"),
+                estado=estado,
+                metodo_pago=Pedido.MetodosPago.TARJETA,
+                direccion_envio="Calle Panel",
+                telefono="600000000",
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_dos_consultas_de_agregacion(self):
+        with self.assertNumQueries(2):
+            datos = indicadores.calcular_indicadores()
+
+        self.assertEqual(datos["pedidos_pendientes"], 1)
+        self.assertEqual(datos["pedidos_procesando"], 1)
+        self.assertEqual(datos["pedidos_enviados"], 1)
+        # El pendiente aún no está cobrado y el cancelado no suma.
+        self.assertEqual(datos["ingresos_hoy"], Decimal("60.00"))
+        self.assertEqual(datos["ticket_medio"], Decimal("30.00"))
+
+    def test_sirve_la_cache_y_refresca_en_segundo_plano(self):
+        self.client.get(reverse("admin_panel:dashboard"))
+        Pedido.objects.filter(numero_pedido="DASH2").update(estado=Pedido.Estados.ENTREGADO)
+
+        with mock.patch.object(indicadores, "_refrescar_en_segundo_plano") as refrescar:
+            respuesta = self.client.get(reverse("admin_panel:dashboard"))
+            refrescar.assert_not_called()
+            self.assertEqual(respuesta.context["pedidos_enviados"], 1)
+
+            with override_settings(PANEL_INDICADORES_TTL=-1):
+                respuesta = self.client.get(reverse("admin_panel:dashboard"))
+            refrescar.assert_called_once()
+            self.assertEqual(respuesta.context["pedidos_enviados"], 1)
+
+        indicadores._refrescar()
+        respuesta = self.client.get(reverse("admin_panel:dashboard"))
+        self.assertEqual(respuesta.context["pedidos_entregados"], 1)
+        self.assertContains(respuesta, "Pedidos procesando")
+
+    def test_un_solo_refresco_entre_workers(self):
+        # Otro worker ya está refrescando: la marca vive en la caché compartida.
+        cache.add(indicadores.CLAVE_REFRESCO, True, 60)
+        with mock.patch.object(indicadores.threading, "Thread") as hilo:
+            indicadores._refrescar_en_segundo_plano()
+            hilo.assert_not_called()
+
+            cache.delete(indicadores.CLAVE_REFRESCO)
+            indicadores._refrescar_en_segundo_plano()
+            indicadores._refrescar_en_segundo_plano()
+            hilo.assert_called_once()
+
+
+class CambioEstadoPanelTests(TestCase):
+    def test_accion_en_lote_desde_el_listado(self):
+        staff = User.objects.create_user(
+            username="staff", email="staff@example.com", password="clave-segura", is_staff=True
+        )
+        self.client.force_login(staff)
+        pedidos = [
+            Pedido.objects.create(
+                numero_pedido=f"ALM{indice}",
+                total=Decimal("10.00"),
+                estado=estado,
+                metodo_pago=Pedido.MetodosPago.TARJETA,
+                direccion_envio="Calle Panel",
+                telefono="600000000",
+            )
+            for indice, estado in enumerate([Pedido.Estados.PROCESANDO, Pedido.Estados.CANCELADO])
+        ]
+
+        respuesta = self.client.post(
+            reverse("admin_panel:pedidos_cambiar_estado"),
+            {"estado": Pedido.Estados.ENVIADO, "pedidos": [p.pk for p in pedidos], "volver": "/panel/pedidos/?estado="},
+            follow=True,
+        )
+
+        self.assertRedirects(respuesta, "/panel/pedidos/?estado=")
+        avisos = [str(m) for m in respuesta.context["messages"]]
+        self.assertIn("1 pedidos pasados a «Enviado».", avisos)
+        self.assertTrue(any("ALM1" in aviso for aviso in avisos))
+        self.assertEqual(
+            list(Pedido.objects.order_by("numero_pedido").values_list("estado", flat=True)),
+            [Pedido.Estados.ENVIADO, Pedido.Estados.CANCELADO],
+        )
+
+    def test_detalle_solo_admite_transiciones_permitidas(self):
+        staff = User.objects.create_user(username="detalle", password="clave-segura", is_staff=True)
+        self.client.force_login(staff)
+        marca = Marca.objects.create(nombre="Detalle")
+        categoria = Categoria.objects.create(nombre="Detalle")
+        producto = Producto.objects.create(
+            nombre="Modelo Detalle", precio=Decimal("10.00"), marca=marca, categoria=categoria, stock=5
+        )
+        pedido = Pedido.objects.create(
+            numero_pedido="DET1",
+            total=Decimal("10.00"),
+            metodo_pago=Pedido.MetodosPago.CONTRAREEMBOLSO,
+            direccion_envio="Calle Panel",
+            telefono="600000000",
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, producto=producto, cantidad=2, precio_unitario=Decimal("5.00"), total=Decimal("10.00")
+        )
+        Producto.objects.filter(pk=producto.pk).update(popularidad=2)
+        url = reverse("admin_panel:pedido_detalle", args=[pedido.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"estado": Pedido.Estados.CANCELADO})
+        producto.refresh_from_db()
+        self.assertAlmostEqual(producto.popularidad, 0, places=3)
+
+        respuesta = self.client.get(url)
+        self.assertEqual(
+            [valor for valor, _ in respuesta.context["form"].fields["estado"].choices],
+            [Pedido.Estados.CANCELADO],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(url, {"estado": Pedido.Estados.PENDIENTE})
+        self.assertFalse(respuesta.context["form"].is_valid())
+        pedido.refresh_from_db()
+        producto.refresh_from_db()
+        self.assertEqual(pedido.estado, Pedido.Estados.CANCELADO)
+        self.assertAlmostEqual(producto.popularidad, 0, places=3)
@@ -7,6 +7,8 @@ from .views import (
     productos_list,
     producto_form,
     pedido_list,
+    pedidos_exportar,
+    pedidos_cambiar_estado,
     pedido_detalle,
     catalogo_formularios,
 )
@@ -21,6 +23,8 @@ urlpatterns = [
     path("productos/nuevo/", producto_form, name="producto_crear"),
     path("productos/<int:pk>/", producto_form, name="producto_editar"),
     path("pedidos/", pedido_list, name="pedidos_list"),
+    path("pedidos/estado/", pedidos_cambiar_estado, name="pedidos_cambiar_estado"),
+    path("pedidos/exportar/", pedidos_exportar, name="pedidos_exportar"),
     path("pedidos/<int:pk>/", pedido_detalle, name="pedido_detalle"),
     path("catalogo/", catalogo_formularios, name="catalogo_formularios"),
 ]
@@ -1,13 +1,27 @@
+from datetime import datetime, timedelta
+
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.views import LoginView, LogoutView
 from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import ValidationError
 
+from pedidos.exportacion import exportar, iterar_async
 from pedidos.models import Pedido
+from pedidos.services import ResultadosTransicion, cambiar_estado_pedidos
 from productos.models import Producto
+from .indicadores import obtener_indicadores
 from .forms import (
     CategoriaForm,
     DepartamentoForm,
@@ -33,17 +47,7 @@ class PanelLoginView(LoginView):
 
 @staff_member_required(login_url="/panel/login/")
 def dashboard(request):
-    productos_total = Producto.objects.count()
-    pedidos_pendientes = Pedido.objects.filter(estado=Pedido.Estados.PENDIENTE).count()
-    pedidos_enviados = Pedido.objects.filter(estado=Pedido.Estados.ENVIADO).count()
-    pedidos_entregados = Pedido.objects.filter(estado=Pedido.Estados.ENTREGADO).count()
-    context = {
-        "productos_total": productos_total,
-        "pedidos_pendientes": pedidos_pendientes,
-        "pedidos_enviados": pedidos_enviados,
-        "pedidos_entregados": pedidos_entregados,
-    }
-    return render(request, "admin_panel/dashboard.html", context)
+    return render(request, "admin_panel/dashboard.html", obtener_indicadores())
 
 
 @staff_member_required(login_url="/panel/login/")
@@ -90,18 +94,146 @@ def producto_form(request, pk=None):
     )
 
 
+PEDIDOS_POR_PAGINA = 50
+
+
+def _leer_cursor(valor):
+    """El cursor es ``<fecha ISO>|<id>`` del último pedido de la página anterior."""
+    fecha, _, pk = (valor or "").partition("|")
+    fecha = parse_datetime(fecha)
+    if fecha is None or not pk.isdigit():
+        return None
+    return fecha, int(pk)
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+
 @staff_member_required(login_url="/panel/login/")
 def pedido_list(request):
-    estado = request.GET.get("estado")
-    pedidos = Pedido.objects.select_related("cliente").prefetch_related("items").order_by("-fecha_creacion")
+    estado = request.GET.get("estado", "")
+    metodo_pago = request.GET.get("metodo_pago", "")
+    desde = parse_date(request.GET.get("desde") or "")
+    hasta = parse_date(request.GET.get("hasta") or "")
+
+    pedidos = Pedido.objects.select_related("cliente").order_by("-fecha_creacion", "-id")
     if estado:
         pedidos = pedidos.filter(estado=estado)
-    estados = Pedido.Estados.choices
+    if metodo_pago:
+        pedidos = pedidos.filter(metodo_pago=metodo_pago)
+    # Rangos sobre la columna (no sobre __date) para que se use el índice.
+    if desde:
+        pedidos = pedidos.filter(fecha_creacion__gte=_inicio_del_dia(desde))
+    if hasta:
+        pedidos = pedidos.filter(fecha_creacion__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+
+    cursor = _leer_cursor(request.GET.get("despues"))
+    if cursor:
+        fecha, pk = cursor
+        pedidos = pedidos.filter(Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=pk))
+
+    pagina = list(
+        pedidos.annotate(
+            num_articulos=Coalesce(Sum("items__cantidad"), 0),
+            num_lineas=Count("items"),
+        )[: PEDIDOS_POR_PAGINA + 1]
+    )
+    siguiente = None
+    if len(pagina) > PEDIDOS_POR_PAGINA:
+        pagina = pagina[:PEDIDOS_POR_PAGINA]
+        ultimo = pagina[-1]
+        filtros = request.GET.copy()
+        filtros["despues"] = f"{ultimo.fecha_creacion.isoformat()}|{ultimo.pk}"
+        siguiente = filtros.urlencode()
+
+    filtros_sin_cursor = request.GET.copy()
+    filtros_sin_cursor.pop("despues", None)
     return render(
         request,
         "admin_panel/pedidos_list.html",
-        {"pedidos": pedidos, "estado": estado, "estados": estados},
+        {
+            "pedidos": pagina,
+            "estado": estado,
+            "estados": Pedido.Estados.choices,
+            "metodo_pago": metodo_pago,
+            "metodos_pago": Pedido.MetodosPago.choices,
+            "desde": desde,
+            "hasta": hasta,
+            "siguiente": siguiente,
+            "es_primera_pagina": cursor is None,
+            "estados_destino": [
+                (valor, texto) for valor, texto in Pedido.Estados.choices if valor != Pedido.Estados.PENDIENTE
+            ],
+            "primera_pagina": filtros_sin_cursor.urlencode(),
+        },
+    )
+
+
+@staff_member_required(login_url="/panel/login/")
+@require_POST
+def pedidos_cambiar_estado(request):
+    destino = request.POST.get("estado", "")
+    ids = [int(pk) for pk in request.POST.getlist("pedidos") if pk.isdigit()]
+    volver = request.POST.get("volver", "")
+    if not url_has_allowed_host_and_scheme(volver, allowed_hosts={request.get_host()}):
+        volver = reverse("admin_panel:pedidos_list")
+    if not ids:
+        messages.error(request, "Selecciona al menos un pedido.")
+        return redirect(volver)
+
+    try:
+        resultados = cambiar_estado_pedidos(ids, destino)
+    except ValidationError as exc:
+        messages.error(request, " ".join(str(detalle) for detalle in exc.detail))
+        return redirect(volver)
+
+    actualizados = [r for r in resultados if r["resultado"] == ResultadosTransicion.ACTUALIZADO]
+    rechazados = [r for r in resultados if r["resultado"] != ResultadosTransicion.ACTUALIZADO
+                  and r["resultado"] != ResultadosTransicion.SIN_CAMBIOS]
+    etiqueta = Pedido.Estados(destino).label
+    if actualizados:
+        messages.success(request, f"{len(actualizados)} pedidos pasados a «{etiqueta}».")
+    if rechazados:
+        numeros = ", ".join(r["numero_pedido"] or str(r["id"]) for r in rechazados[:20])
+        messages.warning(
+            request,
+            f"{len(rechazados)} pedidos no admiten el paso a «{etiqueta}» o cambiaron a la vez: {numeros}",
+        )
+    return redirect(volver)
+
+
+TIPOS_EXPORTACION = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+@staff_member_required(login_url="/panel/login/")
+def pedidos_exportar(request):
+    formato = request.GET.get("formato", "csv")
+    if formato not in TIPOS_EXPORTACION:
+        formato = "csv"
+    desde = parse_date(request.GET.get("desde") or "")
+    hasta = parse_date(request.GET.get("hasta") or "")
+    trozos = exportar(
+        formato,
+        desde=_inicio_del_dia(desde) if desde else None,
+        hasta=_inicio_del_dia(hasta + timedelta(days=1)) if hasta else None,
+        estado=request.GET.get("estado", ""),
+        metodo_pago=request.GET.get("metodo_pago", ""),
+    )
+    if isinstance(request, ASGIRequest):
+        # Con un iterador síncrono, Django en ASGI lo leería entero antes de enviar nada.
+        cuerpo = (bloque.encode("utf-8") async for bloque in iterar_async(trozos))
+    else:
+        cuerpo = (trozo.encode("utf-8") for trozo in trozos)
+    respuesta = StreamingHttpResponse(
+        cuerpo,
+        content_type=f"{TIPOS_EXPORTACION[formato]}; charset=utf-8",
     )
+    nombre = f"pedidos-{timezone.localdate():%Y%m%d}.{formato}"
+    respuesta["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    # Evita que un proxy acumule la respuesta completa antes de reenviarla.
+    respuesta["X-Accel-Buffering"] = "no"
+    return respuesta
 
 
 @staff_member_required(login_url="/panel/login/")
@@ -110,7 +242,13 @@ def pedido_detalle(request, pk):
     if request.method == "POST":
         form = PedidoEstadoForm(request.POST, instance=pedido)
         if form.is_valid():
-            form.save()
+            if "estado" in form.changed_data:
+                # Misma ruta que el cambio en lote: bloquea la fila y vuelve a comprobar la
+                # transición por si otro proceso cambió el pedido entretanto.
+                (resultado,) = cambiar_estado_pedidos([pedido.pk], form.cleaned_data["estado"])
+                if resultado["resultado"] != ResultadosTransicion.ACTUALIZADO:
+                    messages.error(request, "El pedido ha cambiado mientras tanto; revisa su estado.")
+                    return redirect("admin_panel:pedido_detalle", pk=pedido.pk)
             messages.success(request, "Estado del pedido actualizado.")
             return redirect("admin_panel:pedido_detalle", pk=pedido.pk)
         messages.error(request, "No se pudo actualizar el estado.")
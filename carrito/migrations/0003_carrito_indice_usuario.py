@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carrito', '0002_alter_carrito_usuario_alter_itemcarrito_cantidad_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(fields=['usuario', 'fecha_actualizacion'], name='carrito_usuario_fecha_idx'),
+        ),
+    ]
@@ -17,6 +17,12 @@ class Carrito(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Carrito más reciente de un usuario al completar la compra.
+            models.Index(fields=["usuario", "fecha_actualizacion"], name="carrito_usuario_fecha_idx"),
+        ]
+
     @property
     def obtener_total_carrito(self):
         return sum(item.obtener_subtotal for item in self.items.all())
@@ -1,6 +1,9 @@
+import json
 from decimal import Decimal
+from unittest import mock
 
 from django.contrib.messages import get_messages
+from django.db.models import QuerySet
 from django.test import TestCase
 from django.urls import reverse
 
@@ -96,3 +99,101 @@ class CarritoViewsTestCase(TestCase):
         self.assertEqual(item.cantidad, 5)
         mensajes = [m.message for m in get_messages(response.wsgi_request)]
         self.assertTrue(any("Cantidad ajustada a 5" in msg for msg in mensajes))
+
+
+class CarritoLoteTestCase(TestCase):
+    def setUp(self):
+        marca = Marca.objects.create(nombre="Marca Lote")
+        categoria = Categoria.objects.create(nombre="Lote")
+        self.producto = Producto.objects.create(
+            nombre="Basico",
+            precio="30.00",
+            marca=marca,
+            categoria=categoria,
+            stock=10,
+        )
+        self.producto_tallas = Producto.objects.create(
+            nombre="Con tallas",
+            precio="60.00",
+            precio_oferta="40.00",
+            marca=marca,
+            categoria=categoria,
+            stock=10,
+        )
+        self.talla = TallaProducto.objects.create(producto=self.producto_tallas, talla="41", stock=3)
+        self.url = reverse("actualizar-carrito-lote")
+
+    def _post(self, operaciones):
+        return self.client.post(
+            self.url,
+            data=json.dumps({"operaciones": operaciones}),
+            content_type="application/json",
+        )
+
+    def test_aplica_varias_lineas_y_devuelve_totales(self):
+        response = self._post(
+            [
+                {"producto_id": self.producto.id, "cantidad": 2},
+                {"producto_id": self.producto_tallas.id, "talla": "41", "cantidad": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["items"]), 2)
+        self.assertEqual(data["total_articulos"], 3)
+        self.assertEqual(data["total_carrito"], 100.0)
+
+        self.producto.refresh_from_db()
+        self.talla.refresh_from_db()
+        self.assertEqual(self.producto.stock, 8)
+        self.assertEqual(self.talla.stock, 2)
+
+    def test_actualiza_y_elimina_por_item_id(self):
+        self._post([{"producto_id": self.producto.id, "cantidad": 4}])
+        item = ItemCarrito.objects.get(producto=self.producto)
+
+        response = self._post(
+            [
+                {"item_id": item.id, "cantidad": 0},
+                {"producto_id": self.producto_tallas.id, "talla": "41", "cantidad": 5},
+            ]
+        )
+        data = response.json()
+        self.assertFalse(ItemCarrito.objects.filter(pk=item.pk).exists())
+        self.assertEqual(data["total_articulos"], 3)
+        self.assertIn("warnings", data)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 10)
+
+    def test_bloquea_stock_antes_que_las_lineas_como_el_checkout(self):
+        self._post([{"producto_id": self.producto.id, "cantidad": 1}])
+        item = ItemCarrito.objects.get(producto=self.producto)
+        bloqueos = []
+        original = QuerySet.select_for_update
+
+        def registrar(queryset, *args, **kwargs):
+            bloqueos.append(queryset.model)
+            return original(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", autospec=True, side_effect=registrar):
+            response = self._post(
+                [
+                    {"item_id": item.id, "cantidad": 2},
+                    {"producto_id": self.producto_tallas.id, "talla": "41", "cantidad": 1},
+                ]
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(bloqueos, [Producto, TallaProducto, ItemCarrito])
+
+    def test_operacion_invalida_no_aplica_nada(self):
+        response = self._post(
+            [
+                {"producto_id": self.producto.id, "cantidad": 2},
+                {"producto_id": self.producto_tallas.id, "cantidad": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ItemCarrito.objects.exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 10)
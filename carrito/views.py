@@ -1,9 +1,12 @@
+import json
+
 from django.contrib import messages
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 
-from productos.models import Producto
+from productos.models import Producto, TallaProducto
 from .models import ItemCarrito
 from .utils import obtener_o_crear_carrito
 
@@ -194,3 +197,176 @@ def actualizar_cantidad(request, item_id):
         return _responder_totales(carrito, payload)
 
     return redirect("carrito")
+
+
+class OperacionCarritoInvalida(Exception):
+    """Operación del lote que no puede aplicarse sobre el carrito."""
+
+
+def _leer_operaciones(request):
+    try:
+        payload = json.loads(request.body or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise OperacionCarritoInvalida("JSON inválido.") from exc
+
+    operaciones = payload.get("operaciones") if isinstance(payload, dict) else payload
+    if not isinstance(operaciones, list) or not operaciones:
+        raise OperacionCarritoInvalida("Indica una lista de 'operaciones'.")
+
+    normalizadas = []
+    for indice, op in enumerate(operaciones):
+        if not isinstance(op, dict):
+            raise OperacionCarritoInvalida(f"La operación {indice} no es un objeto.")
+        try:
+            cantidad = int(op.get("cantidad"))
+            item_id = int(op["item_id"]) if op.get("item_id") is not None else None
+            producto_id = int(op["producto_id"]) if op.get("producto_id") is not None else None
+        except (TypeError, ValueError) as exc:
+            raise OperacionCarritoInvalida(f"La operación {indice} tiene valores no numéricos.") from exc
+        if cantidad < 0:
+            raise OperacionCarritoInvalida(f"La operación {indice} tiene una cantidad negativa.")
+        if item_id is None and producto_id is None:
+            raise OperacionCarritoInvalida(f"La operación {indice} necesita 'item_id' o 'producto_id'.")
+        talla = (str(op.get("talla") or "")).strip() or None
+        normalizadas.append({"item_id": item_id, "producto_id": producto_id, "talla": talla, "cantidad": cantidad})
+    return normalizadas
+
+
+def _aplicar_operaciones(carrito, operaciones):
+    """
+    Aplica las operaciones con un único bloqueo ordenado sobre las filas de stock
+    afectadas. Devuelve la lista de avisos generados por ajustes de stock.
+    """
+    # Mismo orden de bloqueo que el checkout: productos, tallas y después las líneas del
+    # carrito, cada tabla por clave primaria. Así un lote y la compra del mismo carrito no
+    # pueden bloquearse mutuamente. Los productos de las líneas se leen antes sin bloqueo.
+    producto_por_item = dict(carrito.items.values_list("pk", "producto_id"))
+    for op in operaciones:
+        if op["item_id"] is not None:
+            if op["item_id"] not in producto_por_item:
+                raise OperacionCarritoInvalida(f"El item {op['item_id']} no pertenece a tu carrito.")
+            op["producto_id"] = producto_por_item[op["item_id"]]
+
+    producto_ids = sorted({op["producto_id"] for op in operaciones})
+    productos = {
+        producto.id: producto
+        for producto in Producto.objects.select_for_update().filter(pk__in=producto_ids).order_by("pk")
+    }
+    tallas = {
+        (talla.producto_id, talla.talla): talla
+        for talla in TallaProducto.objects.select_for_update().filter(producto_id__in=producto_ids).order_by("pk")
+    }
+    productos_con_tallas = {producto_id for producto_id, _ in tallas}
+
+    items = {item.id: item for item in carrito.items.select_for_update().order_by("pk")}
+    items_por_clave = {(item.producto_id, item.talla): item for item in items.values()}
+    for op in operaciones:
+        if op["item_id"] is not None:
+            # La línea pudo borrarse (p. ej. por un checkout) entre la lectura y el bloqueo.
+            item = items.get(op["item_id"])
+            if not item:
+                raise OperacionCarritoInvalida(f"El item {op['item_id']} no pertenece a tu carrito.")
+            op["producto_id"], op["talla"] = item.producto_id, item.talla
+
+    avisos = []
+    productos_tocados, tallas_tocadas = set(), set()
+    nuevos, modificados, eliminados = {}, {}, {}
+
+    for op in operaciones:
+        producto = productos.get(op["producto_id"])
+        if not producto:
+            raise OperacionCarritoInvalida(f"Producto {op['producto_id']} no disponible.")
+        talla = op["talla"]
+        if not talla and producto.id in productos_con_tallas:
+            raise OperacionCarritoInvalida(f"Selecciona una talla para {producto.nombre}.")
+
+        clave = (producto.id, talla)
+        item = items_por_clave.get(clave)
+        cantidad_actual = item.cantidad if item else 0
+        nueva_cantidad = op["cantidad"]
+        talla_obj = tallas.get(clave) if talla else None
+        disponible = talla_obj.stock if talla_obj else producto.stock
+
+        delta = nueva_cantidad - cantidad_actual
+        if delta > disponible:
+            delta = max(disponible, 0)
+            nueva_cantidad = cantidad_actual + delta
+            avisos.append(f"Cantidad de {producto.nombre} ajustada a {nueva_cantidad} por disponibilidad de stock.")
+
+        if delta:
+            # Misma semántica que _ajustar_stock: la talla manda si existe, si no el stock general.
+            if talla_obj:
+                talla_obj.stock = max(talla_obj.stock - delta, 0)
+                tallas_tocadas.add(clave)
+            elif not talla:
+                producto.stock = max(producto.stock - delta, 0)
+                producto.esta_disponible = producto.stock > 0
+                productos_tocados.add(producto.id)
+
+        if nueva_cantidad <= 0:
+            if item:
+                items_por_clave.pop(clave)
+                if item.pk:
+                    eliminados[item.pk] = item
+                    modificados.pop(item.pk, None)
+                else:
+                    nuevos.pop(clave, None)
+            continue
+
+        if item:
+            item.cantidad = nueva_cantidad
+            if item.pk:
+                modificados[item.pk] = item
+        else:
+            item = ItemCarrito(carrito=carrito, producto=producto, talla=talla, cantidad=nueva_cantidad)
+            items_por_clave[clave] = item
+            nuevos[clave] = item
+
+    if eliminados:
+        ItemCarrito.objects.filter(pk__in=list(eliminados)).delete()
+    if modificados:
+        ItemCarrito.objects.bulk_update(list(modificados.values()), ["cantidad"])
+    if nuevos:
+        ItemCarrito.objects.bulk_create(list(nuevos.values()))
+    if productos_tocados:
+        Producto.objects.bulk_update(
+            [productos[pk] for pk in sorted(productos_tocados)], ["stock", "esta_disponible"]
+        )
+    if tallas_tocadas:
+        TallaProducto.objects.bulk_update([tallas[clave] for clave in sorted(tallas_tocadas)], ["stock"])
+    return avisos
+
+
+@require_POST
+def actualizar_carrito_lote(request):
+    """
+    Aplica varias líneas de una vez. Recibe JSON con
+    ``{"operaciones": [{"item_id"|"producto_id", "talla", "cantidad"}, ...]}``,
+    donde ``cantidad`` es la cantidad final de la línea (0 la elimina).
+    """
+    carrito = obtener_o_crear_carrito(request)
+    try:
+        operaciones = _leer_operaciones(request)
+        with transaction.atomic():
+            avisos = _aplicar_operaciones(carrito, operaciones)
+    except OperacionCarritoInvalida as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    items = list(carrito.items.select_related("producto").order_by("fecha_anadido", "pk"))
+    data = {
+        "items": [
+            {
+                "item_id": item.id,
+                "producto_id": item.producto_id,
+                "talla": item.talla,
+                "cantidad": item.cantidad,
+                "item_subtotal": float(item.obtener_subtotal),
+            }
+            for item in items
+        ],
+        "total_articulos": sum(item.cantidad for item in items),
+        "total_carrito": float(sum((item.obtener_subtotal for item in items), 0)),
+    }
+    if avisos:
+        data["warnings"] = avisos
+    return JsonResponse(data)
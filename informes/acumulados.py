@@ -0,0 +1,202 @@
+"""
+Acumulados diarios de ventas por producto, marca y categoría.
+
+Un pedido se suma cuando llega a un estado contable (pagado o en curso) y se resta si
+después se cancela. ``PedidoContabilizado`` registra qué pedidos están sumados, así que
+repetir la operación, ya sea desde la señal o desde el relleno histórico, no duplica
+importes. También guarda el desglose exacto que se sumó (día, producto, marca, categoría,
+unidades e importe) y la resta descuenta ese desglose: si el producto cambia de marca o
+de categoría entre medias, la venta sale de las filas donde entró.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from informes.models import (
+    PedidoContabilizado,
+    VentaDiariaCategoria,
+    VentaDiariaMarca,
+    VentaDiariaProducto,
+)
+from pedidos.models import ItemPedido, Pedido
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_CONTABLES = (
+    Pedido.Estados.PROCESANDO,
+    Pedido.Estados.ENVIADO,
+    Pedido.Estados.ENTREGADO,
+)
+
+# Tabla de acumulados, campo de la dimensión y ruta desde ItemPedido.
+DIMENSIONES = (
+    (VentaDiariaProducto, "producto_id", "producto_id"),
+    (VentaDiariaMarca, "marca_id", "producto__marca_id"),
+    (VentaDiariaCategoria, "categoria_id", "producto__categoria_id"),
+)
+
+INTENTOS_MAXIMOS = 3
+
+Deltas = Dict[Tuple[date, int], List]
+
+
+def _desglose(pedido_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Líneas de cada pedido agrupadas por día y dimensiones, en una sola consulta."""
+    filas = (
+        ItemPedido.objects.filter(pedido_id__in=pedido_ids)
+        .annotate(fecha=TruncDate("pedido__fecha_creacion"))
+        .values("pedido_id", "fecha", *(ruta for _, _, ruta in DIMENSIONES))
+        .annotate(unidades=Sum("cantidad"), importe=Sum("total"))
+        .order_by()
+    )
+    desglose: Dict[int, List[Dict]] = defaultdict(list)
+    for fila in filas:
+        desglose[fila["pedido_id"]].append(
+            {
+                "fecha": fila["fecha"].isoformat(),
+                **{campo: fila[ruta] for _, campo, ruta in DIMENSIONES},
+                "unidades": fila["unidades"] or 0,
+                "importe": str(fila["importe"] or Decimal("0")),
+            }
+        )
+    return desglose
+
+
+def _calcular_deltas(desgloses: Iterable[List[Dict]]) -> Dict[str, Deltas]:
+    deltas: Dict[str, Deltas] = {campo: defaultdict(lambda: [0, Decimal("0")]) for _, campo, _ in DIMENSIONES}
+    for desglose in desgloses:
+        for fila in desglose:
+            fecha = date.fromisoformat(fila["fecha"])
+            for _, campo, _ in DIMENSIONES:
+                acumulado = deltas[campo][(fecha, fila[campo])]
+                acumulado[0] += fila["unidades"]
+                acumulado[1] += Decimal(fila["importe"])
+    return deltas
+
+
+def _aplicar(modelo, campo: str, deltas: Deltas, signo: int) -> None:
+    if not deltas:
+        return
+    fechas = {fecha for fecha, _ in deltas}
+    claves = {clave for _, clave in deltas}
+    existentes = {
+        (fila.fecha, getattr(fila, campo)): fila
+        for fila in modelo.objects.select_for_update().filter(
+            fecha__in=fechas, **{f"{campo}__in": claves}
+        )
+    }
+    actualizar, crear = [], []
+    for (fecha, clave), (unidades, importe) in deltas.items():
+        fila = existentes.get((fecha, clave))
+        if fila is None:
+            if signo < 0:
+                # La resta usa el desglose que se sumó, así que su fila debería existir.
+                logger.warning("Sin acumulado de %s=%s el %s para restar", campo, clave, fecha)
+            else:
+                crear.append(modelo(fecha=fecha, unidades=unidades, importe=importe, **{campo: clave}))
+            continue
+        fila.unidades += signo * unidades
+        fila.importe += signo * importe
+        if fila.unidades < 0:
+            logger.warning("Acumulado de %s=%s el %s descuadrado: %s unidades", campo, clave, fecha, fila.unidades)
+            fila.unidades = 0
+        actualizar.append(fila)
+    modelo.objects.bulk_update(actualizar, ["unidades", "importe"])
+    modelo.objects.bulk_create(crear)
+
+
+def _aplicar_todas(desgloses: Iterable[List[Dict]], signo: int) -> None:
+    deltas = _calcular_deltas(desgloses)
+    for modelo, campo, _ in DIMENSIONES:
+        _aplicar(modelo, campo, deltas[campo], signo)
+
+
+def _con_reintentos(funcion, pedido_ids: Iterable[int]) -> int:
+    pedido_ids = list(pedido_ids)
+    for intento in range(1, INTENTOS_MAXIMOS + 1):
+        try:
+            with transaction.atomic():
+                return funcion(pedido_ids)
+        except IntegrityError:
+            # Otro proceso registró el mismo pedido o creó la misma fila a la vez: al
+            # repetir, el libro ya lo refleja y la fila existe.
+            if intento == INTENTOS_MAXIMOS:
+                raise
+            logger.info("Conflicto al actualizar acumulados; reintento %s", intento)
+    return 0
+
+
+def _contabilizar(pedido_ids: List[int]) -> int:
+    libro = PedidoContabilizado.objects.select_for_update().filter(pedido_id__in=pedido_ids)
+    ya_registrados = set(libro.values_list("pedido_id", flat=True))
+    pedidos = Pedido.objects.filter(pk__in=pedido_ids, estado__in=ESTADOS_CONTABLES)
+    nuevos = list(pedidos.exclude(pk__in=ya_registrados).values_list("pk", "fecha_creacion"))
+    reactivados = list(libro.filter(anulado=True, pedido__estado__in=ESTADOS_CONTABLES))
+    if not nuevos and not reactivados:
+        return 0
+
+    sumar = [pk for pk, _ in nuevos] + [registro.pedido_id for registro in reactivados]
+    desglose = _desglose(sumar)
+    PedidoContabilizado.objects.bulk_create(
+        PedidoContabilizado(pedido_id=pk, fecha=timezone.localdate(fecha), desglose=desglose.get(pk, []))
+        for pk, fecha in nuevos
+    )
+    for registro in reactivados:
+        registro.anulado = False
+        registro.desglose = desglose.get(registro.pedido_id, [])
+    PedidoContabilizado.objects.bulk_update(reactivados, ["anulado", "desglose"])
+    _aplicar_todas(desglose.values(), +1)
+    return len(sumar)
+
+
+def _anular(pedido_ids: List[int]) -> int:
+    anulables = dict(
+        PedidoContabilizado.objects.select_for_update()
+        .filter(pedido_id__in=pedido_ids, anulado=False)
+        .filter(~Q(pedido__estado__in=ESTADOS_CONTABLES))
+        .values_list("pedido_id", "desglose")
+    )
+    if not anulables:
+        return 0
+    PedidoContabilizado.objects.filter(pedido_id__in=list(anulables)).update(anulado=True)
+    # Se resta exactamente lo que se sumó, aunque el producto haya cambiado de marca o categoría.
+    _aplicar_todas(anulables.values(), -1)
+    return len(anulables)
+
+
+def contabilizar_pedidos(pedido_ids: Iterable[int]) -> int:
+    """Suma a los acumulados los pedidos en estado contable que aún no lo estén."""
+    return _con_reintentos(_contabilizar, pedido_ids)
+
+
+def anular_pedidos(pedido_ids: Iterable[int]) -> int:
+    """Resta de los acumulados los pedidos sumados que ya no están en estado contable."""
+    return _con_reintentos(_anular, pedido_ids)
+
+
+def rellenar(lote: int = 500, desde=None) -> int:
+    """
+    Suma los pedidos contables que falten, recorriendo el histórico por clave primaria en
+    tandas de ``lote`` para acotar memoria y duración de cada transacción.
+    """
+    pedidos = Pedido.objects.filter(estado__in=ESTADOS_CONTABLES).order_by("pk")
+    if desde is not None:
+        pedidos = pedidos.filter(fecha_creacion__gte=desde)
+    total = 0
+    ultimo_pk = 0
+    while True:
+        ids = list(pedidos.filter(pk__gt=ultimo_pk).values_list("pk", flat=True)[:lote])
+        if not ids:
+            return total
+        ultimo_pk = ids[-1]
+        total += contabilizar_pedidos(ids)
@@ -0,0 +1,27 @@
+from django.contrib import admin
+
+from .models import PedidoContabilizado, VentaDiariaCategoria, VentaDiariaMarca, VentaDiariaProducto
+
+
+@admin.register(PedidoContabilizado)
+class PedidoContabilizadoAdmin(admin.ModelAdmin):
+    list_display = ("pedido", "fecha", "anulado", "fecha_registro")
+    list_filter = ("anulado", "fecha")
+
+
+@admin.register(VentaDiariaProducto)
+class VentaDiariaProductoAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "producto", "unidades", "importe")
+    list_filter = ("fecha",)
+
+
+@admin.register(VentaDiariaMarca)
+class VentaDiariaMarcaAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "marca", "unidades", "importe")
+    list_filter = ("fecha",)
+
+
+@admin.register(VentaDiariaCategoria)
+class VentaDiariaCategoriaAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "categoria", "unidades", "importe")
+    list_filter = ("fecha",)
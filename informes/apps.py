@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class InformesConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "informes"
+
+    def ready(self):
+        from informes import receptores  # noqa: F401
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from informes.acumulados import rellenar
+from informes.models import (
+    PedidoContabilizado,
+    VentaDiariaCategoria,
+    VentaDiariaMarca,
+    VentaDiariaProducto,
+)
+
+
+class Command(BaseCommand):
+    help = "Suma a los acumulados de ventas los pedidos históricos, por tandas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Pedidos por tanda.")
+        parser.add_argument("--desde", help="Solo pedidos creados desde esta fecha (AAAA-MM-DD).")
+        parser.add_argument(
+            "--reiniciar",
+            action="store_true",
+            help="Vacía los acumulados y el libro antes de recalcular todo.",
+        )
+
+    def handle(self, *args, **options):
+        if options["reiniciar"]:
+            with transaction.atomic():
+                for modelo in (VentaDiariaProducto, VentaDiariaMarca, VentaDiariaCategoria, PedidoContabilizado):
+                    modelo.objects.all().delete()
+        desde = None
+        if options["desde"]:
+            dia = parse_date(options["desde"])
+            if dia is None:
+                raise CommandError("--desde debe tener el formato AAAA-MM-DD.")
+            desde = timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+        total = rellenar(lote=options["lote"], desde=desde)
+        self.stdout.write(f"Pedidos sumados a los acumulados: {total}")
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pedidos', '0012_pedido_indices_listado'),
+        ('productos', '0006_alter_producto_nombre_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoContabilizado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('anulado', models.BooleanField(default=False)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('pedido', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pedidos.pedido')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productos.categoria')),
+            ],
+            options={
+                'ordering': ('-fecha',),
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'categoria'), name='venta_diaria_categoria_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaMarca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('marca', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productos.marca')),
+            ],
+            options={
+                'ordering': ('-fecha',),
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'marca'), name='venta_diaria_marca_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productos.producto')),
+            ],
+            options={
+                'ordering': ('-fecha',),
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto'), name='venta_diaria_producto_unica')],
+            },
+        ),
+    ]
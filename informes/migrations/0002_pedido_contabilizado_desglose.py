@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:21
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def rellenar_desglose(apps, schema_editor):
+    # Los pedidos ya contabilizados no guardaron qué se sumó: se toma el estado actual de
+    # sus líneas y productos, que es lo mejor que hay.
+    PedidoContabilizado = apps.get_model("informes", "PedidoContabilizado")
+    ItemPedido = apps.get_model("pedidos", "ItemPedido")
+    pendientes = PedidoContabilizado.objects.order_by("pk")
+    ultimo_pk = 0
+    while True:
+        registros = list(pendientes.filter(pk__gt=ultimo_pk)[:500])
+        if not registros:
+            return
+        ultimo_pk = registros[-1].pk
+        desglose = defaultdict(list)
+        filas = (
+            ItemPedido.objects.filter(pedido_id__in=[registro.pedido_id for registro in registros])
+            .annotate(fecha=TruncDate("pedido__fecha_creacion"))
+            .values("pedido_id", "fecha", "producto_id", "producto__marca_id", "producto__categoria_id")
+            .annotate(unidades=Sum("cantidad"), importe=Sum("total"))
+            .order_by()
+        )
+        for fila in filas:
+            desglose[fila["pedido_id"]].append(
+                {
+                    "fecha": fila["fecha"].isoformat(),
+                    "producto_id": fila["producto_id"],
+                    "marca_id": fila["producto__marca_id"],
+                    "categoria_id": fila["producto__categoria_id"],
+                    "unidades": fila["unidades"] or 0,
+                    "importe": str(fila["importe"] or Decimal("0")),
+                }
+            )
+        for registro in registros:
+            registro.desglose = desglose.get(registro.pedido_id, [])
+        PedidoContabilizado.objects.bulk_update(registros, ["desglose"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('informes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidocontabilizado',
+            name='desglose',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(rellenar_desglose, migrations.RunPython.noop),
+    ]
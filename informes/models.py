@@ -0,0 +1,59 @@
+from django.db import models
+
+from pedidos.models import Pedido
+from productos.models import Categoria, Marca, Producto
+
+
+class PedidoContabilizado(models.Model):
+    """
+    Libro de pedidos ya sumados a los acumulados. La restricción única sobre ``pedido``
+    impide contarlo dos veces aunque la señal y el relleno histórico coincidan.
+    """
+
+    pedido = models.OneToOneField(Pedido, on_delete=models.CASCADE, related_name="+")
+    fecha = models.DateField()
+    anulado = models.BooleanField(default=False)
+    # Lo que se sumó a los acumulados, por día, producto, marca y categoría; es lo que se
+    # resta al anular.
+    desglose = models.JSONField(default=list, blank=True)
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id} ({self.fecha})"
+
+
+class VentaDiaria(models.Model):
+    fecha = models.DateField()
+    unidades = models.PositiveIntegerField(default=0)
+    importe = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ("-fecha",)
+
+
+class VentaDiariaProducto(VentaDiaria):
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="+")
+
+    class Meta(VentaDiaria.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "producto"], name="venta_diaria_producto_unica"),
+        ]
+
+
+class VentaDiariaMarca(VentaDiaria):
+    marca = models.ForeignKey(Marca, on_delete=models.CASCADE, related_name="+")
+
+    class Meta(VentaDiaria.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "marca"], name="venta_diaria_marca_unica"),
+        ]
+
+
+class VentaDiariaCategoria(VentaDiaria):
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name="+")
+
+    class Meta(VentaDiaria.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "categoria"], name="venta_diaria_categoria_unica"),
+        ]
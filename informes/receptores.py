@@ -0,0 +1,12 @@
+from django.dispatch import receiver
+
+from informes.acumulados import ESTADOS_CONTABLES, anular_pedidos, contabilizar_pedidos
+from pedidos.signals import estado_pedidos_cambiado
+
+
+@receiver(estado_pedidos_cambiado, dispatch_uid="informes.actualizar_acumulados")
+def actualizar_acumulados(sender, pedido_ids, estado, **kwargs):
+    if estado in ESTADOS_CONTABLES:
+        contabilizar_pedidos(pedido_ids)
+    else:
+        anular_pedidos(pedido_ids)
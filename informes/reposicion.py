@@ -0,0 +1,158 @@
+"""
+Previsión de reposición por referencia (producto y talla).
+
+En una sola pasada se cargan las existencias de todo el catálogo y las ventas diarias de
+las últimas ``INFORMES_REPOSICION_VENTANA_DIAS`` (agrupadas en la base de datos), se
+colocan en una matriz referencias x días y con NumPy se calcula para cada referencia la
+demanda diaria media y su desviación, los días hasta agotar el stock y el punto de pedido:
+
+    punto_pedido = demanda * plazo + Z * desviacion * sqrt(plazo)
+
+Una referencia es una talla (``TallaProducto``) o el stock general del producto, igual
+que al descontar stock en el checkout: una línea con una talla que existe descuenta de
+esa talla y cualquier otra descuenta del stock general.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from pedidos.models import ItemPedido, Pedido
+from productos.models import Producto, TallaProducto
+
+# Nivel de servicio del 95 %: factor de la distribución normal para el stock de seguridad.
+Z_NIVEL_SERVICIO = 1.65
+
+
+@dataclass(frozen=True)
+class PrevisionReferencia:
+    producto_id: int
+    producto: str
+    talla: str
+    stock: int
+    demanda_diaria: float
+    dias_hasta_rotura: Optional[float]
+    punto_pedido: int
+    cantidad_sugerida: int
+
+
+def _referencias() -> Tuple[List[Tuple[int, str, str, int]], Dict[Tuple[int, str], int]]:
+    """(producto_id, nombre, talla, stock) de cada referencia y su índice por clave."""
+    referencias = [
+        (producto_id, nombre, "", stock)
+        for producto_id, nombre, stock in Producto.objects.order_by("pk").values_list("pk", "nombre", "stock")
+    ]
+    referencias.extend(
+        TallaProducto.objects.order_by("producto_id", "talla").values_list(
+            "producto_id", "producto__nombre", "talla", "stock"
+        )
+    )
+    indices = {(producto_id, talla.strip()): i for i, (producto_id, _, talla, _) in enumerate(referencias)}
+    return referencias, indices
+
+
+def _demanda_diaria(indices: Dict[Tuple[int, str], int], desde: date, dias: int) -> np.ndarray:
+    """Matriz referencias x días con las unidades vendidas (pedidos no cancelados)."""
+    demanda = np.zeros((len(indices), dias))
+    filas = (
+        ItemPedido.objects.exclude(pedido__estado=Pedido.Estados.CANCELADO)
+        .filter(pedido__fecha_creacion__date__gte=desde)
+        .annotate(dia=TruncDate("pedido__fecha_creacion"))
+        .values("producto_id", "talla", "dia")
+        .annotate(unidades=Sum("cantidad"))
+        .order_by()
+    )
+    posiciones, columnas, unidades = [], [], []
+    for fila in filas:
+        talla = (fila["talla"] or "").strip()
+        indice = indices.get((fila["producto_id"], talla))
+        if indice is None:
+            indice = indices.get((fila["producto_id"], ""))
+        columna = (fila["dia"] - desde).days
+        if indice is None or not 0 <= columna < dias:
+            continue
+        posiciones.append(indice)
+        columnas.append(columna)
+        unidades.append(fila["unidades"])
+    np.add.at(demanda, (np.array(posiciones, dtype=np.int64), np.array(columnas, dtype=np.int64)), unidades)
+    return demanda
+
+
+def prever_reposicion(todas: bool = False) -> List[PrevisionReferencia]:
+    """
+    Previsión de todas las referencias con ventas en la ventana (``todas``) o solo de las
+    que ya están en su punto de pedido, de la que antes se agota a la que más tarda.
+    """
+    ventana = settings.INFORMES_REPOSICION_VENTANA_DIAS
+    plazo = settings.INFORMES_REPOSICION_PLAZO_DIAS
+    cobertura = settings.INFORMES_REPOSICION_COBERTURA_DIAS
+    hoy = timezone.localdate()
+    # La ventana termina ayer: el día en curso aún no está completo.
+    desde = hoy - timedelta(days=ventana)
+
+    referencias, indices = _referencias()
+    if not referencias:
+        return []
+    demanda = _demanda_diaria(indices, desde, ventana)
+    stock = np.array([stock for _, _, _, stock in referencias], dtype=np.float64)
+
+    media = demanda.mean(axis=1)
+    desviacion = demanda.std(axis=1)
+    seguridad = Z_NIVEL_SERVICIO * desviacion * math.sqrt(plazo)
+    punto_pedido = np.ceil(media * plazo + seguridad)
+    with np.errstate(divide="ignore"):
+        dias_hasta_rotura = np.where(media > 0, stock / media, np.inf)
+    sugerida = np.maximum(np.ceil(media * (plazo + cobertura) + seguridad - stock), 0)
+
+    con_ventas = media > 0
+    seleccion = con_ventas if todas else con_ventas & (stock <= punto_pedido)
+    orden = np.flatnonzero(seleccion)
+    orden = orden[np.argsort(dias_hasta_rotura[orden], kind="stable")]
+    return [
+        PrevisionReferencia(
+            producto_id=referencias[i][0],
+            producto=referencias[i][1],
+            talla=referencias[i][2],
+            stock=int(stock[i]),
+            demanda_diaria=round(float(media[i]), 2),
+            dias_hasta_rotura=round(float(dias_hasta_rotura[i]), 1),
+            punto_pedido=int(punto_pedido[i]),
+            cantidad_sugerida=int(sugerida[i]),
+        )
+        for i in orden
+    ]
+
+
+def enviar_aviso_reposicion() -> int:
+    """Envía el resumen diario de referencias a reponer; devuelve cuántas incluye."""
+    destinatarios = settings.INFORMES_REPOSICION_DESTINATARIOS
+    if not destinatarios:
+        return 0
+    previsiones = prever_reposicion()
+    if not previsiones:
+        return 0
+    contexto = {
+        "previsiones": previsiones,
+        "plazo": settings.INFORMES_REPOSICION_PLAZO_DIAS,
+        "fecha": timezone.localdate(),
+    }
+    mensaje = EmailMultiAlternatives(
+        f"Reposición: {len(previsiones)} referencias en punto de pedido",
+        render_to_string("informes/emails/aviso_reposicion.txt", contexto),
+        getattr(settings, "DEFAULT_FROM_EMAIL", None) or None,
+        destinatarios,
+    )
+    mensaje.attach_alternative(render_to_string("informes/emails/aviso_reposicion.html", contexto), "text/html")
+    mensaje.send()
+    return len(previsiones)
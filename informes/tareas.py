@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from informes.acumulados import rellenar
+from informes.reposicion import enviar_aviso_reposicion
+from tareas.cola import tarea
+
+
+@tarea("informes.rellenar_recientes", cada=3600)
+def rellenar_recientes():
+    # Recupera los pedidos cuya señal falló; el histórico completo lo cubre rellenar_informes.
+    rellenar(desde=timezone.now() - timedelta(days=2))
+
+
+@tarea("informes.aviso_reposicion", cada=86400)
+def aviso_reposicion():
+    enviar_aviso_reposicion()
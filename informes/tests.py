@@ -0,0 +1,195 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from informes import acumulados
+from informes.reposicion import enviar_aviso_reposicion, prever_reposicion
+from informes.models import PedidoContabilizado, VentaDiariaCategoria, VentaDiariaMarca, VentaDiariaProducto
+from pedidos.models import ItemPedido, Pedido
+from pedidos.services import notificar_cambio_estado
+from productos.models import Categoria, Marca, Producto, TallaProducto
+
+User = get_user_model()
+
+
+class AcumuladosVentasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.marca = Marca.objects.create(nombre="Informe")
+        cls.categoria = Categoria.objects.create(nombre="Informe")
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f"Modelo Informe {indice}",
+                precio=Decimal("25.00"),
+                marca=cls.marca,
+                categoria=cls.categoria,
+                stock=50,
+            )
+            for indice in range(2)
+        ]
+
+    def _pedido(self, numero, estado=Pedido.Estados.PENDIENTE):
+        pedido = Pedido.objects.create(
+            numero_pedido=numero,
+            total=Decimal("75.00"),
+            estado=estado,
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Informe",
+            telefono="600000000",
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, producto=self.productos[0], cantidad=2,
+            precio_unitario=Decimal("25.00"), total=Decimal("50.00"),
+        )
+        ItemPedido.objects.create(
+            pedido=pedido, producto=self.productos[1], cantidad=1,
+            precio_unitario=Decimal("25.00"), total=Decimal("25.00"),
+        )
+        return pedido
+
+    def _cambiar_estado(self, pedidos, estado):
+        Pedido.objects.filter(pk__in=[p.pk for p in pedidos]).update(estado=estado)
+        with self.captureOnCommitCallbacks(execute=True):
+            notificar_cambio_estado(pedidos, estado)
+
+    def test_la_senal_suma_al_confirmar_la_transaccion_sin_duplicar(self):
+        pedido = self._pedido("INF1")
+
+        self._cambiar_estado([pedido], Pedido.Estados.ENVIADO)
+        self._cambiar_estado([pedido], Pedido.Estados.ENTREGADO)
+
+        marca = VentaDiariaMarca.objects.get(marca=self.marca)
+        self.assertEqual((marca.unidades, marca.importe), (3, Decimal("75.00")))
+        producto = VentaDiariaProducto.objects.get(producto=self.productos[0])
+        self.assertEqual((producto.unidades, producto.importe), (2, Decimal("50.00")))
+        self.assertEqual(marca.fecha, timezone.localdate())
+
+    def test_cancelar_resta_y_reactivar_vuelve_a_sumar(self):
+        pedidos = [self._pedido("INF2"), self._pedido("INF3")]
+        self._cambiar_estado(pedidos, Pedido.Estados.ENVIADO)
+
+        self._cambiar_estado(pedidos[:1], Pedido.Estados.CANCELADO)
+        categoria = VentaDiariaCategoria.objects.get(categoria=self.categoria)
+        self.assertEqual((categoria.unidades, categoria.importe), (3, Decimal("75.00")))
+        self.assertTrue(PedidoContabilizado.objects.get(pedido=pedidos[0]).anulado)
+
+        self._cambiar_estado(pedidos[:1], Pedido.Estados.ENVIADO)
+        categoria.refresh_from_db()
+        self.assertEqual((categoria.unidades, categoria.importe), (6, Decimal("150.00")))
+
+    def test_cancelar_resta_de_la_marca_contabilizada_aunque_el_producto_cambie(self):
+        pedido = self._pedido("INF-M")
+        self._cambiar_estado([pedido], Pedido.Estados.ENVIADO)
+        otra_marca = Marca.objects.create(nombre="Otra marca")
+        Producto.objects.filter(pk=self.productos[0].pk).update(marca=otra_marca)
+
+        self._cambiar_estado([pedido], Pedido.Estados.CANCELADO)
+
+        marca = VentaDiariaMarca.objects.get(marca=self.marca)
+        self.assertEqual((marca.unidades, marca.importe), (0, Decimal("0.00")))
+        self.assertFalse(VentaDiariaMarca.objects.filter(marca=otra_marca).exists())
+
+    def test_relleno_historico_por_tandas_e_idempotente(self):
+        for indice in range(5):
+            self._pedido(f"INF-H{indice}", Pedido.Estados.ENTREGADO)
+        self._pedido("INF-P", Pedido.Estados.PENDIENTE)
+
+        call_command("rellenar_informes", "--lote", "2", stdout=StringIO())
+        self.assertEqual(acumulados.rellenar(lote=2), 0)
+
+        marca = VentaDiariaMarca.objects.get(marca=self.marca)
+        self.assertEqual((marca.unidades, marca.importe), (15, Decimal("375.00")))
+        self.assertEqual(PedidoContabilizado.objects.count(), 5)
+
+    def test_vista_lee_los_acumulados(self):
+        self._cambiar_estado([self._pedido("INF4")], Pedido.Estados.PROCESANDO)
+        staff = User.objects.create_user(
+            username="staff", email="staff@example.com", password="clave-segura", is_staff=True
+        )
+        self.client.force_login(staff)
+
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse("informes:ventas"), {"agrupacion": "producto"})
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [(fila["nombre"], fila["unidades"]) for fila in respuesta.context["filas"]],
+            [("Modelo Informe 0", 2), ("Modelo Informe 1", 1)],
+        )
+        self.assertEqual(respuesta.context["total_importe"], Decimal("75.00"))
+
+
+@override_settings(
+    INFORMES_REPOSICION_VENTANA_DIAS=10,
+    INFORMES_REPOSICION_PLAZO_DIAS=5,
+    INFORMES_REPOSICION_COBERTURA_DIAS=10,
+    INFORMES_REPOSICION_DESTINATARIOS=["compras@example.com"],
+)
+class ReposicionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        marca = Marca.objects.create(nombre="Reposición")
+        categoria = Categoria.objects.create(nombre="Reposición")
+        cls.producto = Producto.objects.create(
+            nombre="Modelo Reposición", precio=Decimal("25.00"), marca=marca, categoria=categoria, stock=100
+        )
+        cls.talla_42 = TallaProducto.objects.create(producto=cls.producto, talla="42", stock=3)
+        TallaProducto.objects.create(producto=cls.producto, talla="43", stock=50)
+
+        hoy = timezone.now()
+        for dias in range(0, 11):
+            # Dos unidades diarias de la 42 en toda la ventana (y hoy, que no cuenta).
+            cls._pedido(f"REP{dias}", "42", 2, hoy - timedelta(days=dias))
+        # Una talla inexistente descuenta del stock general.
+        cls._pedido("REPG", "44", 5, hoy - timedelta(days=3))
+        cls._pedido("REPX", "43", 40, hoy - timedelta(days=2), estado=Pedido.Estados.CANCELADO)
+
+    @classmethod
+    def _pedido(cls, numero, talla, cantidad, fecha, estado=Pedido.Estados.PROCESANDO):
+        pedido = Pedido.objects.create(
+            numero_pedido=numero,
+            total=Decimal("25.00") * cantidad,
+            estado=estado,
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Reposición",
+            telefono="600000000",
+        )
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=fecha)
+        ItemPedido.objects.create(
+            pedido=pedido, producto=cls.producto, talla=talla, cantidad=cantidad,
+            precio_unitario=Decimal("25.00"), total=Decimal("25.00") * cantidad,
+        )
+
+    def test_prevision_por_talla_y_stock_general(self):
+        previsiones = {prevision.talla: prevision for prevision in prever_reposicion(todas=True)}
+
+        self.assertEqual(set(previsiones), {"42", ""})
+        talla = previsiones["42"]
+        self.assertEqual((talla.stock, talla.demanda_diaria, talla.dias_hasta_rotura), (3, 2.0, 1.5))
+        # Demanda constante: sin stock de seguridad, 2 * 5 días; pedir para 15 días menos lo que hay.
+        self.assertEqual((talla.punto_pedido, talla.cantidad_sugerida), (10, 27))
+        general = previsiones[""]
+        self.assertEqual((general.stock, general.demanda_diaria), (100, 0.5))
+
+        self.assertEqual([(p.talla, p.stock) for p in prever_reposicion()], [("42", 3)])
+
+    def test_aviso_y_vista(self):
+        self.assertEqual(enviar_aviso_reposicion(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["compras@example.com"])
+        self.assertIn("Modelo Reposición (talla 42)", mail.outbox[0].body)
+
+        respuesta = self.client.get(reverse("informes:reposicion"))
+        self.assertEqual(respuesta.status_code, 302)
+        staff = User.objects.create_user(username="compras", password="clave-segura", is_staff=True)
+        self.client.force_login(staff)
+        respuesta = self.client.get(reverse("informes:reposicion"))
+        self.assertContains(respuesta, "Modelo Reposición")
+        self.assertEqual(len(respuesta.context["previsiones"]), 1)
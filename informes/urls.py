@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "informes"
+
+urlpatterns = [
+    path("ventas/", views.ventas, name="ventas"),
+    path("reposicion/", views.reposicion, name="reposicion"),
+]
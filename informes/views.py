@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Sum
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from informes.models import VentaDiariaCategoria, VentaDiariaMarca, VentaDiariaProducto
+from informes.reposicion import prever_reposicion
+
+# Agrupación -> (tabla de acumulados, campos de la fila, etiqueta de la columna).
+AGRUPACIONES = {
+    "dia": (VentaDiariaCategoria, ("fecha",), "Día"),
+    "producto": (VentaDiariaProducto, ("producto_id", "producto__nombre"), "Producto"),
+    "marca": (VentaDiariaMarca, ("marca_id", "marca__nombre"), "Marca"),
+    "categoria": (VentaDiariaCategoria, ("categoria_id", "categoria__nombre"), "Categoría"),
+}
+
+
+@staff_member_required(login_url="/panel/login/")
+def ventas(request):
+    """Ventas por día, producto, marca o categoría leídas solo de los acumulados diarios."""
+    agrupacion = request.GET.get("agrupacion")
+    if agrupacion not in AGRUPACIONES:
+        agrupacion = "dia"
+    hoy = timezone.localdate()
+    desde = parse_date(request.GET.get("desde") or "") or hoy - timedelta(days=29)
+    hasta = parse_date(request.GET.get("hasta") or "") or hoy
+
+    modelo, campos, etiqueta = AGRUPACIONES[agrupacion]
+    filas = (
+        modelo.objects.filter(fecha__range=(desde, hasta))
+        .values(*campos)
+        .annotate(unidades=Sum("unidades"), importe=Sum("importe"))
+    )
+    filas = filas.order_by("fecha") if agrupacion == "dia" else filas.order_by("-importe")
+    filas = list(filas)
+    for fila in filas:
+        fila["nombre"] = fila[campos[-1]]
+
+    return render(
+        request,
+        "informes/ventas.html",
+        {
+            "filas": filas,
+            "agrupacion": agrupacion,
+            "agrupaciones": [(clave, valor[2]) for clave, valor in AGRUPACIONES.items()],
+            "etiqueta": etiqueta,
+            "desde": desde,
+            "hasta": hasta,
+            "total_unidades": sum(fila["unidades"] for fila in filas),
+            "total_importe": sum((fila["importe"] for fila in filas), 0),
+        },
+    )
+
+
+@staff_member_required(login_url="/panel/login/")
+def reposicion(request):
+    """Referencias en punto de pedido (o todas las que venden, con ``?todas=1``)."""
+    todas = request.GET.get("todas") == "1"
+    return render(
+        request,
+        "informes/reposicion.html",
+        {
+            "previsiones": prever_reposicion(todas=todas),
+            "todas": todas,
+            "ventana": settings.INFORMES_REPOSICION_VENTANA_DIAS,
+            "plazo": settings.INFORMES_REPOSICION_PLAZO_DIAS,
+        },
+    )
@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from .models import ItemPedido, Pedido
+from .models import EventoStripe, ItemPedido, Pedido
+from .services import MAX_PEDIDOS_POR_LOTE, ResultadosTransicion, cambiar_estado_pedidos
 
 
 class ItemPedidoInline(admin.TabularInline):
@@ -9,6 +10,36 @@ class ItemPedidoInline(admin.TabularInline):
     readonly_fields = ("producto", "talla", "cantidad", "precio_unitario", "total")
 
 
+def _accion_cambiar_estado(destino):
+    etiqueta = Pedido.Estados(destino).label
+
+    @admin.action(description=f"Pasar a «{etiqueta}»")
+    def accion(modeladmin, request, queryset):
+        # Igual que el panel y la API: solo transiciones permitidas y con la señal
+        # estado_pedidos_cambiado, de la que dependen informes, popularidad y avisos.
+        ids = list(queryset.values_list("pk", flat=True))
+        resultados = []
+        for inicio in range(0, len(ids), MAX_PEDIDOS_POR_LOTE):
+            resultados += cambiar_estado_pedidos(ids[inicio:inicio + MAX_PEDIDOS_POR_LOTE], destino)
+        actualizados = sum(1 for r in resultados if r["resultado"] == ResultadosTransicion.ACTUALIZADO)
+        rechazados = [
+            r["numero_pedido"] or str(r["id"])
+            for r in resultados
+            if r["resultado"] not in (ResultadosTransicion.ACTUALIZADO, ResultadosTransicion.SIN_CAMBIOS)
+        ]
+        if actualizados:
+            modeladmin.message_user(request, f"{actualizados} pedidos pasados a «{etiqueta}».", messages.SUCCESS)
+        if rechazados:
+            modeladmin.message_user(
+                request,
+                f"{len(rechazados)} pedidos no admiten el paso a «{etiqueta}»: {', '.join(rechazados[:20])}",
+                messages.WARNING,
+            )
+
+    accion.__name__ = f"pasar_a_{destino}"
+    return accion
+
+
 @admin.register(Pedido)
 class PedidoAdmin(admin.ModelAdmin):
     list_display = (
@@ -27,10 +58,28 @@ class PedidoAdmin(admin.ModelAdmin):
         "email_contacto",
     )
     inlines = [ItemPedidoInline]
-    readonly_fields = ("fecha_creacion",)
+    # El estado solo cambia con las acciones, que pasan por cambiar_estado_pedidos.
+    readonly_fields = ("fecha_creacion", "estado")
+    actions = [
+        _accion_cambiar_estado(estado)
+        for estado in (
+            Pedido.Estados.PROCESANDO,
+            Pedido.Estados.ENVIADO,
+            Pedido.Estados.ENTREGADO,
+            Pedido.Estados.CANCELADO,
+        )
+    ]
 
 
 @admin.register(ItemPedido)
 class ItemPedidoAdmin(admin.ModelAdmin):
     list_display = ("pedido", "producto", "talla", "cantidad", "precio_unitario", "total")
     search_fields = ("pedido__numero_pedido", "producto__nombre")
+
+
+@admin.register(EventoStripe)
+class EventoStripeAdmin(admin.ModelAdmin):
+    list_display = ("evento_id", "tipo", "payment_intent_id", "estado", "intentos", "fecha_recepcion")
+    list_filter = ("estado", "tipo")
+    search_fields = ("evento_id", "payment_intent_id")
+    readonly_fields = ("evento_id", "tipo", "payment_intent_id", "creado_stripe", "payload", "fecha_recepcion")
@@ -1,17 +1,42 @@
+import json
+
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from carrito.utils import obtener_o_crear_carrito
-from pedidos.serializers import PedidoCreateSerializer, PedidoSerializer
-from pedidos.services import crear_pedido_desde_carrito
+from pedidos.models import Pedido
+from pedidos.serializers import CambioEstadoLoteSerializer, PedidoCreateSerializer, PedidoSerializer
+from pedidos.services import (
+    ResultadosTransicion,
+    cambiar_estado_pedidos,
+    crear_pedido_idempotente,
+    guardar_respuesta_idempotente,
+    huella_peticion,
+    respuesta_idempotente,
+)
+
+MAX_LONGITUD_CLAVE_IDEMPOTENCIA = 200
 
 
 class PedidoCreateAPIView(APIView):
+    """
+    Crea un pedido desde el carrito actual. Admite la cabecera ``Idempotency-Key``:
+    reintentar con la misma clave devuelve, con 200 y ``Idempotent-Replayed: true``, la
+    misma respuesta que recibio la peticion original en lugar de duplicar el pedido.
+    """
+
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
+        clave = (request.headers.get('Idempotency-Key') or '').strip()
+        if len(clave) > MAX_LONGITUD_CLAVE_IDEMPOTENCIA:
+            return Response(
+                {'detail': 'Idempotency-Key demasiado larga.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         serializer = PedidoCreateSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
@@ -19,6 +44,52 @@ class PedidoCreateAPIView(APIView):
         datos_compra['carrito'] = obtener_o_crear_carrito(request)
 
         cliente = request.user if request.user.is_authenticated else None
-        pedido = crear_pedido_desde_carrito(cliente, datos_compra)
+        clave_completa = f'api:{clave}' if clave else ''
+        if clave:
+            datos_compra['clave_idempotencia'] = clave_completa
+            datos_compra['huella_idempotencia'] = huella_peticion(
+                cliente.pk if cliente else '',
+                datos_compra['carrito'].pk,
+                json.dumps(request.data, sort_keys=True, default=str),
+            )
+        pedido, creado = crear_pedido_idempotente(cliente, datos_compra)
+        if not creado:
+            # Si la peticion original aun no guardo su respuesta, se sirve el pedido actual.
+            data = respuesta_idempotente(clave_completa) or PedidoSerializer(pedido).data
+            return Response(data, status=status.HTTP_200_OK, headers={'Idempotent-Replayed': 'true'})
+
         data = PedidoSerializer(pedido).data
+        if clave:
+            guardar_respuesta_idempotente(clave_completa, data)
         return Response(data, status=status.HTTP_201_CREATED)
+
+
+class CambioEstadoLoteAPIView(APIView):
+    """
+    Cambia el estado de muchos pedidos a la vez (personal de la tienda). Devuelve el
+    resultado de cada pedido: ``actualizado``, ``sin_cambios``, ``no_permitida``,
+    ``no_encontrado`` o ``conflicto``.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = CambioEstadoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+
+        numeros = list(dict.fromkeys(datos['numeros_pedido']))
+        por_numero = dict(
+            Pedido.objects.filter(numero_pedido__in=numeros).values_list('numero_pedido', 'pk')
+        )
+        resultados = [
+            {'id': None, 'numero_pedido': numero, 'resultado': ResultadosTransicion.NO_ENCONTRADO, 'estado': None}
+            for numero in numeros
+            if numero not in por_numero
+        ]
+        resultados = cambiar_estado_pedidos(
+            datos['pedidos'] + [por_numero[numero] for numero in numeros if numero in por_numero],
+            datos['estado'],
+        ) + resultados
+        actualizados = sum(1 for r in resultados if r['resultado'] == ResultadosTransicion.ACTUALIZADO)
+        return Response({'actualizados': actualizados, 'resultados': resultados})
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PedidosConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "pedidos"
+
+    def ready(self):
+        from pedidos import receptores  # noqa: F401
@@ -1,4 +1,5 @@
 import logging
+import uuid
 from decimal import Decimal
 
 from django import forms
@@ -16,6 +17,7 @@ from pedidos.payment_gateways import stripe_gateway
 CHECKOUT_ENTREGA_SESSION_KEY = "checkout_entrega"
 CHECKOUT_PAGO_SESSION_KEY = "checkout_pago"
 CHECKOUT_PEDIDO_ID_SESSION_KEY = "checkout_pedido_id"
+CHECKOUT_IDEMPOTENCIA_SESSION_KEY = "checkout_idempotencia"
 
 logger = logging.getLogger(__name__)
 
@@ -186,6 +188,7 @@ class DetallesPagoView(CheckoutBaseView):
         form = self.form_class(request.POST)
         if form.is_valid():
             request.session[CHECKOUT_PAGO_SESSION_KEY] = form.cleaned_data
+            request.session[CHECKOUT_IDEMPOTENCIA_SESSION_KEY] = uuid.uuid4().hex
             request.session.modified = True
             return redirect("pedidos:checkout_confirmacion")
 
@@ -237,6 +240,11 @@ class ConfirmacionCompraView(CheckoutBaseView):
         }
 
         payload["carrito"] = self.carrito
+        # Dos cargas simultáneas de la confirmación (doble clic, recarga) comparten clave
+        # y obtienen el mismo pedido aunque la sesión aún no tenga su id.
+        clave = request.session.setdefault(CHECKOUT_IDEMPOTENCIA_SESSION_KEY, uuid.uuid4().hex)
+        payload["clave_idempotencia"] = f"checkout:{clave}"
+        payload["huella_idempotencia"] = f"carrito:{self.carrito.pk}"
 
         pedido = crear_pedido_desde_carrito(
             request.user if request.user.is_authenticated else None,
@@ -246,6 +254,7 @@ class ConfirmacionCompraView(CheckoutBaseView):
         request.session[CHECKOUT_PEDIDO_ID_SESSION_KEY] = pedido.pk
         request.session.pop(CHECKOUT_ENTREGA_SESSION_KEY, None)
         request.session.pop(CHECKOUT_PAGO_SESSION_KEY, None)
+        request.session.pop(CHECKOUT_IDEMPOTENCIA_SESSION_KEY, None)
         request.session.modified = True
 
         return (
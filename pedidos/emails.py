@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional
+from datetime import timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, models, transaction
+from django.template.loader import get_template
+from django.utils import timezone
 
-from pedidos.models import Pedido
+from pedidos.models import CorreoPendiente, Pedido
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +30,14 @@ def _nombre_cliente(pedido: Pedido) -> str:
     return ""
 
 
+def destinatario_correo(pedido: Pedido) -> Optional[str]:
+    if pedido.email_contacto:
+        return pedido.email_contacto
+    if pedido.cliente and getattr(pedido.cliente, "email", ""):
+        return pedido.cliente.email
+    return None
+
+
 def _build_context(pedido: Pedido, destinatario: str) -> dict:
     return {
         "pedido": pedido,
@@ -37,9 +48,46 @@ def _build_context(pedido: Pedido, destinatario: str) -> dict:
         "direccion_envio": pedido.direccion_envio,
         "total": pedido.total,
         "tracking_token": str(pedido.tracking_token),
+        "anio": timezone.now().year,
     }
 
 
+# Plantilla base (sin extensión), asunto. Cada tipo tiene versión .html y .txt.
+PLANTILLAS_CORREO = {
+    CorreoPendiente.Tipos.CONFIRMACION: ("pedidos/emails/confirmacion_pedido", "Pedido {numero} recibido"),
+    CorreoPendiente.Tipos.ENVIADO: ("pedidos/emails/pedido_enviado", "Pedido {numero} enviado"),
+    CorreoPendiente.Tipos.ENTREGADO: ("pedidos/emails/pedido_entregado", "Pedido {numero} entregado"),
+}
+
+
+@lru_cache(maxsize=None)
+def _plantilla(nombre: str):
+    """Compila cada plantilla una sola vez por proceso."""
+    return get_template(nombre)
+
+
+def construir_correo(pedido: Pedido, tipo: str, destinatario: str) -> EmailMultiAlternatives:
+    """
+    Construye el mensaje de ``tipo`` para el pedido. La parte de texto plano sale de su
+    propia plantilla ``.txt`` en lugar de limpiar el HTML.
+    """
+    ruta, asunto = PLANTILLAS_CORREO[tipo]
+    context = _build_context(pedido, destinatario)
+    html_body = _plantilla(f"{ruta}.html").render(context)
+    text_body = _plantilla(f"{ruta}.txt").render(context)
+
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None) or None
+    message = EmailMultiAlternatives(
+        asunto.format(numero=pedido.numero_pedido), text_body, from_email, [destinatario]
+    )
+    message.attach_alternative(html_body, "text/html")
+    return message
+
+
+def construir_confirmacion_pedido(pedido: Pedido, destinatario: str) -> EmailMultiAlternatives:
+    return construir_correo(pedido, CorreoPendiente.Tipos.CONFIRMACION, destinatario)
+
+
 def enviar_confirmacion_pedido(pedido: Pedido, destinatario: Optional[str]) -> bool:
     """
     Genera y envía un correo HTML con el resumen del pedido.
@@ -49,17 +97,108 @@ def enviar_confirmacion_pedido(pedido: Pedido, destinatario: Optional[str]) -> b
     if not email:
         return False
 
-    context = _build_context(pedido, email)
-    html_body = render_to_string("pedidos/emails/confirmacion_pedido.html", context)
-    text_body = strip_tags(html_body)
-
-    subject = f"Pedido {pedido.numero_pedido} recibido"
-    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None) or None
-    message = EmailMultiAlternatives(subject, text_body, from_email, [email])
-    message.attach_alternative(html_body, "text/html")
+    message = construir_confirmacion_pedido(pedido, email)
     try:
         message.send()
         return True
     except Exception:  # pragma: no cover - logged for diagnosis, flow must continue
         logger.exception("Error enviando email de confirmación de pedido %s", pedido.pk)
         return False
+
+
+def _pedidos_para_correo(pedido_ids: Iterable[int]) -> Dict[int, Pedido]:
+    """Carga los pedidos con cliente, líneas y productos en un número fijo de consultas."""
+    return (
+        Pedido.objects.select_related("cliente")
+        .prefetch_related("items__producto")
+        .in_bulk(set(pedido_ids))
+    )
+
+
+def _reservar_correos(lote: int) -> List[CorreoPendiente]:
+    """
+    Reserva una tanda de correos vencidos moviendo su ``proximo_intento`` al futuro.
+    La marca de reserva es única por llamada, así que dos trabajadores nunca se quedan
+    con la misma fila aunque la base de datos no soporte ``SKIP LOCKED``.
+    """
+    ahora = timezone.now()
+    reserva = ahora + timedelta(seconds=getattr(settings, "PEDIDOS_CORREO_RESERVA_SEGUNDOS", 300))
+    pendientes = CorreoPendiente.objects.filter(
+        estado=CorreoPendiente.Estados.PENDIENTE,
+        proximo_intento__lte=ahora,
+    ).order_by("proximo_intento", "id")
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(pendientes.select_for_update(skip_locked=True).values_list("pk", flat=True)[:lote])
+            CorreoPendiente.objects.filter(pk__in=ids).update(proximo_intento=reserva)
+    else:
+        # SQLite: UPDATE condicional en autocommit (ver tareas.cola.reservar).
+        ids = list(pendientes.values_list("pk", flat=True)[:lote])
+        CorreoPendiente.objects.filter(pk__in=ids, proximo_intento__lte=ahora).update(proximo_intento=reserva)
+    if not ids:
+        return []
+    return list(CorreoPendiente.objects.filter(pk__in=ids, proximo_intento=reserva).order_by("id"))
+
+
+def _reprogramar(correos: List[CorreoPendiente], errores: Dict[int, str]) -> None:
+    if not errores:
+        return
+    ahora = timezone.now()
+    max_intentos = getattr(settings, "PEDIDOS_CORREO_MAX_INTENTOS", 5)
+    espera_base = getattr(settings, "PEDIDOS_CORREO_ESPERA_BASE_SEGUNDOS", 60)
+    fallidos = [correo for correo in correos if correo.pk in errores]
+    for correo in fallidos:
+        correo.intentos += 1
+        correo.ultimo_error = errores[correo.pk][:1000]
+        if correo.intentos >= max_intentos:
+            correo.estado = CorreoPendiente.Estados.FALLIDO
+        correo.proximo_intento = ahora + timedelta(seconds=espera_base * 2 ** (correo.intentos - 1))
+    CorreoPendiente.objects.bulk_update(
+        fallidos, ["intentos", "ultimo_error", "estado", "proximo_intento"]
+    )
+
+
+def procesar_bandeja_salida(lote: int = 100) -> Dict[str, int]:
+    """
+    Envía una tanda de la bandeja de salida reutilizando una sola conexión SMTP. Los
+    pedidos, líneas y productos de toda la tanda se cargan en un número fijo de consultas.
+    Cada mensaje se entrega por separado en esa conexión para saber qué fila falló; los
+    fallos se reprograman con espera exponencial hasta agotar los intentos.
+    """
+    correos = _reservar_correos(lote)
+    if not correos:
+        return {"enviados": 0, "errores": 0}
+
+    pedidos = _pedidos_para_correo(correo.pedido_id for correo in correos)
+    enviados: List[int] = []
+    errores: Dict[int, str] = {}
+    conexion = get_connection()
+    try:
+        conexion.open()
+    except Exception as exc:
+        logger.exception("No se pudo abrir la conexión de correo")
+        errores = {correo.pk: str(exc) for correo in correos}
+    else:
+        try:
+            for correo in correos:
+                try:
+                    mensaje = construir_correo(pedidos[correo.pedido_id], correo.tipo, correo.destinatario)
+                    mensaje.connection = conexion
+                    if not conexion.send_messages([mensaje]):
+                        raise RuntimeError("El servidor de correo no aceptó el mensaje.")
+                    enviados.append(correo.pk)
+                except Exception as exc:
+                    logger.exception("Error enviando correo %s del pedido %s", correo.tipo, correo.pedido_id)
+                    errores[correo.pk] = str(exc)
+        finally:
+            conexion.close()
+
+    if enviados:
+        CorreoPendiente.objects.filter(pk__in=enviados).update(
+            estado=CorreoPendiente.Estados.ENVIADO,
+            fecha_envio=timezone.now(),
+            intentos=models.F("intentos") + 1,
+        )
+    _reprogramar(correos, errores)
+    return {"enviados": len(enviados), "errores": len(errores)}
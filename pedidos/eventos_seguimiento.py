@@ -0,0 +1,117 @@
+"""
+Central de cambios de estado para la página de seguimiento (Server-Sent Events).
+
+Hay una central por proceso. Cada pestaña abierta es una ``Suscripcion`` con su propia
+cola; la señal ``estado_pedidos_cambiado`` reparte el nuevo estado sin consultar la base
+de datos y solo a las pestañas de esos pedidos. Los cambios hechos en otro proceso (otro
+worker web o ``run_worker``) no llegan por la señal, así que una única tarea por proceso
+consulta cada ``PEDIDOS_SEGUIMIENTO_SONDEO`` segundos el estado de los pedidos con
+suscriptores: una consulta por intervalo sin importar cuántas pestañas haya.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+
+from pedidos.models import Pedido
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_FINALES = (Pedido.Estados.ENTREGADO, Pedido.Estados.CANCELADO)
+
+
+def formatear_evento(estado: str) -> str:
+    datos = {"estado": estado, "texto": str(Pedido.Estados(estado).label)}
+    return f"event: estado\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+class Suscripcion:
+    __slots__ = ("pedido_id", "cola", "bucle")
+
+    def __init__(self, pedido_id: int):
+        self.pedido_id = pedido_id
+        self.cola: asyncio.Queue = asyncio.Queue()
+        self.bucle = asyncio.get_running_loop()
+
+    def entregar(self, estado: str) -> None:
+        # La señal llega desde hilos síncronos: la cola solo se toca desde su bucle.
+        self.bucle.call_soon_threadsafe(self.cola.put_nowait, estado)
+
+
+class CentralSeguimiento:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones: Dict[int, Set[Suscripcion]] = defaultdict(set)
+        self._estados: Dict[int, str] = {}
+        self._sondeo: Optional[asyncio.Task] = None
+
+    def suscribir(self, pedido_id: int, estado: str) -> Suscripcion:
+        suscripcion = Suscripcion(pedido_id)
+        with self._lock:
+            self._suscripciones[pedido_id].add(suscripcion)
+            self._estados.setdefault(pedido_id, estado)
+        self._asegurar_sondeo()
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion) -> None:
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.pedido_id)
+            if suscripciones is None:
+                return
+            suscripciones.discard(suscripcion)
+            if not suscripciones:
+                del self._suscripciones[suscripcion.pedido_id]
+                self._estados.pop(suscripcion.pedido_id, None)
+
+    def publicar(self, pedido_ids: Iterable[int], estado: str) -> int:
+        """Reparte ``estado`` a las pestañas de ``pedido_ids``; devuelve cuántas lo reciben."""
+        entregas = []
+        with self._lock:
+            for pedido_id in pedido_ids:
+                suscripciones = self._suscripciones.get(pedido_id)
+                if not suscripciones or self._estados.get(pedido_id) == estado:
+                    continue
+                self._estados[pedido_id] = estado
+                entregas.extend(suscripciones)
+        for suscripcion in entregas:
+            try:
+                suscripcion.entregar(estado)
+            except RuntimeError:
+                # El bucle de esa pestaña ya se cerró; se limpiará al cancelar.
+                pass
+        return len(entregas)
+
+    def suscriptores(self) -> int:
+        with self._lock:
+            return sum(len(suscripciones) for suscripciones in self._suscripciones.values())
+
+    def _asegurar_sondeo(self) -> None:
+        bucle = asyncio.get_running_loop()
+        if self._sondeo and not self._sondeo.done() and self._sondeo.get_loop() is bucle:
+            return
+        self._sondeo = bucle.create_task(self._sondear())
+
+    async def _sondear(self) -> None:
+        intervalo = getattr(settings, "PEDIDOS_SEGUIMIENTO_SONDEO", 5)
+        while True:
+            await asyncio.sleep(intervalo)
+            with self._lock:
+                pedido_ids = list(self._suscripciones)
+            if not pedido_ids:
+                return
+            try:
+                filas = Pedido.objects.filter(pk__in=pedido_ids).values_list("pk", "estado")
+                async for pedido_id, estado in filas:
+                    self.publicar([pedido_id], estado)
+            except Exception:  # pragma: no cover - se reintenta en el siguiente intervalo
+                logger.exception("No se pudo consultar el estado de los pedidos seguidos")
+
+
+central = CentralSeguimiento()
@@ -0,0 +1,169 @@
+import statistics
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from carrito.models import Carrito, ItemCarrito
+from pedidos.models import Pedido
+from pedidos.payment_gateways import stripe_client, stripe_gateway
+from pedidos.payment_gateways.stripe_falso import ServidorStripeFalso
+from pedidos.services import crear_pedido_desde_carrito
+from productos.models import Categoria, Marca, Producto, TallaProducto
+
+
+class _Rollback(Exception):
+    """Fuerza el rollback de los datos creados para la medición."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia de las rutas críticas de pedidos sobre datos temporales "
+        "(se deshace todo al terminar)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--escenario",
+            choices=["checkout", "webhooks", "tarjeta"],
+            default="checkout",
+            help=(
+                "Ruta a medir: 'checkout' crea un pedido desde un carrito; 'webhooks' simula "
+                "una ráfaga de eventos de Stripe que actualizan el mismo pedido; 'tarjeta' hace "
+                "el pago completo contra un Stripe falso local."
+            ),
+        )
+        parser.add_argument("--lineas", type=int, default=20, help="Líneas del carrito.")
+        parser.add_argument("--repeticiones", type=int, default=20, help="Número de mediciones.")
+        parser.add_argument("--eventos", type=int, default=50, help="Eventos por ráfaga de webhooks.")
+        parser.add_argument(
+            "--latencia-ms", type=float, default=0, help="Latencia del Stripe falso (escenario tarjeta)."
+        )
+        parser.add_argument(
+            "--tasa-fallos", type=float, default=0, help="Errores 500 del Stripe falso (escenario tarjeta)."
+        )
+
+    def handle(self, *args, **options):
+        if options["escenario"] != "tarjeta":
+            return self._ejecutar(options)
+
+        servidor = ServidorStripeFalso(
+            latencia=options["latencia_ms"] / 1000, tasa_fallos=options["tasa_fallos"]
+        ).iniciar()
+        ajustes = override_settings(
+            STRIPE_API_BASE=servidor.url,
+            STRIPE_SECRET_KEY=settings.STRIPE_SECRET_KEY or "sk_test_benchmark",
+            STRIPE_PUBLISHABLE_KEY=settings.STRIPE_PUBLISHABLE_KEY or "pk_test_benchmark",
+        )
+        try:
+            with ajustes:
+                stripe_client.reiniciar()
+                self._ejecutar(options)
+        finally:
+            stripe_client.reiniciar()
+            servidor.detener()
+        self.stdout.write(f"peticiones a Stripe falso: {servidor.peticiones}")
+
+    def _ejecutar(self, options):
+        escenario = options["escenario"]
+        tiempos, consultas = [], []
+        try:
+            with transaction.atomic():
+                medir = getattr(self, f"_medir_{escenario}")
+                for _ in range(options["repeticiones"]):
+                    duracion, num_consultas = medir(options)
+                    tiempos.append(duracion)
+                    consultas.append(num_consultas)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(
+            f"{escenario}: n={len(tiempos)} "
+            f"mediana={statistics.median(tiempos) * 1000:.2f}ms "
+            f"p95={sorted(tiempos)[int(len(tiempos) * 0.95) - 1] * 1000:.2f}ms "
+            f"consultas={statistics.median(consultas):.0f}"
+        )
+
+    def _medir_checkout(self, options):
+        carrito = self._carrito_con_lineas(options["lineas"])
+        datos = {
+            "carrito": carrito,
+            "metodo_pago": Pedido.MetodosPago.TARJETA,
+            "direccion_envio": "Calle Benchmark 1",
+            "telefono": "600000000",
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            crear_pedido_desde_carrito(None, datos)
+            duracion = time.perf_counter() - inicio
+        return duracion, len(ctx.captured_queries)
+
+    def _medir_webhooks(self, options):
+        pedido = crear_pedido_desde_carrito(
+            None,
+            {
+                "carrito": self._carrito_con_lineas(1),
+                "metodo_pago": Pedido.MetodosPago.TARJETA,
+                "direccion_envio": "Calle Benchmark 1",
+                "telefono": "600000000",
+            },
+        )
+        estados = ("requires_payment_method", "processing")
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            for indice in range(options["eventos"]):
+                intent = SimpleNamespace(
+                    status=estados[indice % 2],
+                    latest_charge=f"ch_{indice}",
+                    charges=None,
+                )
+                stripe_gateway._sync_payment_state(pedido, intent)
+            duracion = time.perf_counter() - inicio
+        return duracion, len(ctx.captured_queries)
+
+    def _medir_tarjeta(self, options):
+        carrito = self._carrito_con_lineas(options["lineas"])
+        datos = {
+            "carrito": carrito,
+            "metodo_pago": Pedido.MetodosPago.TARJETA,
+            "direccion_envio": "Calle Benchmark 1",
+            "telefono": "600000000",
+        }
+        cliente = stripe_client.obtener_cliente()
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            pedido = crear_pedido_desde_carrito(None, datos)
+            try:
+                intent = stripe_gateway.ensure_payment_intent(pedido)
+                # El navegador confirma el pago con Stripe.js; aquí lo hace el cliente.
+                cliente.payment_intents.confirm(intent.id)
+                stripe_gateway.confirm_payment_intent(intent.id)
+            except Exception as exc:
+                self.stderr.write(f"pago fallido: {exc}")
+            duracion = time.perf_counter() - inicio
+        return duracion, len(ctx.captured_queries)
+
+    @staticmethod
+    def _carrito_con_lineas(lineas):
+        marca, _ = Marca.objects.get_or_create(nombre="Benchmark")
+        categoria, _ = Categoria.objects.get_or_create(nombre="Benchmark")
+        carrito = Carrito.objects.create()
+        for indice in range(lineas):
+            producto = Producto.objects.create(
+                nombre=f"Benchmark {indice}",
+                precio=Decimal("50.00"),
+                marca=marca,
+                categoria=categoria,
+                stock=1000,
+            )
+            talla = None
+            if indice % 2:
+                talla = "42"
+                TallaProducto.objects.create(producto=producto, talla=talla, stock=1000)
+            ItemCarrito.objects.create(carrito=carrito, producto=producto, talla=talla, cantidad=1)
+        return carrito
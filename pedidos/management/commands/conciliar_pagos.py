@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.payment_gateways.conciliacion import conciliar_pagos
+from pedidos.payment_gateways.stripe_gateway import StripeGatewayError
+
+
+class Command(BaseCommand):
+    help = "Concilia con Stripe los pedidos con tarjeta que siguen pendientes (webhooks perdidos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=200, help="Pedidos por página.")
+        parser.add_argument(
+            "--antiguedad-minutos",
+            type=int,
+            default=15,
+            help="Solo pedidos creados hace más de estos minutos.",
+        )
+        parser.add_argument(
+            "--antiguedad-maxima-dias",
+            type=int,
+            default=7,
+            help="Los pedidos más antiguos se consideran abandonados y no se revisan.",
+        )
+        parser.add_argument("--pausa", type=float, default=0.0, help="Segundos de espera entre páginas.")
+        parser.add_argument("--limite", type=int, default=None, help="Máximo de pedidos a revisar.")
+
+    def handle(self, *args, **options):
+        try:
+            resultado = conciliar_pagos(
+                lote=options["lote"],
+                antiguedad_minima=timedelta(minutes=options["antiguedad_minutos"]),
+                antiguedad_maxima=timedelta(days=options["antiguedad_maxima_dias"]),
+                pausa=options["pausa"],
+                limite=options["limite"],
+            )
+        except StripeGatewayError as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(
+            f"Revisados: {resultado['revisados']} · pagados: {resultado['pagados']} "
+            f"· actualizados: {resultado['actualizados']} · sin intent: {resultado['no_encontrados']}"
+        )
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from pedidos.exportacion import FORMATOS, TAMANO_LOTE, exportar
+
+
+def _inicio_del_dia(valor, opcion):
+    dia = parse_date(valor)
+    if dia is None:
+        raise CommandError(f"{opcion} debe tener el formato AAAA-MM-DD.")
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+
+class Command(BaseCommand):
+    help = "Exporta pedidos y sus líneas en CSV o NDJSON sin cargarlos en memoria."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formato", choices=FORMATOS, default="csv")
+        parser.add_argument("--desde", help="Pedidos creados desde este día (AAAA-MM-DD).")
+        parser.add_argument("--hasta", help="Pedidos creados hasta este día incluido (AAAA-MM-DD).")
+        parser.add_argument("--estado", default="", help="Solo pedidos en este estado.")
+        parser.add_argument("--salida", help="Fichero de destino; por defecto, la salida estándar.")
+        parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Pedidos por página.")
+
+    def handle(self, *args, **options):
+        desde = _inicio_del_dia(options["desde"], "--desde") if options["desde"] else None
+        hasta = None
+        if options["hasta"]:
+            hasta = _inicio_del_dia(options["hasta"], "--hasta") + timedelta(days=1)
+        trozos = exportar(
+            options["formato"],
+            desde=desde,
+            hasta=hasta,
+            estado=options["estado"],
+            lote=options["lote"],
+        )
+        if not options["salida"]:
+            for trozo in trozos:
+                self.stdout.write(trozo, ending="")
+            return
+        with open(options["salida"], "w", encoding="utf-8", newline="") as fichero:
+            fichero.writelines(trozos)
+        self.stderr.write(f"Exportación guardada en {options['salida']}")
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pedidos.emails import procesar_bandeja_salida
+
+
+class Command(BaseCommand):
+    help = "Envía los correos pendientes de la bandeja de salida usando una sola conexión SMTP por tanda."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="Correos por tanda.")
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="No termina al vaciar la bandeja: espera y vuelve a comprobar.",
+        )
+        parser.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre comprobaciones.")
+
+    def handle(self, *args, **options):
+        while True:
+            enviados = errores = 0
+            while True:
+                resultado = procesar_bandeja_salida(lote=options["lote"])
+                enviados += resultado["enviados"]
+                errores += resultado["errores"]
+                if resultado["enviados"] + resultado["errores"] < options["lote"]:
+                    break
+            if enviados or errores or not options["continuo"]:
+                self.stdout.write(f"Correos enviados: {enviados} · con error: {errores}")
+            if not options["continuo"]:
+                return
+            time.sleep(options["intervalo"])
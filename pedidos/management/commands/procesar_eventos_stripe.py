@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from pedidos.payment_gateways.stripe_gateway import procesar_eventos_pendientes
+
+
+class Command(BaseCommand):
+    help = "Procesa los webhooks de Stripe guardados, en orden por PaymentIntent."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="Eventos por tanda.")
+
+    def handle(self, *args, **options):
+        total = {"procesados": 0, "ignorados": 0, "errores": 0}
+        while True:
+            resultado = procesar_eventos_pendientes(lote=options["lote"])
+            for clave, valor in resultado.items():
+                total[clave] += valor
+            if sum(resultado.values()) < options["lote"]:
+                break
+        self.stdout.write(
+            f"Eventos procesados: {total['procesados']} · ignorados: {total['ignorados']} "
+            f"· con error: {total['errores']}"
+        )
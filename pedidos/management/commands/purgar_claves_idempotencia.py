@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pedidos.services import purgar_claves_idempotencia
+
+
+class Command(BaseCommand):
+    help = "Elimina las claves Idempotency-Key caducadas (ver PEDIDOS_IDEMPOTENCIA_TTL_HORAS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Filas borradas por sentencia.")
+
+    def handle(self, *args, **options):
+        borradas = purgar_claves_idempotencia(lote=options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"Claves de idempotencia eliminadas: {borradas}"))
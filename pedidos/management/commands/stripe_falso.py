@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pedidos.payment_gateways.stripe_falso import ServidorStripeFalso
+
+
+class Command(BaseCommand):
+    help = (
+        "Arranca un sustituto local de la API de Stripe (PaymentIntents y webhooks firmados). "
+        "Apunta STRIPE_API_BASE a la dirección que muestra."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--puerto", type=int, default=12111)
+        parser.add_argument("--latencia-ms", type=float, default=0, help="Retardo añadido a cada respuesta.")
+        parser.add_argument(
+            "--tasa-fallos", type=float, default=0, help="Probabilidad (0-1) de responder con un error 500."
+        )
+        parser.add_argument(
+            "--webhook-url",
+            default="http://127.0.0.1:8000/pedidos/webhooks/stripe/",
+            help="Destino de los webhooks firmados (vacío para no enviarlos).",
+        )
+
+    def handle(self, *args, **options):
+        servidor = ServidorStripeFalso(
+            options["host"],
+            options["puerto"],
+            latencia=options["latencia_ms"] / 1000,
+            tasa_fallos=options["tasa_fallos"],
+            secreto_webhook=settings.STRIPE_WEBHOOK_SECRET,
+            url_webhook=options["webhook_url"],
+        )
+        self.stdout.write(f"Stripe falso escuchando en {servidor.url} (STRIPE_API_BASE={servidor.url})")
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            self.stderr.write("Aviso: STRIPE_WEBHOOK_SECRET vacío; el webhook rechazará los eventos.")
+        try:
+            servidor.servir()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.detener()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0008_correopendiente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='correopendiente',
+            name='tipo',
+            field=models.CharField(choices=[('confirmacion', 'Confirmación de pedido'), ('enviado', 'Pedido enviado'), ('entregado', 'Pedido entregado')], max_length=20),
+        ),
+    ]
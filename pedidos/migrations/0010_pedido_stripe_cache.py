@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0009_correopendiente_tipos_estado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='stripe_client_secret',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='stripe_importe_centimos',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
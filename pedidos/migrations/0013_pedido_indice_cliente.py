@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0012_pedido_indices_listado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cliente', 'fecha_creacion'], name='pedido_cliente_fecha_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 import uuid
 from decimal import Decimal
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from productos.models import Producto
@@ -63,15 +65,45 @@ class Pedido(models.Model):
     stripe_payment_status = models.CharField(max_length=50, blank=True)
     stripe_charge_id = models.CharField(max_length=255, blank=True)
     stripe_receipt_url = models.URLField(blank=True)
+    # Copia local del PaymentIntent: evita consultar Stripe en cada carga de la confirmación.
+    stripe_client_secret = models.CharField(max_length=255, blank=True)
+    stripe_importe_centimos = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ("-fecha_creacion",)
+        indexes = [
+            # Listado del panel: filtro por estado y paginación por (fecha_creacion, id).
+            models.Index(fields=["estado", "fecha_creacion"], name="pedido_estado_fecha_idx"),
+            models.Index(fields=["fecha_creacion", "id"], name="pedido_fecha_id_idx"),
+            # Historial de un cliente, del más reciente al más antiguo.
+            models.Index(fields=["cliente", "fecha_creacion"], name="pedido_cliente_fecha_idx"),
+        ]
 
     def __str__(self):
         return f"{self.numero_pedido} ({self.estado})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._tracking_token_cargado = instancia.__dict__.get("tracking_token")
+        return instancia
+
     def save(self, *args, **kwargs):
-        if self.pk:
+        if self.pk and not self._state.adding:
+            # El token es inmutable: se restaura el valor cargado, así que no hace falta
+            # volver a leerlo de la base de datos en cada guardado. Un save() sin
+            # update_fields sigue el flujo normal de Django (UPDATE y, si la fila ya no
+            # existe, INSERT); con update_fields el token se excluye del UPDATE.
+            token_cargado = getattr(self, "_tracking_token_cargado", None)
+            if token_cargado:
+                self.tracking_token = token_cargado
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = tuple(
+                    field for field in update_fields if field != "tracking_token"
+                )
+        elif self.pk:
+            # Instancia construida a mano con una pk existente: único caso que necesita consulta.
             original_token = (
                 type(self)
                 .objects.filter(pk=self.pk)
@@ -80,14 +112,10 @@ class Pedido(models.Model):
             )
             if original_token:
                 self.tracking_token = original_token
-            update_fields = kwargs.get("update_fields")
-            if update_fields:
-                kwargs["update_fields"] = tuple(
-                    field for field in update_fields if field != "tracking_token"
-                )
         elif not self.tracking_token:
             self.tracking_token = uuid.uuid4()
         super().save(*args, **kwargs)
+        self._tracking_token_cargado = self.tracking_token
 
 
 class ItemPedido(models.Model):
@@ -100,3 +128,86 @@ class ItemPedido(models.Model):
 
     def __str__(self):
         return f"{self.producto} x {self.cantidad}"
+
+
+class ClaveIdempotencia(models.Model):
+    """Clave ``Idempotency-Key`` ya atendida y el pedido que produjo."""
+
+    clave = models.CharField(max_length=255, unique=True)
+    huella = models.CharField(max_length=64)
+    pedido = models.ForeignKey(Pedido, related_name="claves_idempotencia", on_delete=models.CASCADE)
+    # Cuerpo de la respuesta original, que se devuelve tal cual en las repeticiones.
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.clave
+
+
+class CorreoPendiente(models.Model):
+    """
+    Bandeja de salida transaccional: el correo se registra en la misma transacción que
+    el cambio del pedido y lo envía después el comando ``procesar_correos``.
+    """
+
+    class Tipos(models.TextChoices):
+        CONFIRMACION = "confirmacion", _("Confirmación de pedido")
+        ENVIADO = "enviado", _("Pedido enviado")
+        ENTREGADO = "entregado", _("Pedido entregado")
+
+    class Estados(models.TextChoices):
+        PENDIENTE = "pendiente", _("Pendiente")
+        ENVIADO = "enviado", _("Enviado")
+        FALLIDO = "fallido", _("Fallido")
+
+    pedido = models.ForeignKey(Pedido, related_name="correos", on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=Tipos.choices)
+    destinatario = models.EmailField()
+    estado = models.CharField(max_length=20, choices=Estados.choices, default=Estados.PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("proximo_intento", "id")
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"], name="correo_pendiente_cola_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} · {self.pedido_id} → {self.destinatario}"
+
+
+class EventoStripe(models.Model):
+    """
+    Registro de solo inserción de los webhooks de Stripe. El índice único sobre
+    ``evento_id`` descarta los reenvíos y el procesado ocurre fuera de la petición.
+    """
+
+    class Estados(models.TextChoices):
+        PENDIENTE = "pendiente", _("Pendiente")
+        PROCESADO = "procesado", _("Procesado")
+        IGNORADO = "ignorado", _("Ignorado")
+        FALLIDO = "fallido", _("Fallido")
+
+    evento_id = models.CharField(max_length=255, unique=True)
+    tipo = models.CharField(max_length=100)
+    payment_intent_id = models.CharField(max_length=255, blank=True, db_index=True)
+    creado_stripe = models.PositiveBigIntegerField(default=0)
+    payload = models.JSONField()
+    estado = models.CharField(max_length=20, choices=Estados.choices, default=Estados.PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+    fecha_procesado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("creado_stripe", "id")
+        indexes = [
+            models.Index(fields=["estado", "creado_stripe", "id"], name="evento_stripe_cola_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.evento_id} ({self.tipo})"
@@ -0,0 +1,182 @@
+"""
+Conciliación de pagos con Stripe.
+
+Recupera los pedidos con tarjeta que siguen pendientes porque su webhook no llegó. Los
+pedidos se recorren por páginas de clave primaria y, para cada página, se listan los
+PaymentIntent de sus ventanas de creación (100 por petición) en lugar de consultar cada
+intent por separado. Los pedidos separados por más de dos holguras forman ventanas
+distintas, para no listar los intents de todo el hueco entre ellos, y si una ventana
+necesita tantas peticiones de listado como pedidos busca, el resto se consulta uno a uno.
+Los cambios se aplican en bloque.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from pedidos.models import CorreoPendiente, Pedido
+from pedidos.payment_gateways import stripe_client
+from pedidos.payment_gateways.stripe_gateway import (
+    StripeGatewayError,
+    aplicar_estado_intent,
+    is_enabled,
+)
+from pedidos.services import encolar_correos
+from pedidos.signals import emitir_cambio_estado
+from tienda_virtual import metricas
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_ESTADO_STRIPE = [
+    "stripe_payment_status",
+    "stripe_charge_id",
+    "stripe_receipt_url",
+    "stripe_importe_centimos",
+    "stripe_client_secret",
+]
+
+
+def _ventanas(pedidos: List[Pedido], holgura: timedelta) -> Iterator[Tuple[int, int, Set[str]]]:
+    """Agrupa los pedidos por cercanía de creación: (desde, hasta, intents buscados)."""
+    ordenados = sorted(pedidos, key=lambda pedido: pedido.fecha_creacion)
+    grupo: List[Pedido] = []
+    for pedido in ordenados:
+        if grupo and pedido.fecha_creacion - grupo[-1].fecha_creacion > 2 * holgura:
+            yield _ventana(grupo, holgura)
+            grupo = []
+        grupo.append(pedido)
+    if grupo:
+        yield _ventana(grupo, holgura)
+
+
+def _ventana(grupo: List[Pedido], holgura: timedelta) -> Tuple[int, int, Set[str]]:
+    # El intent se crea al abrir la confirmación, poco después que el pedido.
+    return (
+        int((grupo[0].fecha_creacion - holgura).timestamp()),
+        int((grupo[-1].fecha_creacion + holgura).timestamp()),
+        {pedido.stripe_payment_intent_id for pedido in grupo},
+    )
+
+
+def _listar_intents(cliente, desde: int, hasta: int, buscados: Set[str]) -> Dict[str, object]:
+    """
+    Pagina ``payment_intents.list`` en la ventana y se detiene al encontrar todos o al
+    llegar a tantas peticiones como intents buscados: a partir de ahí es más barato
+    consultar los que falten uno a uno.
+    """
+    encontrados: Dict[str, object] = {}
+    parametros = {"created": {"gte": desde, "lte": hasta}, "limit": 100}
+    for _ in range(len(buscados)):
+        pagina = stripe_client.llamar("payment_intents.list", cliente.payment_intents.list, params=parametros)
+        for intent in pagina.data:
+            if intent.id in buscados:
+                encontrados[intent.id] = intent
+        if not pagina.has_more or not pagina.data or len(encontrados) == len(buscados):
+            break
+        parametros = {**parametros, "starting_after": pagina.data[-1].id}
+    return encontrados
+
+
+def _confirmables(pagados: List[int]):
+    """
+    Pedidos aún pendientes entre los pagados, bloqueados. ``cliente`` es una FK nula (LEFT
+    JOIN) y PostgreSQL no admite FOR UPDATE sobre el lado nulo: se bloquea solo el pedido.
+    """
+    return (
+        Pedido.objects.select_for_update(of=("self",))
+        .filter(pk__in=pagados, estado=Pedido.Estados.PENDIENTE)
+        .select_related("cliente")
+    )
+
+
+def _aplicar_pagina(pedidos: List[Pedido], intents: Dict[str, object]) -> Dict[str, int]:
+    modificados: List[Pedido] = []
+    pagados: List[int] = []
+    for pedido in pedidos:
+        intent = intents.get(pedido.stripe_payment_intent_id)
+        if intent is None:
+            continue
+        if aplicar_estado_intent(pedido, intent):
+            modificados.append(pedido)
+        if (intent.status or "").lower() == "succeeded":
+            pagados.append(pedido.pk)
+
+    with transaction.atomic():
+        Pedido.objects.bulk_update(modificados, CAMPOS_ESTADO_STRIPE)
+        confirmados = list(_confirmables(pagados))
+        # Mismo criterio que _finalize_payment_success: solo el UPDATE que gana encola el correo.
+        Pedido.objects.filter(pk__in=[p.pk for p in confirmados]).update(estado=Pedido.Estados.PROCESANDO)
+        encolar_correos(confirmados, CorreoPendiente.Tipos.CONFIRMACION)
+        emitir_cambio_estado([p.pk for p in confirmados], Pedido.Estados.PROCESANDO)
+    return {"actualizados": len(modificados), "pagados": len(confirmados)}
+
+
+def conciliar_pagos(
+    lote: int = 200,
+    antiguedad_minima: timedelta = timedelta(minutes=15),
+    antiguedad_maxima: timedelta = timedelta(days=7),
+    pausa: float = 0.0,
+    limite: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Recorre los pedidos con tarjeta pendientes y con PaymentIntent creados entre
+    ``antiguedad_maxima`` y ``antiguedad_minima`` atrás; los más viejos se dan por
+    abandonados y dejan de consultarse en cada pasada. ``pausa`` (segundos entre páginas) permite repartir la carga
+    si se concilian muchos miles de pedidos.
+    """
+    if not is_enabled():
+        raise StripeGatewayError("Stripe no está habilitado en este entorno.")
+    cliente = stripe_client.obtener_cliente()
+    holgura = timedelta(minutes=getattr(settings, "STRIPE_CONCILIACION_HOLGURA_MINUTOS", 60))
+    resultado = {"revisados": 0, "actualizados": 0, "pagados": 0, "no_encontrados": 0}
+    ahora = timezone.now()
+    pendientes = (
+        Pedido.objects.filter(
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            estado=Pedido.Estados.PENDIENTE,
+            fecha_creacion__gte=ahora - antiguedad_maxima,
+            fecha_creacion__lte=ahora - antiguedad_minima,
+        )
+        .exclude(stripe_payment_intent_id="")
+        .order_by("pk")
+    )
+    ultimo_pk = 0
+    while limite is None or resultado["revisados"] < limite:
+        pedidos = list(pendientes.filter(pk__gt=ultimo_pk)[:lote])
+        if not pedidos:
+            break
+        ultimo_pk = pedidos[-1].pk
+        resultado["revisados"] += len(pedidos)
+
+        buscados = {pedido.stripe_payment_intent_id for pedido in pedidos}
+        intents: Dict[str, object] = {}
+        try:
+            for desde, hasta, buscados_ventana in _ventanas(pedidos, holgura):
+                intents.update(_listar_intents(cliente, desde, hasta, buscados_ventana))
+            # Los que quedan fuera de su ventana o sin listar se consultan uno a uno.
+            for intent_id in buscados - intents.keys():
+                try:
+                    intents[intent_id] = stripe_client.llamar(
+                        "payment_intents.retrieve", cliente.payment_intents.retrieve, intent_id
+                    )
+                except stripe_client.stripe.InvalidRequestError:
+                    logger.warning("PaymentIntent %s inexistente en Stripe", intent_id)
+        except stripe_client.CircuitoAbiertoError as exc:
+            raise StripeGatewayError("Stripe no disponible; conciliación interrumpida.") from exc
+        resultado["no_encontrados"] += len(buscados - intents.keys())
+
+        for clave, valor in _aplicar_pagina(pedidos, intents).items():
+            resultado[clave] += valor
+        if pausa:
+            time.sleep(pausa)
+
+    metricas.incrementar("stripe.conciliacion.pagados", resultado["pagados"])
+    logger.info("Conciliación de pagos: %s", resultado)
+    return resultado
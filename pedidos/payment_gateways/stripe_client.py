@@ -0,0 +1,143 @@
+"""
+Cliente de Stripe compartido por el proceso.
+
+Una sola instancia de ``stripe.StripeClient`` con tiempos de espera explícitos y reintentos de red (Stripe añade la clave de idempotencia a los POST
+reintentados). El cliente HTTP de Stripe guarda una ``requests.Session`` por hilo, así
+que cada hilo reutiliza sus conexiones sin compartir una sesión, que no es segura entre
+hilos. Un cortacircuitos evita que los trabajadores se queden esperando cuando
+Stripe no responde: tras varios fallos seguidos las llamadas fallan al instante durante
+un tiempo.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+try:
+    import stripe  # type: ignore
+except ImportError:  # pragma: no cover - entorno sin stripe instalado
+    stripe = None
+from django.conf import settings
+
+from tienda_virtual import metricas
+
+T = TypeVar("T")
+
+
+class CircuitoAbiertoError(Exception):
+    """Stripe se considera caído: la llamada no se ha intentado."""
+
+
+class Cortacircuitos:
+    def __init__(self, umbral: int, espera: float):
+        self.umbral = umbral
+        self.espera = espera
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        # Pasada la espera se deja pasar la llamada (semiabierto): si falla, vuelve a abrirse.
+        with self._lock:
+            return time.monotonic() >= self._abierto_hasta
+
+    def registrar_exito(self) -> None:
+        with self._lock:
+            self._fallos = 0
+            self._abierto_hasta = 0.0
+
+    def registrar_fallo(self) -> None:
+        with self._lock:
+            self._fallos += 1
+            if self._fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.espera
+                metricas.incrementar("stripe.circuito.aperturas")
+
+    @property
+    def abierto(self) -> bool:
+        return not self.permitir()
+
+
+_cliente = None
+_cortacircuitos: Optional[Cortacircuitos] = None
+_lock = threading.Lock()
+
+
+def obtener_cliente():
+    """Devuelve el cliente configurado; se crea en la primera llamada."""
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                _cliente = _crear_cliente()
+    return _cliente
+
+
+def _crear_cliente():
+    http_client = stripe.RequestsClient(
+        timeout=(
+            getattr(settings, "STRIPE_TIMEOUT_CONEXION", 3),
+            getattr(settings, "STRIPE_TIMEOUT_LECTURA", 10),
+        ),
+    )
+    base_api = getattr(settings, "STRIPE_API_BASE", "")
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        stripe_version=getattr(settings, "STRIPE_API_VERSION", "") or None,
+        base_addresses={"api": base_api} if base_api else {},
+        max_network_retries=getattr(settings, "STRIPE_MAX_REINTENTOS", 2),
+        http_client=http_client,
+    )
+
+
+def obtener_cortacircuitos() -> Cortacircuitos:
+    global _cortacircuitos
+    if _cortacircuitos is None:
+        with _lock:
+            if _cortacircuitos is None:
+                _cortacircuitos = Cortacircuitos(
+                    umbral=getattr(settings, "STRIPE_CIRCUITO_UMBRAL", 5),
+                    espera=getattr(settings, "STRIPE_CIRCUITO_ESPERA", 30),
+                )
+    return _cortacircuitos
+
+
+def reiniciar() -> None:
+    """Descarta el cliente y el estado del cortacircuitos (cambios de ajustes y pruebas)."""
+    global _cliente, _cortacircuitos
+    with _lock:
+        _cliente = None
+        _cortacircuitos = None
+
+
+def _es_fallo_de_servicio(exc: Exception) -> bool:
+    # Solo cuentan los fallos de Stripe o de la red; un error de tarjeta o de parámetros no.
+    if isinstance(exc, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return isinstance(exc, stripe.APIError) and (exc.http_status or 500) >= 500
+
+
+def llamar(operacion: str, funcion: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Ejecuta una llamada a Stripe a través del cortacircuitos y registra su latencia en
+    ``stripe.<operacion>``.
+    """
+    circuito = obtener_cortacircuitos()
+    if not circuito.permitir():
+        metricas.incrementar(f"stripe.{operacion}.rechazadas")
+        raise CircuitoAbiertoError(f"Stripe no disponible; se omite {operacion}.")
+
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion(*args, **kwargs)
+    except Exception as exc:
+        if _es_fallo_de_servicio(exc):
+            circuito.registrar_fallo()
+        metricas.incrementar(f"stripe.{operacion}.errores")
+        raise
+    finally:
+        metricas.registrar_duracion(f"stripe.{operacion}", time.perf_counter() - inicio)
+    circuito.registrar_exito()
+    return resultado
@@ -0,0 +1,245 @@
+"""
+Sustituto local de la API de Stripe para pruebas de integración y de carga.
+
+Implementa los endpoints de PaymentIntent que usa ``stripe_gateway`` (crear, consultar,
+listar, actualizar y confirmar) y firma los webhooks con el mismo esquema que Stripe, así
+que el webhook real los acepta con ``STRIPE_WEBHOOK_SECRET``. Se arranca con el comando
+``stripe_falso`` y se usa apuntando ``STRIPE_API_BASE`` a su dirección.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def firmar(payload: bytes, secreto: str, marca_tiempo: Optional[int] = None) -> str:
+    """Cabecera ``Stripe-Signature`` para ``payload``."""
+    marca_tiempo = marca_tiempo or int(time.time())
+    firmado = f"{marca_tiempo}.".encode() + payload
+    firma = hmac.new(secreto.encode(), firmado, hashlib.sha256).hexdigest()
+    return f"t={marca_tiempo},v1={firma}"
+
+
+def _parametros_anidados(cuerpo: str) -> Dict[str, Any]:
+    """Convierte ``metadata[pedido_id]=1`` en ``{"metadata": {"pedido_id": "1"}}``."""
+    resultado: Dict[str, Any] = {}
+    for clave, valor in parse_qsl(cuerpo, keep_blank_values=True):
+        partes = clave.replace("]", "").split("[")
+        destino = resultado
+        for parte in partes[:-1]:
+            destino = destino.setdefault(parte, {})
+        destino[partes[-1]] = valor
+    return resultado
+
+
+class ServidorStripeFalso:
+    """
+    Servidor HTTP en un hilo. ``latencia`` (segundos) se añade a cada respuesta y
+    ``tasa_fallos`` (0-1) es la probabilidad de responder con un 500.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        puerto: int = 0,
+        *,
+        latencia: float = 0.0,
+        tasa_fallos: float = 0.0,
+        secreto_webhook: str = "",
+        url_webhook: str = "",
+    ):
+        self.latencia = latencia
+        self.tasa_fallos = tasa_fallos
+        self.secreto_webhook = secreto_webhook
+        self.url_webhook = url_webhook
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        self.peticiones = 0
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._servidor = ThreadingHTTPServer((host, puerto), self._crear_manejador())
+        self._servidor.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def iniciar(self) -> "ServidorStripeFalso":
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def servir(self) -> None:
+        self._servidor.serve_forever()
+
+    def detener(self) -> None:
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    # --- PaymentIntents ---------------------------------------------------------------
+
+    def crear_intent(self, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        intent_id = f"pi_{uuid.uuid4().hex[:24]}"
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(parametros.get("amount", 0)),
+            "currency": parametros.get("currency", "eur"),
+            "description": parametros.get("description", ""),
+            "metadata": parametros.get("metadata", {}),
+            "status": "requires_payment_method",
+            "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:16]}",
+            "latest_charge": None,
+            "created": int(time.time()),
+        }
+        with self._lock:
+            self.intents[intent_id] = intent
+        return intent
+
+    def listar_intents(self, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        """Lista por ventana de ``created``, de más reciente a más antiguo, como Stripe."""
+        creado = parametros.get("created", {})
+        limite = min(int(parametros.get("limit", 10)), 100)
+        with self._lock:
+            intents = sorted(self.intents.values(), key=lambda i: (i["created"], i["id"]), reverse=True)
+        if "gte" in creado:
+            intents = [i for i in intents if i["created"] >= int(creado["gte"])]
+        if "lte" in creado:
+            intents = [i for i in intents if i["created"] <= int(creado["lte"])]
+        if parametros.get("starting_after"):
+            ids = [i["id"] for i in intents]
+            if parametros["starting_after"] in ids:
+                intents = intents[ids.index(parametros["starting_after"]) + 1:]
+        return {
+            "object": "list",
+            "url": "/v1/payment_intents",
+            "data": intents[:limite],
+            "has_more": len(intents) > limite,
+        }
+
+    def confirmar_intent(self, intent_id: str) -> Optional[Dict[str, Any]]:
+        """Simula que el cliente completa el pago y emite ``payment_intent.succeeded``."""
+        with self._lock:
+            intent = self.intents.get(intent_id)
+            if intent is None:
+                return None
+            intent["status"] = "succeeded"
+            intent["latest_charge"] = f"ch_{uuid.uuid4().hex[:24]}"
+            copia = dict(intent)
+        self.emitir_webhook("payment_intent.succeeded", copia)
+        return copia
+
+    # --- Webhooks ---------------------------------------------------------------------
+
+    def evento_firmado(self, tipo: str, objeto: Dict[str, Any]) -> Tuple[bytes, str]:
+        evento = {
+            "id": f"evt_{uuid.uuid4().hex[:24]}",
+            "object": "event",
+            "type": tipo,
+            "created": int(time.time()),
+            "data": {"object": objeto},
+        }
+        payload = json.dumps(evento).encode()
+        return payload, firmar(payload, self.secreto_webhook)
+
+    def emitir_webhook(self, tipo: str, objeto: Dict[str, Any]) -> None:
+        if not self.url_webhook:
+            return
+        payload, firma = self.evento_firmado(tipo, objeto)
+        peticion = urllib.request.Request(
+            self.url_webhook,
+            data=payload,
+            headers={"Content-Type": "application/json", "Stripe-Signature": firma},
+        )
+
+        def enviar():
+            try:
+                urllib.request.urlopen(peticion, timeout=10).close()
+            except Exception:
+                logger.exception("No se pudo entregar el webhook %s", tipo)
+
+        threading.Thread(target=enviar, daemon=True).start()
+
+    # --- HTTP -------------------------------------------------------------------------
+
+    def _crear_manejador(self):
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def log_message(self, formato, *args):
+                logger.debug("stripe_falso: " + formato, *args)
+
+            def _responder(self, estado: int, cuerpo: Dict[str, Any]) -> None:
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(estado)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _error(self, estado: int, tipo: str, mensaje: str) -> None:
+                self._responder(estado, {"error": {"type": tipo, "message": mensaje}})
+
+            def _preparar(self) -> bool:
+                with servidor._lock:
+                    servidor.peticiones += 1
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                if servidor.tasa_fallos and random.random() < servidor.tasa_fallos:
+                    self._error(500, "api_error", "Fallo inyectado por stripe_falso.")
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._preparar():
+                    return
+                ruta = urlparse(self.path)
+                partes = ruta.path.strip("/").split("/")
+                if partes == ["v1", "payment_intents"]:
+                    return self._responder(200, servidor.listar_intents(_parametros_anidados(ruta.query)))
+                if len(partes) == 3 and partes[:2] == ["v1", "payment_intents"]:
+                    intent = servidor.intents.get(partes[2])
+                    if intent is None:
+                        return self._error(404, "invalid_request_error", "No such payment_intent.")
+                    return self._responder(200, intent)
+                self._error(404, "invalid_request_error", "Ruta no implementada.")
+
+            def do_POST(self):
+                if not self._preparar():
+                    return
+                longitud = int(self.headers.get("Content-Length") or 0)
+                parametros = _parametros_anidados(self.rfile.read(longitud).decode())
+                partes = urlparse(self.path).path.strip("/").split("/")
+                if partes[:2] != ["v1", "payment_intents"]:
+                    return self._error(404, "invalid_request_error", "Ruta no implementada.")
+
+                if len(partes) == 2:
+                    return self._responder(200, servidor.crear_intent(parametros))
+                intent = servidor.intents.get(partes[2])
+                if intent is None:
+                    return self._error(404, "invalid_request_error", "No such payment_intent.")
+                if len(partes) == 4 and partes[3] == "confirm":
+                    return self._responder(200, servidor.confirmar_intent(partes[2]))
+                if len(partes) == 3:
+                    with servidor._lock:
+                        if "amount" in parametros:
+                            intent["amount"] = int(parametros["amount"])
+                        intent["metadata"].update(parametros.get("metadata", {}))
+                    return self._responder(200, intent)
+                self._error(404, "invalid_request_error", "Ruta no implementada.")
+
+        return Manejador
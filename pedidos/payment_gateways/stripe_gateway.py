@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import logging
+from dataclasses import dataclass
 from decimal import Decimal
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional, Union
 
 try:
     import stripe  # type: ignore
 except ImportError:  # pragma: no cover - entorno sin stripe instalado
     stripe = None
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 
-from pedidos.models import Pedido
+from pedidos.models import EventoStripe, Pedido
+from pedidos.payment_gateways import stripe_client
 from pedidos.services import disparar_confirmacion_pedido
+from pedidos.signals import emitir_cambio_estado
+from tienda_virtual import metricas
 
 logger = logging.getLogger(__name__)
 
@@ -24,48 +31,105 @@ def is_enabled() -> bool:
     return bool(stripe and settings.STRIPE_SECRET_KEY and settings.STRIPE_PUBLISHABLE_KEY)
 
 
-def _configure_stripe() -> None:
+def _cliente():
     if not settings.STRIPE_SECRET_KEY:
         raise StripeGatewayError("Falta configurar STRIPE_SECRET_KEY.")
+    return stripe_client.obtener_cliente()
 
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    if getattr(settings, "STRIPE_API_VERSION", ""):
-        stripe.api_version = settings.STRIPE_API_VERSION
+
+MENSAJE_STRIPE_NO_DISPONIBLE = (
+    "El pago con tarjeta no está disponible en este momento. Inténtalo de nuevo en unos minutos."
+)
 
 
 def _amount_to_cents(amount: Decimal) -> int:
     return int(Decimal(amount).quantize(Decimal("0.01")) * 100)
 
 
-def ensure_payment_intent(pedido: Pedido) -> stripe.PaymentIntent:
+@dataclass(frozen=True)
+class IntentLocal:
+    """Datos del PaymentIntent guardados en el pedido; lo que necesita la plantilla de pago."""
+
+    id: str
+    amount: int
+    status: str
+    client_secret: str
+
+
+# Estados en los que el client_secret guardado ya no sirve para cobrar.
+ESTADOS_INTENT_NO_REUTILIZABLES = {"canceled"}
+
+
+def _intent_en_cache(pedido: Pedido, amount: int) -> Optional[IntentLocal]:
+    if not (pedido.stripe_payment_intent_id and pedido.stripe_client_secret):
+        return None
+    if pedido.stripe_importe_centimos != amount:
+        return None
+    if pedido.stripe_payment_status in ESTADOS_INTENT_NO_REUTILIZABLES:
+        return None
+    return IntentLocal(
+        id=pedido.stripe_payment_intent_id,
+        amount=amount,
+        status=pedido.stripe_payment_status,
+        client_secret=pedido.stripe_client_secret,
+    )
+
+
+def ensure_payment_intent(pedido: Pedido) -> Union[IntentLocal, stripe.PaymentIntent]:
+    """
+    Devuelve el PaymentIntent del pedido. Si la copia local coincide con el importe actual
+    se usa sin llamar a Stripe; solo se consulta la API al crear el intent, cuando cambia el
+    importe o cuando el intent guardado ya no admite pagos.
+    """
     if stripe is None:
         raise StripeGatewayError("Stripe no está instalado en este entorno.")
     if not is_enabled():
         raise StripeGatewayError("Stripe no está habilitado en este entorno.")
 
-    _configure_stripe()
     amount = _amount_to_cents(pedido.total)
+    local = _intent_en_cache(pedido, amount)
+    if local is not None:
+        metricas.incrementar("stripe.intent.cache_aciertos")
+        return local
+    metricas.incrementar("stripe.intent.cache_fallos")
+
+    cliente = _cliente()
     intent: Optional[stripe.PaymentIntent] = None
 
     try:
         if pedido.stripe_payment_intent_id:
-            intent = stripe.PaymentIntent.retrieve(pedido.stripe_payment_intent_id)
+            intent = stripe_client.llamar(
+                "payment_intents.retrieve", cliente.payment_intents.retrieve, pedido.stripe_payment_intent_id
+            )
             if intent.amount != amount:
-                intent = stripe.PaymentIntent.modify(intent.id, amount=amount)
+                intent = stripe_client.llamar(
+                    "payment_intents.update",
+                    cliente.payment_intents.update,
+                    intent.id,
+                    params={"amount": amount},
+                )
         else:
-            intent = stripe.PaymentIntent.create(
-                amount=amount,
-                currency=getattr(settings, "STRIPE_DEFAULT_CURRENCY", "eur"),
-                description=f"Pedido {pedido.numero_pedido}",
-                metadata={
-                    "pedido_id": str(pedido.pk),
-                    "numero_pedido": pedido.numero_pedido,
+            intent = stripe_client.llamar(
+                "payment_intents.create",
+                cliente.payment_intents.create,
+                params={
+                    "amount": amount,
+                    "currency": getattr(settings, "STRIPE_DEFAULT_CURRENCY", "eur"),
+                    "description": f"Pedido {pedido.numero_pedido}",
+                    "metadata": {
+                        "pedido_id": str(pedido.pk),
+                        "numero_pedido": pedido.numero_pedido,
+                    },
+                    "automatic_payment_methods": {"enabled": True},
                 },
-                automatic_payment_methods={"enabled": True},
+                # Si se perdió la respuesta, repetir la creación devuelve el mismo intent.
+                options={"idempotency_key": f"pedido-{pedido.pk}-payment-intent"},
             )
             pedido.stripe_payment_intent_id = intent.id
             pedido.save(update_fields=["stripe_payment_intent_id"])
-    except stripe.error.StripeError as exc:
+    except stripe_client.CircuitoAbiertoError as exc:
+        raise StripeGatewayError(MENSAJE_STRIPE_NO_DISPONIBLE) from exc
+    except stripe.StripeError as exc:
         logger.exception("Error creando PaymentIntent de Stripe: %s", exc.user_message or str(exc))
         raise StripeGatewayError(exc.user_message or "No se pudo crear el pago en Stripe.") from exc
 
@@ -76,6 +140,13 @@ def ensure_payment_intent(pedido: Pedido) -> stripe.PaymentIntent:
 
 
 def _sync_payment_state(pedido: Pedido, intent: stripe.PaymentIntent) -> None:
+    updates = aplicar_estado_intent(pedido, intent)
+    if updates:
+        pedido.save(update_fields=updates)
+
+
+def aplicar_estado_intent(pedido: Pedido, intent: stripe.PaymentIntent) -> list[str]:
+    """Copia en el pedido (sin guardar) el estado del intent y devuelve los campos cambiados."""
     updates: list[str] = []
     status = intent.status or ""
     if status != pedido.stripe_payment_status:
@@ -98,8 +169,17 @@ def _sync_payment_state(pedido: Pedido, intent: stripe.PaymentIntent) -> None:
         pedido.stripe_receipt_url = receipt_url
         updates.append("stripe_receipt_url")
 
-    if updates:
-        pedido.save(update_fields=updates)
+    # Los webhooks traen el intent completo: refrescan también la copia local.
+    amount = getattr(intent, "amount", None)
+    if amount is not None and amount != pedido.stripe_importe_centimos:
+        pedido.stripe_importe_centimos = amount
+        updates.append("stripe_importe_centimos")
+
+    client_secret = getattr(intent, "client_secret", None) or ""
+    if client_secret and client_secret != pedido.stripe_client_secret:
+        pedido.stripe_client_secret = client_secret
+        updates.append("stripe_client_secret")
+    return updates
 
 
 def _finalize_payment_success(
@@ -108,17 +188,19 @@ def _finalize_payment_success(
     if sync_state:
         _sync_payment_state(pedido, intent)
 
-    updates: list[str] = []
-    was_pending = pedido.estado == Pedido.Estados.PENDIENTE
-    if was_pending:
-        pedido.estado = Pedido.Estados.PROCESANDO
-        updates.append("estado")
+    if pedido.estado != Pedido.Estados.PENDIENTE:
+        return
 
-    if updates:
-        pedido.save(update_fields=updates)
-
-    if was_pending:
-        disparar_confirmacion_pedido(pedido)
+    # El cambio de estado y el correo de la bandeja de salida se confirman juntos; el
+    # UPDATE condicional evita un segundo correo si llegan dos confirmaciones a la vez.
+    with transaction.atomic():
+        actualizado = Pedido.objects.filter(
+            pk=pedido.pk, estado=Pedido.Estados.PENDIENTE
+        ).update(estado=Pedido.Estados.PROCESANDO)
+        pedido.estado = Pedido.Estados.PROCESANDO
+        if actualizado:
+            disparar_confirmacion_pedido(pedido)
+            emitir_cambio_estado([pedido.pk], Pedido.Estados.PROCESANDO)
 
 
 def construct_event(payload: bytes, signature: str) -> stripe.Event:
@@ -127,19 +209,18 @@ def construct_event(payload: bytes, signature: str) -> stripe.Event:
     if not settings.STRIPE_WEBHOOK_SECRET:
         raise StripeGatewayError("Falta configurar STRIPE_WEBHOOK_SECRET para procesar webhooks.")
 
-    _configure_stripe()
     try:
         return stripe.Webhook.construct_event(
             payload=payload,
             sig_header=signature,
             secret=settings.STRIPE_WEBHOOK_SECRET,
         )
-    except stripe.error.SignatureVerificationError as exc:
+    except stripe.SignatureVerificationError as exc:
         logger.warning("Firma de webhook inválida: %s", exc)
         raise StripeGatewayError("Firma de Stripe no válida.") from exc
 
 
-def handle_event(event: stripe.Event) -> bool:
+def handle_event(event: Mapping[str, Any]) -> bool:
     if stripe is None:
         raise StripeGatewayError("Stripe no está instalado en este entorno.")
     event_type = event.get("type")
@@ -157,6 +238,89 @@ def handle_event(event: stripe.Event) -> bool:
     return False
 
 
+def registrar_evento(event: Mapping[str, Any]) -> bool:
+    """
+    Guarda el evento ya verificado para procesarlo después. Devuelve False si era un
+    reenvío: el índice único sobre ``evento_id`` lo descarta sin consultas previas.
+    """
+    datos = event.to_dict_recursive() if hasattr(event, "to_dict_recursive") else dict(event)
+    data_object = (datos.get("data") or {}).get("object") or {}
+    payment_intent_id = ""
+    if data_object.get("object") == "payment_intent":
+        payment_intent_id = data_object.get("id", "")
+    elif isinstance(data_object.get("payment_intent"), str):
+        payment_intent_id = data_object["payment_intent"]
+
+    try:
+        with transaction.atomic():
+            EventoStripe.objects.create(
+                evento_id=datos["id"],
+                tipo=datos.get("type", ""),
+                payment_intent_id=payment_intent_id,
+                creado_stripe=datos.get("created") or 0,
+                payload=datos,
+            )
+    except IntegrityError:
+        metricas.incrementar("stripe.eventos.duplicados")
+        return False
+    metricas.incrementar("stripe.eventos.recibidos")
+    return True
+
+
+def procesar_eventos_pendientes(lote: int = 100) -> Dict[str, int]:
+    """
+    Procesa los eventos pendientes en el orden en que Stripe los creó. Si un evento falla,
+    los posteriores del mismo PaymentIntent esperan a la siguiente pasada para no aplicar
+    los cambios de estado desordenados.
+    """
+    max_intentos = getattr(settings, "STRIPE_EVENTOS_MAX_INTENTOS", 5)
+    resultado = {"procesados": 0, "ignorados": 0, "errores": 0}
+    bloqueados: set[str] = set()
+    pendientes = list(
+        EventoStripe.objects.filter(estado=EventoStripe.Estados.PENDIENTE)
+        .order_by("creado_stripe", "id")
+        .values_list("pk", "payment_intent_id")[:lote]
+    )
+    for evento_pk, payment_intent_id in pendientes:
+        if payment_intent_id and payment_intent_id in bloqueados:
+            continue
+        try:
+            with transaction.atomic():
+                # Otro trabajador puede haberlo procesado entre la lectura y este punto.
+                evento = (
+                    EventoStripe.objects.select_for_update()
+                    .filter(pk=evento_pk, estado=EventoStripe.Estados.PENDIENTE)
+                    .first()
+                )
+                if evento is None:
+                    continue
+                manejado = handle_event(evento.payload)
+                evento.estado = (
+                    EventoStripe.Estados.PROCESADO if manejado else EventoStripe.Estados.IGNORADO
+                )
+                evento.intentos += 1
+                evento.fecha_procesado = timezone.now()
+                evento.save(update_fields=["estado", "intentos", "fecha_procesado"])
+        except Exception as exc:
+            logger.exception("Error procesando el evento de Stripe %s", evento_pk)
+            resultado["errores"] += 1
+            if payment_intent_id:
+                bloqueados.add(payment_intent_id)
+            EventoStripe.objects.filter(pk=evento_pk).update(
+                intentos=F("intentos") + 1,
+                ultimo_error=f"{type(exc).__name__}: {exc}"[:2000],
+            )
+            # Agotados los intentos se aparta para no bloquear los eventos siguientes.
+            EventoStripe.objects.filter(pk=evento_pk, intentos__gte=max_intentos).update(
+                estado=EventoStripe.Estados.FALLIDO
+            )
+            continue
+        resultado["procesados" if manejado else "ignorados"] += 1
+
+    metricas.incrementar("stripe.eventos.procesados", resultado["procesados"])
+    return resultado
+
+
 def _get_pedido_from_intent(intent_data: Dict[str, Any]) -> Optional[Pedido]:
     metadata = intent_data.get("metadata", {}) or {}
     pedido_id = metadata.get("pedido_id")
@@ -211,10 +375,12 @@ def confirm_payment_intent(intent_id: str) -> bool:
     if not is_enabled():
         raise StripeGatewayError("Stripe no está habilitado en este entorno.")
 
-    _configure_stripe()
+    cliente = _cliente()
     try:
-        intent = stripe.PaymentIntent.retrieve(intent_id)
-    except stripe.error.StripeError as exc:
+        intent = stripe_client.llamar("payment_intents.retrieve", cliente.payment_intents.retrieve, intent_id)
+    except stripe_client.CircuitoAbiertoError as exc:
+        raise StripeGatewayError(MENSAJE_STRIPE_NO_DISPONIBLE) from exc
+    except stripe.StripeError as exc:
         logger.exception("Error consultando PaymentIntent %s: %s", intent_id, exc.user_message or str(exc))
         raise StripeGatewayError(exc.user_message or "No se pudo verificar el estado del pago.") from exc
 
@@ -10,7 +10,10 @@ from pedidos.payment_gateways import stripe_gateway
 
 @method_decorator(csrf_exempt, name="dispatch")
 class StripeWebhookView(View):
-    """Recibe eventos de Stripe para confirmar pagos."""
+    """
+    Recibe eventos de Stripe. Solo verifica la firma y guarda el evento: lo procesa la
+    tarea ``pedidos.procesar_eventos_stripe`` para responder a Stripe de inmediato.
+    """
 
     def post(self, request, *args, **kwargs):
         signature = request.META.get("HTTP_STRIPE_SIGNATURE", "")
@@ -19,11 +22,11 @@ class StripeWebhookView(View):
 
         try:
             event = stripe_gateway.construct_event(request.body, signature)
-            handled = stripe_gateway.handle_event(event)
         except stripe_gateway.StripeGatewayError as exc:
             return HttpResponse(str(exc), status=400)
 
-        return HttpResponse(status=200 if handled else 202)
+        stripe_gateway.registrar_evento(event)
+        return HttpResponse(status=200)
 
 
 @method_decorator(csrf_exempt, name="dispatch")
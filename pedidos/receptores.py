@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from pedidos import seguimiento
+from pedidos.eventos_seguimiento import central
+from pedidos.models import Pedido
+from pedidos.signals import estado_pedidos_cambiado
+
+
+@receiver(estado_pedidos_cambiado, dispatch_uid="pedidos.invalidar_seguimiento_estado")
+def invalidar_seguimiento_estado(sender, pedido_ids, estado, **kwargs):
+    seguimiento.invalidar_por_ids(pedido_ids)
+
+
+@receiver(estado_pedidos_cambiado, dispatch_uid="pedidos.publicar_estado_seguimiento")
+def publicar_estado_seguimiento(sender, pedido_ids, estado, **kwargs):
+    central.publicar(pedido_ids, estado)
+
+
+@receiver(post_save, sender=Pedido, dispatch_uid="pedidos.invalidar_seguimiento_guardado")
+def invalidar_seguimiento_guardado(sender, instance, created, **kwargs):
+    if created:
+        return
+    # Tras el commit, para que ninguna lectura concurrente vuelva a guardar el valor antiguo.
+    transaction.on_commit(lambda: seguimiento.invalidar([instance]))
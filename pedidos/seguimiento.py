@@ -0,0 +1,110 @@
+"""
+Caché de las páginas públicas de un pedido (seguimiento por token y detalle por número).
+
+El HTML no depende del usuario, así que se guarda ya renderizado junto con su ETag. Los
+refrescos repetidos se sirven desde la caché o, si el navegador envía ``If-None-Match``,
+con un 304 sin tocar la base de datos. Las entradas se borran cuando cambia el pedido
+(señal ``estado_pedidos_cambiado`` o ``post_save``) y caducan a los
+``PEDIDOS_SEGUIMIENTO_TTL`` segundos.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from pedidos.models import Pedido
+
+PLANTILLA_SEGUIMIENTO = "pedido/seguimiento.html"
+PLANTILLA_DETALLE = "pedidos/detalle_pedido_publico.html"
+
+Entrada = Dict[str, Any]
+
+
+def clave_seguimiento(tracking_token) -> str:
+    return f"pedidos:seguimiento:{tracking_token}"
+
+
+def clave_detalle(numero_pedido: str) -> str:
+    return f"pedidos:detalle_publico:{numero_pedido}"
+
+
+def _mask_phone(phone: str) -> str:
+    raw = (phone or "").strip()
+    if not raw:
+        return ""
+    digits = "".join(ch for ch in raw if ch.isdigit())
+    if len(digits) <= 4:
+        masked = "*" * len(digits)
+    else:
+        masked = "*" * (len(digits) - 4) + digits[-4:]
+    return masked
+
+
+def _entrada(pedido: Pedido, plantilla: str, contexto: Dict[str, Any]) -> Entrada:
+    html = render_to_string(plantilla, {"pedido": pedido, **contexto})
+    return {
+        "html": html,
+        "etag": hashlib.md5(html.encode("utf-8")).hexdigest(),
+        "cliente_id": pedido.cliente_id,
+    }
+
+
+def _cacheada(clave: str, cargar) -> Optional[Entrada]:
+    entrada = cache.get(clave)
+    if entrada is None:
+        entrada = cargar()
+        # Solo se guardan pedidos existentes: un número que aún no existe puede crearse.
+        if entrada is not None:
+            cache.set(clave, entrada, getattr(settings, "PEDIDOS_SEGUIMIENTO_TTL", 300))
+    return entrada
+
+
+def pagina_seguimiento(tracking_token) -> Optional[Entrada]:
+    try:
+        token_uuid = uuid.UUID(str(tracking_token))
+    except (ValueError, TypeError):
+        return None
+
+    def cargar():
+        pedido = (
+            Pedido.objects.prefetch_related("items__producto")
+            .filter(tracking_token=token_uuid)
+            .first()
+        )
+        if pedido is None:
+            return None
+        return _entrada(pedido, PLANTILLA_SEGUIMIENTO, {"masked_phone": _mask_phone(pedido.telefono)})
+
+    return _cacheada(clave_seguimiento(token_uuid), cargar)
+
+
+def pagina_detalle_publico(numero_pedido: str) -> Optional[Entrada]:
+    def cargar():
+        pedido = (
+            Pedido.objects.prefetch_related("items", "items__producto")
+            .filter(numero_pedido=numero_pedido)
+            .first()
+        )
+        return _entrada(pedido, PLANTILLA_DETALLE, {}) if pedido else None
+
+    return _cacheada(clave_detalle(numero_pedido), cargar)
+
+
+def invalidar(pedidos: Iterable[Pedido]) -> None:
+    claves = []
+    for pedido in pedidos:
+        claves += [clave_seguimiento(pedido.tracking_token), clave_detalle(pedido.numero_pedido)]
+    if claves:
+        cache.delete_many(claves)
+
+
+def invalidar_por_ids(pedido_ids: Iterable[int]) -> None:
+    invalidar(
+        Pedido.objects.filter(pk__in=list(pedido_ids)).only("tracking_token", "numero_pedido")
+    )
@@ -93,6 +93,23 @@ class PedidoCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError({"datos_cliente": _("Los invitados deben indicar sus datos.")})
         return attrs
 
+class CambioEstadoLoteSerializer(serializers.Serializer):
+    estado = serializers.ChoiceField(choices=Pedido.Estados.choices)
+    pedidos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, default=list,
+        help_text=_("Identificadores de los pedidos."),
+    )
+    numeros_pedido = serializers.ListField(
+        child=serializers.CharField(max_length=30), required=False, default=list,
+        help_text=_("Números de pedido, como alternativa a los identificadores."),
+    )
+
+    def validate(self, attrs):
+        if not attrs["pedidos"] and not attrs["numeros_pedido"]:
+            raise serializers.ValidationError(_("Indica al menos un pedido."))
+        return attrs
+
+
 class PedidoPublicSerializer(serializers.ModelSerializer):
     items = ItemPedidoSerializer(many=True, read_only=True)
 
@@ -1,25 +1,43 @@
 from __future__ import annotations
 
 import uuid
+import hashlib
 import logging
+import random
+import time
 from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, Iterable, Optional, Tuple, Set
+from typing import Callable, Dict, Iterable, Optional, Tuple, Set, TypeVar
 
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F, Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 
 from carrito.models import Carrito
-from pedidos.models import ItemPedido, Pedido
-from pedidos.emails import enviar_confirmacion_pedido as enviar_correo_confirmacion
+from pedidos.emails import destinatario_correo
+from pedidos.models import ClaveIdempotencia, CorreoPendiente, ItemPedido, Pedido
+from pedidos.signals import emitir_cambio_estado
+from productos import popularidad
 from productos.models import Producto, TallaProducto
+from tienda_virtual import metricas
 
 TWOPLACES = Decimal('0.01')
 User = get_user_model()
 logger = logging.getLogger(__name__)
+T = TypeVar('T')
+
+# SQLSTATE de PostgreSQL para fallos de serializacion y deadlocks.
+CODIGOS_REINTENTABLES = {'40001', '40P01'}
+
+
+class ConflictoIdempotencia(APIException):
+    status_code = 422
+    default_detail = 'La clave de idempotencia ya se uso con una peticion distinta.'
+    default_code = 'idempotency_key_reused'
 
 
 def generar_numero_pedido() -> str:
@@ -93,11 +111,172 @@ def _obtener_talla_map(claves: Set[Tuple[int, str]]):
     tallas = TallaProducto.objects.select_for_update().filter(
         producto_id__in=producto_ids,
         talla__in=[talla for _, talla in claves],
-    )
+    ).order_by('pk')
     return {(talla.producto_id, talla.talla): talla for talla in tallas}
 
 
+def _agrupar_por_cantidad(cantidades: Dict[int, int]) -> Dict[int, list]:
+    grupos = defaultdict(list)
+    for pk, cantidad in cantidades.items():
+        grupos[cantidad].append(pk)
+    return grupos
+
+
+def _descontar_stock(producto_cantidades: Dict[int, int], talla_cantidades: Dict[int, int]) -> None:
+    """
+    Descuenta el stock con UPDATEs condicionales (uno por cantidad distinta, normalmente
+    uno o dos) en lugar de un save() por fila. La condicion ``stock >= cantidad`` protege
+    frente a stock negativo aunque las filas ya esten bloqueadas; si alguna fila no la
+    cumple, se aborta la transaccion.
+    """
+    for cantidad, pks in _agrupar_por_cantidad(producto_cantidades).items():
+        actualizados = Producto.objects.filter(pk__in=pks, stock__gte=cantidad).update(
+            stock=F('stock') - cantidad,
+            # Replica la derivacion de Producto.save sin cargar las filas.
+            esta_disponible=Q(stock__gt=cantidad),
+        )
+        if actualizados != len(pks):
+            raise ValidationError('El stock ha cambiado mientras se procesaba el pedido.')
+
+    for cantidad, pks in _agrupar_por_cantidad(talla_cantidades).items():
+        actualizados = TallaProducto.objects.filter(pk__in=pks, stock__gte=cantidad).update(
+            stock=F('stock') - cantidad,
+        )
+        if actualizados != len(pks):
+            raise ValidationError('El stock ha cambiado mientras se procesaba el pedido.')
+
+
+def _es_error_reintentable(exc: OperationalError) -> bool:
+    if getattr(exc.__cause__, 'pgcode', None) in CODIGOS_REINTENTABLES:
+        return True
+    mensaje = str(exc).lower()
+    return 'deadlock' in mensaje or 'could not serialize' in mensaje or 'database is locked' in mensaje
+
+
+def ejecutar_con_reintentos(funcion: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Ejecuta ``funcion`` (que abre su propia transaccion) reintentando ante deadlocks y
+    fallos de serializacion, con espera exponencial y jitter completo. Dentro de una
+    transaccion externa no se reintenta: la transaccion ya esta rota y debe abortarse.
+    """
+    max_intentos = max(1, int(getattr(settings, 'PEDIDOS_MAX_INTENTOS_TRANSACCION', 3)))
+    espera_base = float(getattr(settings, 'PEDIDOS_ESPERA_BASE_REINTENTO', 0.05))
+    if transaction.get_connection().in_atomic_block:
+        max_intentos = 1
+
+    intento = 1
+    while True:
+        try:
+            return funcion(*args, **kwargs)
+        except OperationalError as exc:
+            if not _es_error_reintentable(exc):
+                raise
+            if intento >= max_intentos:
+                metricas.incrementar('pedidos.transaccion.reintentos_agotados')
+                raise
+            espera = random.uniform(0, espera_base * (2 ** (intento - 1)))
+            metricas.incrementar('pedidos.transaccion.reintentos')
+            logger.warning(
+                'Conflicto de bloqueo en %s (intento %s/%s), reintentando en %.3fs: %s',
+                getattr(funcion, '__name__', funcion), intento, max_intentos, espera, exc,
+            )
+            time.sleep(espera)
+            intento += 1
+
+
+def huella_peticion(*partes) -> str:
+    """Resumen estable de la peticion para detectar claves reutilizadas con otro contenido."""
+    return hashlib.sha256('|'.join(str(parte) for parte in partes).encode('utf-8')).hexdigest()
+
+
+def _limite_idempotencia():
+    horas = float(getattr(settings, 'PEDIDOS_IDEMPOTENCIA_TTL_HORAS', 24))
+    return timezone.now() - timedelta(hours=horas)
+
+
+def buscar_pedido_idempotente(clave: str, huella: str) -> Optional[Pedido]:
+    """Devuelve el pedido ya creado con ``clave`` (si sigue vigente) sin repetir la compra."""
+    registro = (
+        ClaveIdempotencia.objects
+        .filter(clave=clave, fecha_creacion__gte=_limite_idempotencia())
+        .only('huella', 'pedido_id')
+        .first()
+    )
+    if not registro:
+        return None
+    if registro.huella != huella:
+        raise ConflictoIdempotencia()
+    return (
+        Pedido.objects
+        .select_related('cliente')
+        .prefetch_related('items__producto')
+        .get(pk=registro.pedido_id)
+    )
+
+
+def guardar_respuesta_idempotente(clave: str, respuesta: Dict) -> None:
+    """Guarda la respuesta que recibio la peticion que creo el pedido con ``clave``."""
+    ClaveIdempotencia.objects.filter(clave=clave).update(respuesta=respuesta)
+
+
+def respuesta_idempotente(clave: str) -> Optional[Dict]:
+    """Respuesta original guardada para ``clave``, si la peticion original ya la registro."""
+    return ClaveIdempotencia.objects.filter(clave=clave).values_list('respuesta', flat=True).first()
+
+
+def purgar_claves_idempotencia(lote: int = 1000) -> int:
+    """Elimina por lotes las claves caducadas. Devuelve cuantas se borraron."""
+    limite = _limite_idempotencia()
+    borradas = 0
+    while True:
+        ids = list(
+            ClaveIdempotencia.objects.filter(fecha_creacion__lt=limite).values_list('pk', flat=True)[:lote]
+        )
+        if not ids:
+            return borradas
+        borradas += ClaveIdempotencia.objects.filter(pk__in=ids).delete()[0]
+
+
 def crear_pedido_desde_carrito(usuario: Optional[User], datos_compra: Dict) -> Pedido:
+    """
+    Crea el pedido a partir del carrito. Si ``datos_compra`` incluye ``clave_idempotencia``
+    (y su ``huella_idempotencia``), una repeticion con la misma clave devuelve el pedido
+    original sin volver a ejecutar la transaccion ni descontar stock.
+    """
+    return crear_pedido_idempotente(usuario, datos_compra)[0]
+
+
+def crear_pedido_idempotente(usuario: Optional[User], datos_compra: Dict) -> Tuple[Pedido, bool]:
+    """
+    Igual que ``crear_pedido_desde_carrito``, pero indica ademas si el pedido se creo en
+    esta llamada (``True``) o es la repeticion de una clave ya atendida (``False``).
+    """
+    clave = datos_compra.get('clave_idempotencia')
+    huella = datos_compra.get('huella_idempotencia', '')
+    if clave:
+        pedido_previo = buscar_pedido_idempotente(clave, huella)
+        if pedido_previo:
+            return pedido_previo, False
+
+    try:
+        pedido = ejecutar_con_reintentos(_crear_pedido_en_transaccion, usuario, datos_compra)
+    except (IntegrityError, ValidationError):
+        # Una peticion concurrente con la misma clave pudo confirmar primero
+        # (o vaciar ya el carrito): en ese caso se devuelve su pedido.
+        pedido_previo = buscar_pedido_idempotente(clave, huella) if clave else None
+        if not pedido_previo:
+            raise
+        return pedido_previo, False
+
+    return (
+        Pedido.objects
+        .select_related('cliente')
+        .prefetch_related('items__producto')
+        .get(pk=pedido.pk)
+    ), True
+
+
+def _crear_pedido_en_transaccion(usuario: Optional[User], datos_compra: Dict) -> Pedido:
     datos = datos_compra.copy()
     carrito = _resolver_carrito(usuario, datos)
 
@@ -118,7 +297,9 @@ def crear_pedido_desde_carrito(usuario: Optional[User], datos_compra: Dict) -> P
     producto_ids = [item.producto_id for item in items_carrito]
 
     with transaction.atomic():
-        productos = Producto.objects.select_for_update().filter(id__in=producto_ids)
+        # Bloqueos siempre en orden de clave primaria (productos y despues tallas) para que
+        # dos carritos con referencias comunes no puedan bloquearse mutuamente.
+        productos = Producto.objects.select_for_update().filter(id__in=producto_ids).order_by('pk')
         producto_map = {producto.id: producto for producto in productos}
 
         talla_keys = {
@@ -191,6 +372,15 @@ def crear_pedido_desde_carrito(usuario: Optional[User], datos_compra: Dict) -> P
             telefono=telefono,
         )
 
+        clave = datos.get('clave_idempotencia')
+        if clave:
+            ClaveIdempotencia.objects.filter(clave=clave, fecha_creacion__lt=_limite_idempotencia()).delete()
+            ClaveIdempotencia.objects.create(
+                clave=clave,
+                huella=datos.get('huella_idempotencia', ''),
+                pedido=pedido,
+            )
+
         ItemPedido.objects.bulk_create(
             [
                 ItemPedido(
@@ -205,51 +395,161 @@ def crear_pedido_desde_carrito(usuario: Optional[User], datos_compra: Dict) -> P
             ]
         )
 
-        for producto_id, cantidad in producto_cantidades.items():
-            producto = producto_map[producto_id]
-            producto.stock -= cantidad
-            producto.save()
+        _descontar_stock(
+            producto_cantidades,
+            {talla_map[clave].pk: cantidad for clave, cantidad in talla_cantidades.items()},
+        )
 
-        for (producto_id, talla), cantidad in talla_cantidades.items():
-            talla_obj = talla_map.get((producto_id, talla))
-            if talla_obj:
-                talla_obj.stock -= cantidad
-                talla_obj.save()
+        unidades_vendidas: Dict[int, int] = defaultdict(int)
+        for item in items_precio:
+            unidades_vendidas[item['producto'].pk] += item['cantidad']
+        # Fuera de la transacción del checkout: la popularidad bloquea su época el tiempo
+        # de un UPDATE y un fallo ahí no debe deshacer el pedido.
+        fecha_pedido = pedido.fecha_creacion
+        transaction.on_commit(
+            lambda: popularidad.sumar_ventas(unidades_vendidas, fecha_pedido), robust=True
+        )
 
         carrito.items.all().delete()
         carrito.fecha_actualizacion = timezone.now()
         carrito.save(update_fields=['fecha_actualizacion'])
 
-    pedido_refrescado = (
-        Pedido.objects
-        .select_related('cliente')
-        .prefetch_related('items__producto')
-        .get(pk=pedido.pk)
-    )
-    if pedido_refrescado.metodo_pago != Pedido.MetodosPago.TARJETA:
-        disparar_confirmacion_pedido(pedido_refrescado)
-    return pedido_refrescado
-
+        # Con tarjeta la confirmacion se encola cuando Stripe confirma el cobro.
+        if metodo_pago != Pedido.MetodosPago.TARJETA:
+            disparar_confirmacion_pedido(pedido)
 
-def _destinatario_correo(pedido: Pedido) -> Optional[str]:
-    if pedido.email_contacto:
-        return pedido.email_contacto
-    if pedido.cliente and getattr(pedido.cliente, "email", ""):
-        return pedido.cliente.email
-    return None
+    return pedido
 
 
-def _notificar_confirmacion(pedido: Pedido) -> None:
-    destinatario = _destinatario_correo(pedido)
+def encolar_correo(pedido: Pedido, tipo: str) -> Optional[CorreoPendiente]:
+    """Registra el correo en la bandeja de salida; se envia fuera de la peticion."""
+    destinatario = destinatario_correo(pedido)
     if not destinatario:
         logger.warning("Pedido %s sin email de contacto para notificar.", pedido.pk)
-        return
-
-    enviado = enviar_correo_confirmacion(pedido, destinatario)
-    if not enviado:
-        logger.warning("No se pudo enviar la confirmación del pedido %s.", pedido.pk)
+        return None
+    return CorreoPendiente.objects.create(pedido=pedido, tipo=tipo, destinatario=destinatario)
+
+
+def encolar_correos(pedidos: Iterable[Pedido], tipo: str) -> int:
+    """Version por lotes de ``encolar_correo``: un solo INSERT para toda la tanda."""
+    correos = []
+    for pedido in pedidos:
+        destinatario = destinatario_correo(pedido)
+        if destinatario:
+            correos.append(CorreoPendiente(pedido=pedido, tipo=tipo, destinatario=destinatario))
+        else:
+            logger.warning("Pedido %s sin email de contacto para notificar.", pedido.pk)
+    CorreoPendiente.objects.bulk_create(correos)
+    return len(correos)
+
+
+# Estados del pedido que generan un aviso al cliente.
+NOTIFICACION_POR_ESTADO = {
+    Pedido.Estados.ENVIADO: CorreoPendiente.Tipos.ENVIADO,
+    Pedido.Estados.ENTREGADO: CorreoPendiente.Tipos.ENTREGADO,
+}
+
+
+def notificar_cambio_estado(pedidos: Iterable[Pedido], estado: str) -> int:
+    """Encola el aviso al cliente (si el estado lo tiene) y emite ``estado_pedidos_cambiado``."""
+    pedidos = list(pedidos)
+    emitir_cambio_estado([pedido.pk for pedido in pedidos], estado)
+    tipo = NOTIFICACION_POR_ESTADO.get(estado)
+    if tipo is None:
+        return 0
+    return encolar_correos(pedidos, tipo)
+
+
+# Estado de origen -> estados a los que puede pasar un pedido desde el panel o la API.
+TRANSICIONES_PERMITIDAS = {
+    Pedido.Estados.PENDIENTE: {Pedido.Estados.PROCESANDO, Pedido.Estados.ENVIADO, Pedido.Estados.CANCELADO},
+    Pedido.Estados.PROCESANDO: {Pedido.Estados.ENVIADO, Pedido.Estados.CANCELADO},
+    Pedido.Estados.ENVIADO: {Pedido.Estados.ENTREGADO},
+    Pedido.Estados.ENTREGADO: set(),
+    Pedido.Estados.CANCELADO: set(),
+}
+# Condiciones adicionales de algunas transiciones: un pedido con tarjeta pendiente aún no
+# está cobrado y no puede enviarse; uno contrareembolso sí.
+REQUISITOS_TRANSICION = {
+    (Pedido.Estados.PENDIENTE, Pedido.Estados.ENVIADO): {"metodo_pago": Pedido.MetodosPago.CONTRAREEMBOLSO},
+}
+MAX_PEDIDOS_POR_LOTE = 1000
+
+
+class ResultadosTransicion:
+    ACTUALIZADO = "actualizado"
+    SIN_CAMBIOS = "sin_cambios"
+    NO_PERMITIDA = "no_permitida"
+    NO_ENCONTRADO = "no_encontrado"
+    CONFLICTO = "conflicto"
+
+
+def transicion_permitida(pedido: Pedido, destino: str) -> bool:
+    if destino not in TRANSICIONES_PERMITIDAS.get(pedido.estado, ()):
+        return False
+    requisito = REQUISITOS_TRANSICION.get((pedido.estado, destino), {})
+    return all(getattr(pedido, campo) == valor for campo, valor in requisito.items())
+
+
+def cambiar_estado_pedidos(pedido_ids: Iterable[int], destino: str) -> list[dict]:
+    """
+    Pasa a ``destino`` los pedidos indicados con un UPDATE por estado de origen, encola
+    los avisos en bloque y devuelve el resultado de cada pedido en el orden recibido.
+    """
+    pedido_ids = list(dict.fromkeys(pedido_ids))
+    if len(pedido_ids) > MAX_PEDIDOS_POR_LOTE:
+        raise ValidationError(f"Como máximo {MAX_PEDIDOS_POR_LOTE} pedidos por petición.")
+    if destino not in TRANSICIONES_PERMITIDAS:
+        raise ValidationError(f"Estado desconocido: {destino}")
+
+    resultados: Dict[int, str] = {}
+    with transaction.atomic():
+        pedidos = {
+            pedido.pk: pedido
+            for pedido in Pedido.objects.select_for_update(of=("self",))
+            .select_related("cliente")
+            .filter(pk__in=pedido_ids)
+            .order_by()
+        }
+        por_origen: Dict[str, list] = defaultdict(list)
+        for pk in pedido_ids:
+            pedido = pedidos.get(pk)
+            if pedido is None:
+                resultados[pk] = ResultadosTransicion.NO_ENCONTRADO
+            elif pedido.estado == destino:
+                resultados[pk] = ResultadosTransicion.SIN_CAMBIOS
+            elif not transicion_permitida(pedido, destino):
+                resultados[pk] = ResultadosTransicion.NO_PERMITIDA
+            else:
+                por_origen[pedido.estado].append(pk)
+
+        actualizados = []
+        for origen, ids in por_origen.items():
+            requisito = REQUISITOS_TRANSICION.get((origen, destino), {})
+            cambiados = Pedido.objects.filter(pk__in=ids, estado=origen, **requisito).update(estado=destino)
+            if cambiados != len(ids):
+                # Sin bloqueo de filas (SQLite) otro proceso pudo adelantarse: se comprueba cuáles.
+                ids = list(Pedido.objects.filter(pk__in=ids, estado=destino).values_list("pk", flat=True))
+            for pk in ids:
+                pedidos[pk].estado = destino
+                actualizados.append(pedidos[pk])
+                resultados[pk] = ResultadosTransicion.ACTUALIZADO
+        for pk in (pk for ids in por_origen.values() for pk in ids):
+            resultados.setdefault(pk, ResultadosTransicion.CONFLICTO)
+
+        notificar_cambio_estado(actualizados, destino)
+
+    metricas.incrementar("pedidos.transiciones_lote", len(actualizados))
+    return [
+        {
+            "id": pk,
+            "numero_pedido": pedidos[pk].numero_pedido if pk in pedidos else None,
+            "resultado": resultados[pk],
+            "estado": pedidos[pk].estado if pk in pedidos else None,
+        }
+        for pk in pedido_ids
+    ]
 
 
 def disparar_confirmacion_pedido(pedido: Pedido) -> None:
-    _notificar_confirmacion(pedido)
-
+    encolar_correo(pedido, CorreoPendiente.Tipos.CONFIRMACION)
@@ -0,0 +1,37 @@
+"""
+Señales del ciclo de vida de los pedidos.
+
+``estado_pedidos_cambiado`` se emite una vez confirmada la transacción que cambió el
+estado, con ``pedido_ids`` (lista) y ``estado`` (el nuevo). Los cambios en bloque se
+notifican con una sola señal para que los receptores también trabajen por lotes.
+"""
+
+import logging
+from typing import Iterable
+
+from django.db import transaction
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+estado_pedidos_cambiado = Signal()
+
+
+def emitir_cambio_estado(pedido_ids: Iterable[int], estado: str) -> None:
+    pedido_ids = list(pedido_ids)
+    if not pedido_ids:
+        return
+
+    def enviar():
+        for receptor, resultado in estado_pedidos_cambiado.send_robust(
+            sender=None, pedido_ids=pedido_ids, estado=estado
+        ):
+            if isinstance(resultado, Exception):
+                logger.error(
+                    "Error en %r al procesar el cambio de estado de %s pedidos",
+                    receptor,
+                    len(pedido_ids),
+                    exc_info=resultado,
+                )
+
+    transaction.on_commit(enviar)
@@ -0,0 +1,33 @@
+from pedidos.emails import procesar_bandeja_salida
+from pedidos.payment_gateways import stripe_gateway
+from pedidos.payment_gateways.conciliacion import conciliar_pagos
+from pedidos.payment_gateways.stripe_gateway import procesar_eventos_pendientes
+from pedidos.services import purgar_claves_idempotencia
+from tareas.cola import tarea
+
+
+@tarea("pedidos.procesar_correos", cada=15)
+def procesar_correos(lote=100):
+    while True:
+        resultado = procesar_bandeja_salida(lote=lote)
+        if resultado["enviados"] + resultado["errores"] < lote:
+            return
+
+
+@tarea("pedidos.purgar_claves_idempotencia", cada=3600)
+def purgar_claves():
+    purgar_claves_idempotencia()
+
+
+@tarea("pedidos.procesar_eventos_stripe", cada=5)
+def procesar_eventos_stripe(lote=100):
+    while True:
+        resultado = procesar_eventos_pendientes(lote=lote)
+        if sum(resultado.values()) < lote:
+            return
+
+
+@tarea("pedidos.conciliar_pagos", cada=900)
+def conciliar():
+    if stripe_gateway.is_enabled():
+        conciliar_pagos()
@@ -1,12 +1,21 @@
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
 
 from carrito.models import Carrito, ItemCarrito
-from pedidos.models import Pedido
-from productos.models import Categoria, Marca, Producto
+from pedidos.models import ClaveIdempotencia, Pedido
+from pedidos.services import crear_pedido_desde_carrito, ejecutar_con_reintentos
+from productos.models import Categoria, Marca, Producto, TallaProducto
+from tienda_virtual import metricas
 
 
 class PedidoCreateAPITests(TestCase):
@@ -58,6 +67,74 @@ class PedidoCreateAPITests(TestCase):
         self.assertEqual(pedido.items.count(), 1)
         self.assertEqual(pedido.items.first().cantidad, 2)
 
+    def _payload_invitado(self):
+        return {
+            "metodo_pago": Pedido.MetodosPago.CONTRAREEMBOLSO,
+            "direccion_envio": "Calle API 123",
+            "telefono": "+34111222333",
+            "datos_cliente": {
+                "nombre": "Ana",
+                "apellidos": "Invitada",
+                "email": "ana@example.com",
+                "telefono": "+34111222333",
+                "direccion": "Calle API 123",
+                "ciudad": "Madrid",
+                "codigo_postal": "28080",
+            },
+        }
+
+    def test_idempotency_key_repetida_devuelve_el_mismo_pedido(self):
+        self._preparar_carrito()
+        url = reverse("pedidos:api-pedidos-create")
+        payload = self._payload_invitado()
+
+        primera = self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        segunda = self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda["Idempotent-Replayed"], "true")
+        self.assertEqual(primera.json(), segunda.json())
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 8)
+
+    def test_repeticion_devuelve_la_respuesta_original_aunque_cambie_el_pedido(self):
+        self._preparar_carrito()
+        url = reverse("pedidos:api-pedidos-create")
+        payload = self._payload_invitado()
+        primera = self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-3")
+        Pedido.objects.update(estado=Pedido.Estados.PROCESANDO)
+
+        segunda = self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-3")
+
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda.json()["estado"], Pedido.Estados.PENDIENTE)
+
+    def test_idempotency_key_con_otro_contenido_da_conflicto(self):
+        self._preparar_carrito()
+        url = reverse("pedidos:api-pedidos-create")
+        payload = self._payload_invitado()
+        self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+
+        payload["direccion_envio"] = "Otra calle"
+        response = self.api_client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="retry-2")
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_purga_solo_claves_caducadas(self):
+        self._preparar_carrito()
+        url = reverse("pedidos:api-pedidos-create")
+        self.api_client.post(url, self._payload_invitado(), format="json", HTTP_IDEMPOTENCY_KEY="vieja")
+        ClaveIdempotencia.objects.update(fecha_creacion=timezone.now() - timedelta(days=2))
+
+        call_command("purgar_claves_idempotencia", stdout=StringIO())
+
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertEqual(Pedido.objects.count(), 1)
+
     def test_api_rechaza_invitado_sin_datos_cliente(self):
         self._preparar_carrito()
         payload = {
@@ -129,3 +206,100 @@ class GuestCheckoutFlowTests(TestCase):
         self.assertEqual(Pedido.objects.count(), 1)
         self.assertIsNone(pedido.cliente)
         self.assertIn(pedido.numero_pedido, resp_confirm.content.decode())
+
+
+class DescuentoStockPedidoTests(TestCase):
+    def setUp(self):
+        marca = Marca.objects.create(nombre="Marca Stock")
+        categoria = Categoria.objects.create(nombre="Stock")
+        self.unico = Producto.objects.create(
+            nombre="Ultima unidad", precio=Decimal("20.00"), categoria=categoria, marca=marca, stock=1
+        )
+        self.varios = Producto.objects.create(
+            nombre="Varias unidades", precio=Decimal("30.00"), categoria=categoria, marca=marca, stock=5
+        )
+        self.con_talla = Producto.objects.create(
+            nombre="Con talla", precio=Decimal("40.00"), categoria=categoria, marca=marca, stock=5
+        )
+        self.talla = TallaProducto.objects.create(producto=self.con_talla, talla="40", stock=3)
+        self.carrito = Carrito.objects.create()
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.unico, cantidad=1)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.varios, cantidad=2)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.con_talla, talla="40", cantidad=2)
+
+    def _datos(self):
+        return {
+            "carrito": self.carrito,
+            "metodo_pago": Pedido.MetodosPago.TARJETA,
+            "direccion_envio": "Calle Stock 1",
+            "telefono": "600000000",
+        }
+
+    def test_descuenta_stock_general_y_por_talla(self):
+        pedido = crear_pedido_desde_carrito(None, self._datos())
+
+        self.assertEqual(pedido.items.count(), 3)
+        self.unico.refresh_from_db()
+        self.varios.refresh_from_db()
+        self.con_talla.refresh_from_db()
+        self.talla.refresh_from_db()
+        self.assertEqual(self.unico.stock, 0)
+        self.assertFalse(self.unico.esta_disponible)
+        self.assertEqual(self.varios.stock, 3)
+        self.assertTrue(self.varios.esta_disponible)
+        self.assertEqual(self.con_talla.stock, 5)
+        self.assertEqual(self.talla.stock, 1)
+        self.assertFalse(self.carrito.items.exists())
+
+    def test_suma_las_unidades_a_la_popularidad(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_pedido_desde_carrito(None, self._datos())
+
+        self.varios.refresh_from_db()
+        self.unico.refresh_from_db()
+        self.assertGreater(self.varios.popularidad, self.unico.popularidad)
+        self.assertGreater(self.unico.popularidad, 0)
+
+    def test_stock_insuficiente_no_crea_pedido(self):
+        TallaProducto.objects.filter(pk=self.talla.pk).update(stock=1)
+
+        with self.assertRaises(ValidationError):
+            crear_pedido_desde_carrito(None, self._datos())
+
+        self.assertFalse(Pedido.objects.exists())
+        self.varios.refresh_from_db()
+        self.assertEqual(self.varios.stock, 5)
+
+
+class ReintentosTransaccionTests(SimpleTestCase):
+    def setUp(self):
+        metricas.reiniciar()
+
+    @mock.patch("pedidos.services.time.sleep")
+    def test_reintenta_deadlock_y_registra_metrica(self, mock_sleep):
+        llamada = mock.Mock(side_effect=[OperationalError("deadlock detected"), "ok"])
+
+        resultado = ejecutar_con_reintentos(llamada)
+
+        self.assertEqual(resultado, "ok")
+        self.assertEqual(llamada.call_count, 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(metricas.instantanea()["contadores"]["pedidos.transaccion.reintentos"], 1)
+
+    @mock.patch("pedidos.services.time.sleep")
+    def test_reintentos_acotados(self, mock_sleep):
+        llamada = mock.Mock(side_effect=OperationalError("could not serialize access"))
+
+        with override_settings(PEDIDOS_MAX_INTENTOS_TRANSACCION=3):
+            with self.assertRaises(OperationalError):
+                ejecutar_con_reintentos(llamada)
+
+        self.assertEqual(llamada.call_count, 3)
+        self.assertEqual(metricas.instantanea()["contadores"]["pedidos.transaccion.reintentos_agotados"], 1)
+
+    def test_otros_errores_no_se_reintentan(self):
+        llamada = mock.Mock(side_effect=OperationalError("no such table"))
+
+        with self.assertRaises(OperationalError):
+            ejecutar_con_reintentos(llamada)
+        self.assertEqual(llamada.call_count, 1)
@@ -1,13 +1,23 @@
 from decimal import Decimal
+from io import StringIO
+import json
 import uuid
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 
 from productos.models import Producto, Marca, Categoria
-from pedidos.models import Pedido, ItemPedido
+from pedidos import exportacion, services
+from pedidos.models import CorreoPendiente, Pedido, ItemPedido
+from pedidos.eventos_seguimiento import central
+from pedidos.services import notificar_cambio_estado
+from pedidos.signals import estado_pedidos_cambiado
 from pedidos.checkout_views import DetallesEntregaForm, ConfirmacionCompraView
 
 User = get_user_model()
@@ -195,6 +205,7 @@ class DireccionFormateadaTests(TestCase):
 
 class SeguimientoPedidoViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         marca = Marca.objects.create(nombre="Tracking Brand")
         categoria = Categoria.objects.create(nombre="Tracking Shoes")
         producto = Producto.objects.create(
@@ -237,3 +248,235 @@ class SeguimientoPedidoViewTests(TestCase):
         url = reverse("seguimiento_pedido", args=[uuid.uuid4()])
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 404)
+
+    def test_refrescos_desde_cache_y_304_hasta_cambiar_el_estado(self):
+        url = reverse("seguimiento_pedido", args=[self.pedido.tracking_token])
+        etag = self.client.get(url)["ETag"]
+
+        # La caché compartida vive en la base de datos: solo se permiten sus lecturas.
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertTrue(all("cache_compartida" in c["sql"] for c in consultas.captured_queries))
+
+        Pedido.objects.filter(pk=self.pedido.pk).update(estado=Pedido.Estados.ENVIADO)
+        with self.captureOnCommitCallbacks(execute=True):
+            notificar_cambio_estado([self.pedido], Pedido.Estados.ENVIADO)
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Enviado")
+        self.assertNotEqual(resp["ETag"], etag)
+
+
+class SeguimientoEventosTests(TestCase):
+    def setUp(self):
+        self.pedido = Pedido.objects.create(
+            numero_pedido="SSE001",
+            estado=Pedido.Estados.PROCESANDO,
+            total=Decimal("10.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Eventos",
+            telefono="600000333",
+        )
+        self.url = reverse("seguimiento_eventos", args=[self.pedido.tracking_token])
+
+    async def test_envia_el_estado_actual_y_los_cambios_hasta_el_final(self):
+        respuesta = await self.async_client.get(self.url)
+        self.assertEqual(respuesta["Content-Type"], "text/event-stream")
+        flujo = aiter(respuesta.streaming_content)
+
+        self.assertIn('"estado": "procesando"', (await anext(flujo)).decode())
+        self.assertEqual(central.suscriptores(), 1)
+
+        self.assertEqual(central.publicar([self.pedido.pk, 999], Pedido.Estados.ENVIADO), 1)
+        self.assertIn('"texto": "Enviado"', (await anext(flujo)).decode())
+        central.publicar([self.pedido.pk], Pedido.Estados.ENTREGADO)
+        self.assertIn('"estado": "entregado"', (await anext(flujo)).decode())
+
+        with self.assertRaises(StopAsyncIteration):
+            await anext(flujo)
+        self.assertEqual(central.suscriptores(), 0)
+
+    async def test_token_desconocido_devuelve_404(self):
+        respuesta = await self.async_client.get(reverse("seguimiento_eventos", args=[uuid.uuid4()]))
+        self.assertEqual(respuesta.status_code, 404)
+
+
+class PedidoTrackingTokenTests(TestCase):
+    def setUp(self):
+        self.pedido = Pedido.objects.create(
+            numero_pedido="TOKEN001",
+            total=Decimal("10.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Token",
+            telefono="600000222",
+        )
+
+    def test_guardar_pedido_cargado_no_consulta_el_token(self):
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        pedido.stripe_payment_status = "processing"
+
+        with self.assertNumQueries(1):
+            pedido.save(update_fields=["stripe_payment_status"])
+        with self.assertNumQueries(1):
+            pedido.save()
+
+    def test_guardar_pedido_borrado_lo_vuelve_a_insertar(self):
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        token_original = pedido.tracking_token
+        Pedido.objects.filter(pk=pedido.pk).delete()
+
+        pedido.save()
+
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).tracking_token, token_original)
+
+    def test_token_no_cambia_aunque_se_modifique_en_memoria(self):
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        token_original = pedido.tracking_token
+        pedido.tracking_token = uuid.uuid4()
+        pedido.estado = Pedido.Estados.ENVIADO
+        pedido.save()
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.tracking_token, token_original)
+        self.assertEqual(pedido.estado, Pedido.Estados.ENVIADO)
+
+        pedido.tracking_token = uuid.uuid4()
+        pedido.save(update_fields=["tracking_token", "estado"])
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.tracking_token, token_original)
+
+
+class ExportacionPedidosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        producto = Producto.objects.create(
+            nombre="Botín Export",
+            precio=Decimal("30.00"),
+            categoria=Categoria.objects.create(nombre="Botines"),
+            marca=Marca.objects.create(nombre="Export"),
+        )
+        for indice in range(3):
+            pedido = Pedido.objects.create(
+                numero_pedido=f"EXP{indice}",
+                total=Decimal("60.00"),
+                metodo_pago=Pedido.MetodosPago.TARJETA,
+                direccion_envio="Calle Export",
+                telefono="600000000",
+            )
+            for talla in ("40", "41")[: indice]:
+                ItemPedido.objects.create(
+                    pedido=pedido,
+                    producto=producto,
+                    talla=talla,
+                    cantidad=1,
+                    precio_unitario=Decimal("30.00"),
+                    total=Decimal("30.00"),
+                )
+
+    def test_filas_por_paginas_de_pedidos(self):
+        filas = list(exportacion.filas_pedidos(lote=1))
+
+        self.assertEqual(
+            [(fila["numero_pedido"], fila["talla"]) for fila in filas],
+            [("EXP0", None), ("EXP1", "40"), ("EXP2", "40"), ("EXP2", "41")],
+        )
+
+    def test_comando_exporta_ndjson(self):
+        salida = StringIO()
+        call_command("exportar_pedidos", "--formato", "ndjson", "--lote", "2", stdout=salida)
+
+        filas = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual(len(filas), 4)
+        self.assertEqual(filas[-1]["total_linea"], "30.00")
+
+
+class CambioEstadoLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username="almacen", email="almacen@example.com", password="clave-segura", is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _pedido(self, numero, estado, metodo_pago=Pedido.MetodosPago.TARJETA):
+        return Pedido.objects.create(
+            numero_pedido=numero,
+            estado=estado,
+            total=Decimal("20.00"),
+            metodo_pago=metodo_pago,
+            direccion_envio="Calle Almacén",
+            telefono="600000444",
+            email_contacto=f"{numero.lower()}@example.com",
+        )
+
+    def test_un_update_por_estado_de_origen_y_avisos_en_bloque(self):
+        procesando = [self._pedido(f"LOTE{i}", Pedido.Estados.PROCESANDO) for i in range(3)]
+        contrareembolso = self._pedido("LOTE-CR", Pedido.Estados.PENDIENTE, Pedido.MetodosPago.CONTRAREEMBOLSO)
+        tarjeta_pendiente = self._pedido("LOTE-TP", Pedido.Estados.PENDIENTE)
+        entregado = self._pedido("LOTE-E", Pedido.Estados.ENTREGADO)
+        ids = [p.pk for p in procesando] + [contrareembolso.pk, tarjeta_pendiente.pk, entregado.pk, 999999]
+
+        # Savepoint, lectura con bloqueo, un UPDATE por origen, un INSERT de correos y release.
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks() as callbacks:
+            resultados = services.cambiar_estado_pedidos(ids, Pedido.Estados.ENVIADO)
+
+        self.assertEqual(
+            [r["resultado"] for r in resultados],
+            ["actualizado"] * 4 + ["no_permitida", "no_permitida", "no_encontrado"],
+        )
+        self.assertEqual(Pedido.objects.filter(estado=Pedido.Estados.ENVIADO).count(), 4)
+        self.assertEqual(
+            CorreoPendiente.objects.filter(tipo=CorreoPendiente.Tipos.ENVIADO).count(), 4
+        )
+        self.assertEqual(len(callbacks), 1)
+
+    def test_api_por_numero_de_pedido_solo_para_personal(self):
+        pedido = self._pedido("LOTE-API", Pedido.Estados.ENVIADO)
+        url = reverse("api-pedidos-estado")
+        datos = {"estado": Pedido.Estados.ENTREGADO, "numeros_pedido": ["LOTE-API", "NOEXISTE"]}
+
+        self.assertEqual(self.client.post(url, datos, format="json").status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        respuesta = self.client.post(url, datos, format="json")
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data["actualizados"], 1)
+        self.assertEqual(
+            [(r["numero_pedido"], r["resultado"]) for r in respuesta.data["resultados"]],
+            [("LOTE-API", "actualizado"), ("NOEXISTE", "no_encontrado")],
+        )
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.estado, Pedido.Estados.ENTREGADO)
+
+    def test_admin_cambia_el_estado_solo_con_acciones_que_emiten_la_senal(self):
+        admin = User.objects.create_superuser(username="raiz", email="raiz@example.com", password="clave-segura")
+        self.client.force_login(admin)
+        pedido = self._pedido("LOTE-ADM", Pedido.Estados.PENDIENTE, Pedido.MetodosPago.CONTRAREEMBOLSO)
+        entregado = self._pedido("LOTE-ADM-E", Pedido.Estados.ENTREGADO)
+
+        formulario = self.client.get(reverse("admin:pedidos_pedido_change", args=[pedido.pk]))
+        self.assertNotContains(formulario, 'name="estado"')
+
+        recibidas = []
+
+        def receptor(sender, pedido_ids, estado, **kwargs):
+            recibidas.append((list(pedido_ids), estado))
+
+        estado_pedidos_cambiado.connect(receptor, weak=False)
+        self.addCleanup(estado_pedidos_cambiado.disconnect, receptor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("admin:pedidos_pedido_changelist"),
+                {"action": "pasar_a_cancelado", "_selected_action": [pedido.pk, entregado.pk]},
+            )
+
+        pedido.refresh_from_db()
+        entregado.refresh_from_db()
+        self.assertEqual(pedido.estado, Pedido.Estados.CANCELADO)
+        self.assertEqual(entregado.estado, Pedido.Estados.ENTREGADO)
+        self.assertEqual(recibidas, [([pedido.pk], Pedido.Estados.CANCELADO)])
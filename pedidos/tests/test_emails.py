@@ -7,8 +7,9 @@ from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from productos.models import Producto, Marca, Categoria
-from pedidos.emails import enviar_confirmacion_pedido
-from pedidos.models import Pedido, ItemPedido
+from pedidos.emails import enviar_confirmacion_pedido, procesar_bandeja_salida
+from pedidos.models import CorreoPendiente, Pedido, ItemPedido
+from pedidos.services import notificar_cambio_estado
 
 User = get_user_model()
 
@@ -103,6 +104,7 @@ class CheckoutEmailFlowTests(TestCase):
             "codigo_postal": "41012",
             "pais": "Espana",
             "referencias": "Llamar al llegar",
+            "metodo_entrega": Pedido.MetodosEntrega.ESTANDAR,
         }
         resp = self.client.post(reverse("pedidos:checkout_entrega"), data)
         self.assertEqual(resp.status_code, 302)
@@ -123,10 +125,21 @@ class CheckoutEmailFlowTests(TestCase):
 
         resp = self.client.get(reverse("pedidos:checkout_confirmacion"))
         self.assertEqual(resp.status_code, 200)
+        # El checkout solo encola el correo; el envío ocurre fuera de la petición.
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(CorreoPendiente.objects.count(), 1)
+
+        resultado = procesar_bandeja_salida()
+        self.assertEqual(resultado["enviados"], 1)
         self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["lucia@example.com"])
+        self.assertEqual(CorreoPendiente.objects.get().estado, CorreoPendiente.Estados.ENVIADO)
 
     @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
-    @mock.patch("pedidos.emails.EmailMultiAlternatives.send", side_effect=Exception("SMTP down"))
+    @mock.patch(
+        "django.core.mail.backends.locmem.EmailBackend.send_messages",
+        side_effect=Exception("SMTP down"),
+    )
     def test_checkout_no_falla_si_el_email_da_error(self, mock_send):
         self._agregar_producto_al_carrito()
         self._completar_entrega()
@@ -134,5 +147,120 @@ class CheckoutEmailFlowTests(TestCase):
 
         resp = self.client.get(reverse("pedidos:checkout_confirmacion"))
         self.assertEqual(resp.status_code, 200)
+        self.assertFalse(mock_send.called)
+
+        resultado = procesar_bandeja_salida()
+        self.assertEqual(resultado["errores"], 1)
         self.assertEqual(len(mail.outbox), 0)
         self.assertTrue(mock_send.called)
+        correo = CorreoPendiente.objects.get()
+        self.assertEqual(correo.estado, CorreoPendiente.Estados.PENDIENTE)
+        self.assertEqual(correo.intentos, 1)
+        self.assertGreater(correo.proximo_intento, correo.fecha_creacion)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class BandejaSalidaTests(TestCase):
+    def setUp(self):
+        self.pedidos = [
+            Pedido.objects.create(
+                numero_pedido=f"OUTBOX{indice}",
+                total=Decimal("10.00"),
+                metodo_pago=Pedido.MetodosPago.CONTRAREEMBOLSO,
+                direccion_envio="Calle Bandeja",
+                telefono="600000000",
+                email_contacto=f"cliente{indice}@example.com",
+            )
+            for indice in range(3)
+        ]
+        for pedido in self.pedidos:
+            CorreoPendiente.objects.create(
+                pedido=pedido,
+                tipo=CorreoPendiente.Tipos.CONFIRMACION,
+                destinatario=pedido.email_contacto,
+            )
+
+    def test_envia_la_tanda_con_una_sola_conexion(self):
+        with mock.patch("pedidos.emails.get_connection", wraps=mail.get_connection) as mock_conexion:
+            resultado = procesar_bandeja_salida()
+
+        self.assertEqual(resultado, {"enviados": 3, "errores": 0})
+        self.assertEqual(mock_conexion.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(procesar_bandeja_salida(), {"enviados": 0, "errores": 0})
+
+    @override_settings(PEDIDOS_CORREO_MAX_INTENTOS=1)
+    @mock.patch(
+        "django.core.mail.backends.locmem.EmailBackend.send_messages",
+        side_effect=Exception("SMTP down"),
+    )
+    def test_agota_intentos_y_marca_fallido(self, mock_send):
+        procesar_bandeja_salida()
+
+        self.assertEqual(
+            CorreoPendiente.objects.filter(estado=CorreoPendiente.Estados.FALLIDO).count(), 3
+        )
+
+    def test_notificaciones_de_estado_pasan_por_la_bandeja(self):
+        CorreoPendiente.objects.all().delete()
+        self.assertEqual(notificar_cambio_estado(self.pedidos, Pedido.Estados.ENVIADO), 3)
+        self.assertEqual(notificar_cambio_estado(self.pedidos, Pedido.Estados.PROCESANDO), 0)
+
+        procesar_bandeja_salida()
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].subject, "Pedido OUTBOX0 enviado")
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class NotificacionesLoteTests(TestCase):
+    def setUp(self):
+        marca = Marca.objects.create(nombre="Lote")
+        categoria = Categoria.objects.create(nombre="Lote")
+        producto = Producto.objects.create(
+            nombre="Modelo <Lote> & Co",
+            precio=Decimal("30.00"),
+            categoria=categoria,
+            marca=marca,
+            stock=50,
+        )
+        self.pedidos = []
+        for indice in range(5):
+            pedido = Pedido.objects.create(
+                numero_pedido=f"LOTE{indice}",
+                estado=Pedido.Estados.ENVIADO,
+                total=Decimal("30.00"),
+                metodo_pago=Pedido.MetodosPago.TARJETA,
+                direccion_envio="Calle Lote",
+                telefono="600000000",
+                email_contacto=f"lote{indice}@example.com",
+            )
+            ItemPedido.objects.create(
+                pedido=pedido,
+                producto=producto,
+                cantidad=1,
+                precio_unitario=Decimal("30.00"),
+                total=Decimal("30.00"),
+            )
+            self.pedidos.append(pedido)
+
+    def test_envia_la_tanda_con_una_conexion_y_consultas_fijas(self):
+        notificar_cambio_estado(self.pedidos, Pedido.Estados.ENVIADO)
+
+        # Reserva (3), pedidos con líneas y productos (3) y marcado de enviados (1).
+        with mock.patch("pedidos.emails.get_connection", wraps=mail.get_connection) as mock_conexion:
+            with self.assertNumQueries(7):
+                resultado = procesar_bandeja_salida()
+
+        self.assertEqual(resultado, {"enviados": 5, "errores": 0})
+        self.assertEqual(mock_conexion.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_texto_plano_sale_de_su_plantilla(self):
+        notificar_cambio_estado(self.pedidos[:1], Pedido.Estados.ENVIADO)
+        procesar_bandeja_salida()
+
+        texto = mail.outbox[0].body
+        self.assertIn("Modelo <Lote> & Co", texto)
+        self.assertNotIn("<table", texto)
+        self.assertIn("&amp;", mail.outbox[0].alternatives[0][0])
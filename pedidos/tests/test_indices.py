@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+
+from carrito.models import Carrito, ItemCarrito
+from pedidos.models import Pedido
+from productos.models import Categoria, Marca, Producto, TallaProducto
+
+User = get_user_model()
+
+
+class PlanesConsultaTests(TestCase):
+    """Las consultas frecuentes deben resolverse con un índice, nunca recorriendo la tabla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username="indices", password="clave-segura")
+        cls.marca = Marca.objects.create(nombre="Índices")
+        cls.categoria = Categoria.objects.create(nombre="Índices")
+        cls.producto = Producto.objects.create(
+            nombre="Modelo Índices", precio=Decimal("10.00"), marca=cls.marca, categoria=cls.categoria, stock=5
+        )
+        cls.carrito = Carrito.objects.create(usuario=cls.usuario)
+
+    def _plan(self, queryset):
+        if connection.vendor == "postgresql":
+            # Con tablas casi vacías PostgreSQL prefiere recorrerlas: se pregunta si existe
+            # un plan con índice.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                return queryset.explain()
+        return queryset.explain()
+
+    def assertUsaIndice(self, queryset, indice=None):
+        plan = self._plan(queryset)
+        tabla = queryset.model._meta.db_table
+        if connection.vendor == "sqlite":
+            # Recorrer un índice en orden (``SCAN t USING INDEX``) sí vale para un listado
+            # ordenado con LIMIT; lo que no vale es leer la tabla u ordenarla aparte.
+            self.assertNotRegex(plan, rf"SCAN {tabla}(?! USING (COVERING )?INDEX)")
+            self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, plan)
+            if indice:
+                self.assertIn(f"USING INDEX {indice}", plan, plan)
+        elif connection.vendor == "postgresql":
+            self.assertNotIn(f"Seq Scan on {tabla}", plan, plan)
+
+    def test_consultas_frecuentes_usan_indice(self):
+        # Consulta -> índice que debe elegir SQLite (None: basta con que no recorra la tabla).
+        consultas = {
+            "listado del panel por estado": (
+                Pedido.objects.filter(estado=Pedido.Estados.ENVIADO).order_by("-fecha_creacion", "-id"),
+                "pedido_estado_fecha_idx",
+            ),
+            "pedidos de un cliente": (
+                Pedido.objects.filter(cliente=self.usuario).order_by("-fecha_creacion"),
+                "pedido_cliente_fecha_idx",
+            ),
+            "tallas al reservar stock": (
+                TallaProducto.objects.filter(producto_id__in=[self.producto.pk], talla__in=["41", "42"]),
+                "talla_producto_talla_idx",
+            ),
+            "talla de un producto": (self.producto.tallas.filter(talla="42"), "talla_producto_talla_idx"),
+            # Ya la cubre el índice único de (carrito, producto, talla).
+            "línea del carrito": (
+                ItemCarrito.objects.filter(carrito=self.carrito, producto=self.producto, talla="42"),
+                None,
+            ),
+            "carrito reciente del usuario": (
+                Carrito.objects.filter(usuario=self.usuario).order_by("-fecha_actualizacion", "-fecha_creacion"),
+                "carrito_usuario_fecha_idx",
+            ),
+            "catálogo por categoría": (
+                Producto.objects.filter(categoria=self.categoria, esta_disponible=True),
+                None,
+            ),
+            "catálogo por marca y precio": (
+                Producto.objects.filter(marca=self.marca).order_by("precio"),
+                "producto_marca_precio_idx",
+            ),
+            "catálogo más vendido": (
+                Producto.objects.order_by("-popularidad", "id")[:24],
+                "producto_popularidad_idx",
+            ),
+        }
+        for nombre, (queryset, indice) in consultas.items():
+            with self.subTest(nombre):
+                self.assertUsaIndice(queryset, indice)
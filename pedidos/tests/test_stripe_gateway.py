@@ -0,0 +1,307 @@
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from pedidos.models import CorreoPendiente, EventoStripe, Pedido
+from pedidos.payment_gateways import stripe_client, stripe_gateway
+from pedidos.payment_gateways.conciliacion import conciliar_pagos
+from pedidos.payment_gateways.stripe_falso import ServidorStripeFalso
+
+
+def _intent(**kwargs):
+    datos = {
+        "id": "pi_123",
+        "amount": 5000,
+        "status": "requires_payment_method",
+        "client_secret": "pi_123_secret_abc",
+        "latest_charge": None,
+        "charges": None,
+    }
+    datos.update(kwargs)
+    return SimpleNamespace(**datos)
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test", STRIPE_PUBLISHABLE_KEY="pk_test")
+class IntentEnCacheTests(TestCase):
+    def setUp(self):
+        self.pedido = Pedido.objects.create(
+            numero_pedido="STRIPE1",
+            total=Decimal("50.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Stripe",
+            telefono="600000000",
+        )
+
+    def tearDown(self):
+        stripe_client.reiniciar()
+
+    def _mock_cliente(self):
+        cliente = mock.Mock()
+        patcher = mock.patch.object(stripe_client, "obtener_cliente", return_value=cliente)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cliente.payment_intents
+
+    def test_recargar_la_confirmacion_no_llama_a_stripe(self):
+        mock_intent = self._mock_cliente()
+        mock_intent.create.return_value = _intent()
+
+        primero = stripe_gateway.ensure_payment_intent(self.pedido)
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        segundo = stripe_gateway.ensure_payment_intent(pedido)
+
+        self.assertEqual(mock_intent.create.call_count, 1)
+        mock_intent.retrieve.assert_not_called()
+        self.assertIsInstance(segundo, stripe_gateway.IntentLocal)
+        self.assertEqual(segundo.client_secret, primero.client_secret)
+        self.assertEqual(pedido.stripe_importe_centimos, 5000)
+
+    def test_cambio_de_importe_refresca_el_intent(self):
+        mock_intent = self._mock_cliente()
+        mock_intent.create.return_value = _intent()
+        stripe_gateway.ensure_payment_intent(self.pedido)
+
+        self.pedido.total = Decimal("60.00")
+        mock_intent.retrieve.return_value = _intent()
+        mock_intent.update.return_value = _intent(amount=6000, client_secret="pi_123_secret_def")
+        intent = stripe_gateway.ensure_payment_intent(self.pedido)
+
+        mock_intent.update.assert_called_once_with("pi_123", params={"amount": 6000})
+        self.assertEqual(intent.client_secret, "pi_123_secret_def")
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.stripe_importe_centimos, 6000)
+        self.assertEqual(self.pedido.stripe_client_secret, "pi_123_secret_def")
+
+    @override_settings(STRIPE_CIRCUITO_UMBRAL=2, STRIPE_CIRCUITO_ESPERA=60)
+    def test_el_circuito_abierto_falla_sin_llamar_a_stripe(self):
+        mock_intent = self._mock_cliente()
+        mock_intent.create.side_effect = stripe_client.stripe.APIConnectionError("timeout")
+
+        for _ in range(2):
+            with self.assertRaises(stripe_gateway.StripeGatewayError):
+                stripe_gateway.ensure_payment_intent(self.pedido)
+        with self.assertRaisesMessage(
+            stripe_gateway.StripeGatewayError, stripe_gateway.MENSAJE_STRIPE_NO_DISPONIBLE
+        ):
+            stripe_gateway.ensure_payment_intent(self.pedido)
+
+        self.assertEqual(mock_intent.create.call_count, 2)
+
+    def test_cada_hilo_usa_su_propia_sesion_http(self):
+        http_client = stripe_client.obtener_cliente()._requestor._client
+
+        # Sin sesión fija, el cliente de Stripe crea una requests.Session por hilo.
+        self.assertIsNone(http_client._session)
+        self.assertEqual(http_client._timeout, (3, 10))
+
+    def test_webhook_actualiza_la_copia_local(self):
+        stripe_gateway._sync_payment_state(self.pedido, _intent(status="processing"))
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.stripe_payment_status, "processing")
+        self.assertEqual(self.pedido.stripe_client_secret, "pi_123_secret_abc")
+
+
+def _evento(evento_id, tipo, pedido, creado, status="succeeded"):
+    return {
+        "id": evento_id,
+        "type": tipo,
+        "created": creado,
+        "data": {
+            "object": {
+                "id": "pi_evt",
+                "object": "payment_intent",
+                "status": status,
+                "amount": 5000,
+                "latest_charge": "ch_evt",
+                "metadata": {"pedido_id": str(pedido.pk), "numero_pedido": pedido.numero_pedido},
+            }
+        },
+    }
+
+
+class EventosStripeTests(TestCase):
+    def setUp(self):
+        self.pedido = Pedido.objects.create(
+            numero_pedido="EVT1",
+            total=Decimal("50.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Webhook",
+            telefono="600000000",
+            email_contacto="webhook@example.com",
+        )
+
+    def test_webhook_responde_200_y_descarta_reenvios(self):
+        evento = _evento("evt_1", "payment_intent.succeeded", self.pedido, 100)
+        with mock.patch.object(stripe_gateway, "construct_event", return_value=evento):
+            for _ in range(3):
+                respuesta = self.client.post(
+                    reverse("pedidos:stripe_webhook"), data=b"{}", content_type="application/json",
+                    HTTP_STRIPE_SIGNATURE="t=1,v1=firma",
+                )
+                self.assertEqual(respuesta.status_code, 200)
+
+        self.assertEqual(EventoStripe.objects.count(), 1)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estados.PENDIENTE)
+
+    def test_procesa_en_orden_y_una_sola_vez(self):
+        stripe_gateway.registrar_evento(
+            _evento("evt_2", "payment_intent.succeeded", self.pedido, 200)
+        )
+        stripe_gateway.registrar_evento(
+            _evento("evt_1", "payment_intent.payment_failed", self.pedido, 100, status="requires_payment_method")
+        )
+
+        resultado = stripe_gateway.procesar_eventos_pendientes()
+
+        self.assertEqual(resultado, {"procesados": 2, "ignorados": 0, "errores": 0})
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estados.PROCESANDO)
+        self.assertEqual(self.pedido.stripe_payment_status, "succeeded")
+        self.assertEqual(CorreoPendiente.objects.filter(pedido=self.pedido).count(), 1)
+        self.assertEqual(stripe_gateway.procesar_eventos_pendientes()["procesados"], 0)
+
+    def test_un_fallo_retiene_los_eventos_siguientes_del_mismo_intent(self):
+        stripe_gateway.registrar_evento(_evento("evt_1", "payment_intent.processing", self.pedido, 100))
+        stripe_gateway.registrar_evento(_evento("evt_2", "payment_intent.succeeded", self.pedido, 200))
+
+        with mock.patch.object(stripe_gateway, "handle_event", side_effect=[RuntimeError("caída")]):
+            resultado = stripe_gateway.procesar_eventos_pendientes()
+
+        self.assertEqual(resultado["errores"], 1)
+        self.assertEqual(
+            list(EventoStripe.objects.values_list("evento_id", "estado", "intentos")),
+            [("evt_1", "pendiente", 1), ("evt_2", "pendiente", 0)],
+        )
+
+
+@override_settings(
+    STRIPE_SECRET_KEY="sk_test_falso",
+    STRIPE_PUBLISHABLE_KEY="pk_test_falso",
+    STRIPE_WEBHOOK_SECRET="whsec_falso",
+    STRIPE_MAX_REINTENTOS=0,
+)
+class StripeFalsoTests(TestCase):
+    def setUp(self):
+        self.servidor = ServidorStripeFalso(secreto_webhook="whsec_falso").iniciar()
+        self.addCleanup(self.servidor.detener)
+        ajustes = override_settings(STRIPE_API_BASE=self.servidor.url)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        stripe_client.reiniciar()
+        self.addCleanup(stripe_client.reiniciar)
+        self.pedido = Pedido.objects.create(
+            numero_pedido="FALSO1",
+            total=Decimal("42.50"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Falsa 123",
+            telefono="600000000",
+            email_contacto="falso@example.com",
+        )
+
+    def test_pago_con_tarjeta_completo_contra_el_servidor_falso(self):
+        intent = stripe_gateway.ensure_payment_intent(self.pedido)
+        self.assertEqual(self.servidor.intents[intent.id]["amount"], 4250)
+        self.assertEqual(self.servidor.intents[intent.id]["metadata"]["pedido_id"], str(self.pedido.pk))
+
+        pagado = self.servidor.confirmar_intent(intent.id)
+        payload, firma = self.servidor.evento_firmado("payment_intent.succeeded", pagado)
+        respuesta = self.client.post(
+            reverse("pedidos:stripe_webhook"), data=payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=firma,
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        stripe_gateway.procesar_eventos_pendientes()
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estados.PROCESANDO)
+        self.assertTrue(stripe_gateway.confirm_payment_intent(intent.id))
+
+    def test_fallos_inyectados_llegan_como_error_controlado(self):
+        self.servidor.tasa_fallos = 1
+
+        with self.assertRaises(stripe_gateway.StripeGatewayError):
+            stripe_gateway.ensure_payment_intent(self.pedido)
+
+    def test_conciliacion_confirma_los_pagos_sin_webhook(self):
+        pedidos = [self.pedido]
+        for indice in range(4):
+            pedidos.append(
+                Pedido.objects.create(
+                    numero_pedido=f"FALSO{indice + 2}",
+                    total=Decimal("10.00"),
+                    metodo_pago=Pedido.MetodosPago.TARJETA,
+                    direccion_envio="Calle Falsa 123",
+                    telefono="600000000",
+                    email_contacto=f"falso{indice}@example.com",
+                )
+            )
+        intents = [stripe_gateway.ensure_payment_intent(pedido) for pedido in pedidos]
+        for intent in intents[:3]:
+            self.servidor.confirmar_intent(intent.id)
+        peticiones_previas = self.servidor.peticiones
+
+        resultado = conciliar_pagos(lote=2, antiguedad_minima=timedelta(0))
+
+        self.assertEqual(resultado["revisados"], 5)
+        self.assertEqual(resultado["pagados"], 3)
+        self.assertEqual(resultado["no_encontrados"], 0)
+        # Una petición de listado por página de pedidos, ninguna consulta individual.
+        self.assertEqual(self.servidor.peticiones - peticiones_previas, 3)
+        self.assertEqual(
+            Pedido.objects.filter(estado=Pedido.Estados.PROCESANDO).count(), 3
+        )
+        self.assertEqual(
+            CorreoPendiente.objects.filter(tipo=CorreoPendiente.Tipos.CONFIRMACION).count(), 3
+        )
+        self.assertEqual(conciliar_pagos(antiguedad_minima=timedelta(0))["pagados"], 0)
+
+    def test_conciliacion_no_lista_el_hueco_entre_pedidos_dispersos(self):
+        reciente = Pedido.objects.create(
+            numero_pedido="FALSO9",
+            total=Decimal("10.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Falsa 123",
+            telefono="600000000",
+        )
+        antiguo_intent = stripe_gateway.ensure_payment_intent(self.pedido)
+        reciente_intent = stripe_gateway.ensure_payment_intent(reciente)
+        hace_tres_dias = timezone.now() - timedelta(days=3)
+        Pedido.objects.filter(pk=self.pedido.pk).update(fecha_creacion=hace_tres_dias)
+        self.servidor.intents[antiguo_intent.id]["created"] = int(hace_tres_dias.timestamp())
+        # Otros 450 intents de la misma tienda, creados justo después del antiguo.
+        for _ in range(450):
+            relleno = self.servidor.crear_intent({"amount": 100})
+            relleno["created"] = int(hace_tres_dias.timestamp()) + 60
+        for intent in (antiguo_intent, reciente_intent):
+            self.servidor.confirmar_intent(intent.id)
+        peticiones_previas = self.servidor.peticiones
+
+        resultado = conciliar_pagos(antiguedad_minima=timedelta(0))
+
+        self.assertEqual(resultado["pagados"], 2)
+        # Una ventana por pedido. La del antiguo se corta tras una página de listado y se
+        # consulta su intent; listar todo el intervalo habría costado cinco peticiones.
+        self.assertEqual(self.servidor.peticiones - peticiones_previas, 3)
+
+
+class ConciliacionBloqueoTests(TestCase):
+    def test_bloquea_solo_la_tabla_de_pedidos(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        from pedidos.payment_gateways.conciliacion import _confirmables
+
+        # Se compila con el backend de PostgreSQL sin conectarse: SQLite ignora FOR UPDATE.
+        postgres = DatabaseWrapper({**connection.settings_dict, "ENGINE": "django.db.backends.postgresql"})
+        with mock.patch.object(postgres, "get_autocommit", return_value=False):
+            sql, _ = _confirmables([1]).query.get_compiler(connection=postgres).as_sql()
+
+        self.assertIn('LEFT OUTER JOIN "auth_user"', sql)
+        self.assertTrue(sql.endswith('FOR UPDATE OF "pedidos_pedido"'), sql)
@@ -1,10 +1,18 @@
+import asyncio
+import time
 import uuid
 
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from rest_framework import generics, permissions
 from rest_framework.exceptions import NotFound, PermissionDenied as DRFPermissionDenied
 
+from . import seguimiento
+from .eventos_seguimiento import ESTADOS_FINALES, central, formatear_evento
 from .models import Pedido
 from .serializers import PedidoPublicSerializer
 
@@ -30,14 +38,29 @@ class PedidoPublicDetailView(generics.RetrieveAPIView):
         return pedido
 
 
+def _etag_detalle_publico(request, numero_pedido):
+    entrada = seguimiento.pagina_detalle_publico(numero_pedido)
+    if entrada is None or not _puede_ver(request, entrada):
+        return None
+    return entrada["etag"]
+
+
+def _puede_ver(request, entrada):
+    return entrada["cliente_id"] is None or entrada["cliente_id"] == request.user.pk
+
+
+def _respuesta_cacheada(entrada):
+    respuesta = HttpResponse(entrada["html"])
+    # El navegador revalida siempre; con la caché caliente eso es un 304 sin consultas.
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
+@condition(etag_func=_etag_detalle_publico)
 def pedido_detalle_publico(request, numero_pedido):
-    pedido = (
-        Pedido.objects.prefetch_related("items", "items__producto")
-        .filter(numero_pedido=numero_pedido)
-        .first()
-    )
+    entrada = seguimiento.pagina_detalle_publico(numero_pedido)
 
-    if not pedido:
+    if not entrada:
         return render(
             request,
             "pedidos/detalle_pedido_publico.html",
@@ -45,49 +68,62 @@ def pedido_detalle_publico(request, numero_pedido):
             status=404,
         )
 
-    if pedido.cliente and pedido.cliente != request.user:
+    if not _puede_ver(request, entrada):
         raise PermissionDenied("No puedes ver este pedido.")
 
-    contexto = {
-        "pedido": pedido,
-    }
-    return render(request, "pedidos/detalle_pedido_publico.html", contexto)
+    return _respuesta_cacheada(entrada)
 
 
-def _mask_phone(phone: str) -> str:
-    raw = (phone or "").strip()
-    if not raw:
-        return ""
-    digits = "".join(ch for ch in raw if ch.isdigit())
-    if len(digits) <= 4:
-        masked = "*" * len(digits)
-    else:
-        masked = "*" * (len(digits) - 4) + digits[-4:]
-    return masked
+def _etag_seguimiento(request, tracking_token):
+    entrada = seguimiento.pagina_seguimiento(tracking_token)
+    return entrada["etag"] if entrada else None
 
 
+@condition(etag_func=_etag_seguimiento)
 def seguimiento_pedido(request, tracking_token):
-    try:
-        token_uuid = uuid.UUID(str(tracking_token))
-    except (ValueError, TypeError):
-        pedido = None
-    else:
-        pedido = (
-            Pedido.objects.prefetch_related("items__producto")
-            .filter(tracking_token=token_uuid)
-            .first()
-        )
-
-    if not pedido:
+    entrada = seguimiento.pagina_seguimiento(tracking_token)
+    if not entrada:
         return render(
             request,
             "pedido/seguimiento.html",
             {"pedido": None, "masked_phone": ""},
             status=404,
         )
-    context = {
-        "pedido": pedido,
-        "masked_phone": _mask_phone(pedido.telefono),
-    }
-    return render(request, "pedido/seguimiento.html", context)
+    return _respuesta_cacheada(entrada)
+
 
+async def _flujo_estados(pedido_id, estado):
+    latido = getattr(settings, "PEDIDOS_SEGUIMIENTO_LATIDO", 15)
+    # Al cumplirse se cierra la conexión y EventSource se reconecta solo: ningún proceso
+    # acumula conexiones eternas y, bajo WSGI, la respuesta no queda abierta sin fin.
+    limite = time.monotonic() + getattr(settings, "PEDIDOS_SEGUIMIENTO_DURACION", 300)
+    suscripcion = central.suscribir(pedido_id, estado)
+    try:
+        yield "retry: 5000\n" + formatear_evento(estado)
+        while estado not in ESTADOS_FINALES and time.monotonic() < limite:
+            try:
+                estado = await asyncio.wait_for(suscripcion.cola.get(), timeout=latido)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+                continue
+            yield formatear_evento(estado)
+    finally:
+        central.cancelar(suscripcion)
+
+
+async def seguimiento_eventos(request, tracking_token):
+    """Server-Sent Events con los cambios de estado del pedido de ``tracking_token``."""
+    try:
+        token_uuid = uuid.UUID(str(tracking_token))
+    except (ValueError, TypeError):
+        raise Http404("Pedido no encontrado")
+    pedido = await Pedido.objects.filter(tracking_token=token_uuid).only("pk", "estado").afirst()
+    if pedido is None:
+        raise Http404("Pedido no encontrado")
+
+    respuesta = StreamingHttpResponse(
+        _flujo_estados(pedido.pk, pedido.estado), content_type="text/event-stream"
+    )
+    respuesta["Cache-Control"] = "no-cache"
+    respuesta["X-Accel-Buffering"] = "no"
+    return respuesta
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from productos.models import ProductoRecomendado
+from productos.recomendaciones import RECOMENDACIONES_POR_PRODUCTO, calcular_comprados_juntos, calcular_similares
+
+
+class Command(BaseCommand):
+    help = "Recalcula las recomendaciones precalculadas («comprados juntos» y «similares»)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tipo",
+            choices=ProductoRecomendado.Tipos.values,
+            help="Recalcula solo este tipo (por defecto, todos).",
+        )
+        parser.add_argument("--k", type=int, default=RECOMENDACIONES_POR_PRODUCTO, help="Vecinos por producto.")
+        parser.add_argument(
+            "--minimo", type=int, default=2, help="Pedidos en común necesarios para «comprados juntos»."
+        )
+        parser.add_argument("--lote", type=int, default=5000, help="Pedidos leídos por página.")
+
+    def handle(self, *args, **options):
+        tipo = options["tipo"]
+        if tipo in (None, ProductoRecomendado.Tipos.COMPRADOS_JUNTOS):
+            total = calcular_comprados_juntos(k=options["k"], minimo=options["minimo"], lote=options["lote"])
+            self.stdout.write(f"Comprados juntos guardados: {total}")
+        if tipo in (None, ProductoRecomendado.Tipos.SIMILARES):
+            total = calcular_similares(k=options["k"])
+            self.stdout.write(f"Similares guardados: {total}")
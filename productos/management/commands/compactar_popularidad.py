@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from productos import popularidad
+
+
+class Command(BaseCommand):
+    help = "Reescala la popularidad del catálogo a la fecha actual (o la reconstruye desde los pedidos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reiniciar",
+            action="store_true",
+            help="Recalcula la popularidad desde todas las líneas de pedidos no cancelados.",
+        )
+        parser.add_argument("--lote", type=int, default=5000, help="Líneas de pedido leídas por bloque.")
+
+    def handle(self, *args, **options):
+        if options["reiniciar"]:
+            total = popularidad.recalcular(lote=options["lote"])
+            self.stdout.write(f"Popularidad recalculada: {total} productos con ventas")
+            return
+        factor = popularidad.compactar()
+        self.stdout.write(f"Popularidad compactada (factor {factor:.6f})")
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_alter_producto_nombre_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'esta_disponible'], name='producto_categoria_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['marca', 'precio'], name='producto_marca_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tallaproducto',
+            index=models.Index(fields=['producto', 'talla'], name='talla_producto_talla_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0007_indices_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoRecomendado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('comprados_juntos', 'Comprados juntos')], max_length=20)),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('puntuacion', models.FloatField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomendaciones', to='productos.producto')),
+                ('recomendado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Producto recomendado',
+                'verbose_name_plural': 'Productos recomendados',
+                'indexes': [models.Index(fields=['producto', 'tipo', 'posicion'], name='producto_recomendado_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'tipo', 'recomendado'), name='producto_recomendado_unico')],
+            },
+        ),
+    ]
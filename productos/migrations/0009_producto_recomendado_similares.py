@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_producto_recomendado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productorecomendado',
+            name='tipo',
+            field=models.CharField(choices=[('comprados_juntos', 'Comprados juntos'), ('similares', 'Similares')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0009_producto_recomendado_similares'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EpocaPopularidad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Época de popularidad',
+                'verbose_name_plural': 'Épocas de popularidad',
+            },
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='popularidad',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-popularidad', 'id'], name='producto_popularidad_idx'),
+        ),
+    ]
@@ -118,10 +118,21 @@ class Producto(models.Model):
     es_destacado = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Unidades vendidas con decaimiento exponencial, en la escala de ``EpocaPopularidad``
+    # (ver ``productos.popularidad``). Solo sirve para ordenar.
+    popularidad = models.FloatField(default=0, editable=False)
 
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            # Catálogo filtrado por categoría o por marca; la segunda columna cubre los
+            # filtros de disponibilidad y la ordenación por precio dentro de cada una.
+            models.Index(fields=["categoria", "esta_disponible"], name="producto_categoria_disp_idx"),
+            models.Index(fields=["marca", "precio"], name="producto_marca_precio_idx"),
+            # ``?orden=populares``: recorre el índice en orden sin ordenar la tabla.
+            models.Index(fields=["-popularidad", "id"], name="producto_popularidad_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -193,6 +204,58 @@ class TallaProducto(models.Model):
     class Meta:
         verbose_name = "Talla de producto"
         verbose_name_plural = "Tallas de productos"
+        indexes = [
+            models.Index(fields=["producto", "talla"], name="talla_producto_talla_idx"),
+        ]
 
     def __str__(self):
         return f"{self.producto.nombre} - Talla {self.talla}"
+
+
+class ProductoRecomendado(models.Model):
+    """
+    Vecinos precalculados de un producto. Se recalculan fuera de línea
+    (``calcular_recomendaciones``) y la ficha los lee con una sola consulta indexada.
+    """
+
+    class Tipos(models.TextChoices):
+        COMPRADOS_JUNTOS = "comprados_juntos", "Comprados juntos"
+        SIMILARES = "similares", "Similares"
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="recomendaciones")
+    recomendado = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="+")
+    tipo = models.CharField(max_length=20, choices=Tipos.choices)
+    posicion = models.PositiveSmallIntegerField()
+    puntuacion = models.FloatField()
+
+    class Meta:
+        verbose_name = "Producto recomendado"
+        verbose_name_plural = "Productos recomendados"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["producto", "tipo", "recomendado"], name="producto_recomendado_unico"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["producto", "tipo", "posicion"], name="producto_recomendado_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} -> {self.recomendado_id} ({self.tipo})"
+
+
+class EpocaPopularidad(models.Model):
+    """
+    Instante de referencia (fila única) de ``Producto.popularidad``: una venta en el
+    instante ``t`` suma ``unidades * 2 ** ((t - inicio) / vida_media)``. La compactación
+    reescala todas las puntuaciones y mueve ``inicio`` al presente.
+    """
+
+    inicio = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Época de popularidad"
+        verbose_name_plural = "Épocas de popularidad"
+
+    def __str__(self):
+        return f"Popularidad desde {self.inicio:%Y-%m-%d %H:%M}"
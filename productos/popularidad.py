@@ -0,0 +1,178 @@
+"""
+Popularidad del catálogo: unidades vendidas con decaimiento exponencial.
+
+Se usa decaimiento «hacia delante»: en lugar de envejecer todas las puntuaciones a medida
+que pasa el tiempo, cada venta pesa más cuanto más reciente es,
+``2 ** ((t - inicio) / vida_media)``. Registrar un pedido es entonces un único UPDATE que
+suma a cada producto su peso, y el orden entre productos en cualquier instante es el
+mismo que con decaimiento real. Como los pesos crecen con el tiempo, ``compactar`` divide
+periódicamente todas las puntuaciones por el peso del presente y mueve
+``EpocaPopularidad.inicio`` a ahora; tras compactar, la puntuación equivale a las
+unidades vendidas con decaimiento hasta esa fecha.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from productos.models import EpocaPopularidad, Producto
+
+logger = logging.getLogger(__name__)
+
+# Por debajo de esta puntuación (ya compactada) un producto cuenta como sin ventas.
+PUNTUACION_DESPRECIABLE = 1e-3
+
+
+def _vida_media_segundos() -> float:
+    return float(settings.PRODUCTOS_POPULARIDAD_VIDA_MEDIA_DIAS) * 86400
+
+
+def _epoca(bloquear: bool = False) -> EpocaPopularidad:
+    epocas = EpocaPopularidad.objects.order_by("pk")
+    if bloquear:
+        epocas = epocas.select_for_update()
+    epoca = epocas.first()
+    if epoca is None:
+        epoca, _ = EpocaPopularidad.objects.get_or_create(pk=1, defaults={"inicio": timezone.now()})
+    return epoca
+
+
+def peso(momento: datetime, inicio: datetime) -> float:
+    """Lo que suma una unidad vendida en ``momento`` en la escala de ``inicio``."""
+    return 2.0 ** ((momento - inicio).total_seconds() / _vida_media_segundos())
+
+
+def _aplicar(incrementos: Dict[int, float]) -> int:
+    incrementos = {pk: valor for pk, valor in incrementos.items() if valor}
+    if not incrementos:
+        return 0
+    suma = Case(
+        *(When(pk=pk, then=Value(valor)) for pk, valor in incrementos.items()),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return Producto.objects.filter(pk__in=incrementos).update(popularidad=F("popularidad") + suma)
+
+
+def _aplicar_en_epoca(calcular) -> int:
+    """
+    Aplica los incrementos que ``calcular(inicio)`` devuelve con la época bloqueada, así
+    que nunca se cruzan con una compactación: o se aplican antes y se reescalan con el
+    resto, o esperan y se calculan con la época nueva. La transacción solo dura el UPDATE.
+    """
+    with transaction.atomic():
+        inicio = _epoca(bloquear=True).inicio
+        return _aplicar(calcular(inicio))
+
+
+def sumar_ventas(unidades: Dict[int, int], momento: Optional[datetime] = None) -> int:
+    """Suma las ``unidades`` por producto vendidas en ``momento`` con un solo UPDATE."""
+    momento = momento or timezone.now()
+
+    def calcular(inicio):
+        factor = peso(momento, inicio)
+        return {producto_id: cantidad * factor for producto_id, cantidad in unidades.items()}
+
+    return _aplicar_en_epoca(calcular)
+
+
+def restar_pedidos(pedido_ids: Iterable[int]) -> int:
+    """Descuenta las líneas de pedidos cancelados con el peso que tuvieron al crearse."""
+    from pedidos.models import ItemPedido
+
+    lineas = list(
+        ItemPedido.objects.filter(pedido_id__in=list(pedido_ids)).values_list(
+            "producto_id", "pedido__fecha_creacion", "cantidad"
+        )
+    )
+
+    def calcular(inicio):
+        incrementos: Dict[int, float] = defaultdict(float)
+        for producto_id, fecha, cantidad in lineas:
+            incrementos[producto_id] -= cantidad * peso(fecha, inicio)
+        return incrementos
+
+    return _aplicar_en_epoca(calcular)
+
+
+def compactar(momento: Optional[datetime] = None) -> float:
+    """
+    Reescala las puntuaciones a la época ``momento`` (ahora por defecto) y pone a cero las
+    despreciables. Devuelve el factor aplicado.
+    """
+    momento = momento or timezone.now()
+    with transaction.atomic():
+        epoca = _epoca(bloquear=True)
+        factor = 1 / peso(momento, epoca.inicio)
+        Producto.objects.exclude(popularidad=0).update(popularidad=F("popularidad") * factor)
+        Producto.objects.filter(popularidad__lt=PUNTUACION_DESPRECIABLE).exclude(popularidad=0).update(
+            popularidad=0
+        )
+        epoca.inicio = momento
+        epoca.save(update_fields=["inicio"])
+    logger.info("Popularidad compactada con factor %.6f", factor)
+    return factor
+
+
+def recalcular(lote: int = 5000) -> int:
+    """
+    Reconstruye la popularidad de todo el catálogo desde las líneas de pedidos no
+    cancelados, por bloques de ``lote`` líneas sumados con NumPy. Devuelve cuántos
+    productos quedan con puntuación.
+    """
+    from pedidos.models import ItemPedido, Pedido
+
+    ahora = timezone.now()
+    ids_productos = np.fromiter(
+        Producto.objects.order_by("pk").values_list("pk", flat=True).iterator(), dtype=np.int64
+    )
+    puntuacion = np.zeros(len(ids_productos))
+    lineas = (
+        ItemPedido.objects.exclude(pedido__estado=Pedido.Estados.CANCELADO)
+        .values_list("producto_id", "pedido__fecha_creacion", "cantidad")
+        .iterator(chunk_size=lote)
+    )
+    vida_media = _vida_media_segundos()
+
+    def acumular(bloque):
+        productos, fechas, cantidades = zip(*bloque)
+        productos = np.array(productos, dtype=np.int64)
+        edad = np.array([(ahora - fecha).total_seconds() for fecha in fechas])
+        pesos = np.array(cantidades, dtype=np.float64) * np.exp2(-edad / vida_media)
+        indices = np.searchsorted(ids_productos, productos)
+        conocidos = indices < len(ids_productos)
+        conocidos[conocidos] = ids_productos[indices[conocidos]] == productos[conocidos]
+        puntuacion[:] += np.bincount(indices[conocidos], weights=pesos[conocidos], minlength=len(puntuacion))
+
+    bloque = []
+    for linea in lineas:
+        bloque.append(linea)
+        if len(bloque) >= lote:
+            acumular(bloque)
+            bloque = []
+    if bloque:
+        acumular(bloque)
+
+    puntuacion[puntuacion < PUNTUACION_DESPRECIABLE] = 0
+    con_ventas = np.flatnonzero(puntuacion)
+    with transaction.atomic():
+        epoca = _epoca(bloquear=True)
+        Producto.objects.exclude(popularidad=0).update(popularidad=0)
+        Producto.objects.bulk_update(
+            [Producto(pk=int(ids_productos[i]), popularidad=float(puntuacion[i])) for i in con_ventas],
+            ["popularidad"],
+            batch_size=500,
+        )
+        epoca.inicio = ahora
+        epoca.save(update_fields=["inicio"])
+    logger.info("Popularidad recalculada: %s productos con ventas", len(con_ventas))
+    return len(con_ventas)
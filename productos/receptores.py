@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from pedidos.models import Pedido
+from pedidos.signals import estado_pedidos_cambiado
+from productos import popularidad
+from productos.models import Producto
+from tareas.cola import encolar
+
+# Campos que forman el vector de características de ``recomendaciones.vectores_productos``.
+CAMPOS_SIMILITUD = {"categoria", "marca", "genero", "color", "material", "precio", "precio_oferta"}
+
+
+@receiver(post_save, sender=Producto, dispatch_uid="productos.actualizar_similares")
+def actualizar_similares_guardado(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Las cargas de fixtures (raw) se recalculan enteras con ``calcular_recomendaciones``.
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_SIMILITUD.intersection(update_fields):
+        return
+    producto_id = instance.pk
+    transaction.on_commit(lambda: encolar("productos.actualizar_similares", producto_id))
+
+
+@receiver(estado_pedidos_cambiado, dispatch_uid="productos.restar_popularidad_cancelados")
+def restar_popularidad_cancelados(sender, pedido_ids, estado, **kwargs):
+    # Cancelado es final en ``TRANSICIONES_PERMITIDAS`` y el panel, la API y /admin/ solo
+    # cambian estados con ``cambiar_estado_pedidos``, que notifica los pedidos que de verdad
+    # cambian: cada pedido se descuenta una sola vez.
+    if estado == Pedido.Estados.CANCELADO:
+        popularidad.restar_pedidos(pedido_ids)
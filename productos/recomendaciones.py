@@ -0,0 +1,344 @@
+"""
+Recomendaciones precalculadas de productos.
+
+* «Comprados juntos»: se recorren los pedidos por páginas de clave primaria, cada página
+  se convierte en arrays de NumPy y las coincidencias entre productos de un mismo pedido
+  se cuentan de forma vectorizada (matriz de coocurrencia dispersa en formato de
+  coordenadas).
+* «Similares»: cada producto es un vector compacto de códigos enteros (categoría, marca,
+  género, color, material y banda de precio) y la similitud es la suma ponderada de las
+  características que comparten. Sirve también para productos nuevos sin ventas.
+
+De cada producto se guardan sus ``k`` mejores vecinos en ``ProductoRecomendado``; la
+ficha de producto y la API solo leen esa tabla.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Subquery
+
+from productos.models import ImagenProducto, Producto, ProductoRecomendado
+
+logger = logging.getLogger(__name__)
+
+RECOMENDACIONES_POR_PRODUCTO = 8
+# Los pedidos con más productos distintos (compras al por mayor) añaden ruido y su coste
+# crece con el cuadrado del tamaño: no se cuentan.
+MAX_PRODUCTOS_POR_PEDIDO = 50
+# Cada cuántas páginas se consolidan los recuentos parciales para acotar la memoria.
+PAGINAS_POR_CONSOLIDACION = 20
+
+# Peso de cada característica al comparar productos, en el orden de las columnas de
+# ``vectores_productos``. La banda de precio suma medio peso si la banda es contigua.
+PESOS_SIMILITUD = np.array([3.0, 2.0, 2.0, 1.0, 1.0], dtype=np.float32)
+PESO_BANDA_PRECIO = np.float32(1.5)
+BANDAS_PRECIO = (30, 50, 75, 100, 150, 200)
+# Celdas (productos origen x productos candidatos x características) por bloque.
+CELDAS_POR_BLOQUE = 4_000_000
+
+
+def contar_coocurrencias(pedidos: np.ndarray, productos: np.ndarray, n_productos: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuenta los pares (a, b), a != b, de productos que aparecen en el mismo pedido.
+
+    ``pedidos`` y ``productos`` son arrays paralelos de pares únicos ordenados por pedido;
+    ``productos`` contiene índices densos en ``[0, n_productos)``. Devuelve las claves
+    ``a * n_productos + b`` (ordenadas) y cuántas veces aparece cada una.
+    """
+    if len(pedidos) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    inicios = np.flatnonzero(np.r_[True, pedidos[1:] != pedidos[:-1]])
+    tamanos = np.diff(np.r_[inicios, len(pedidos)])
+    validos = tamanos <= MAX_PRODUCTOS_POR_PEDIDO
+    inicios, tamanos = inicios[validos], tamanos[validos]
+
+    # Cada elemento de un pedido de tamaño t se empareja con los t elementos del pedido.
+    elementos = np.repeat(inicios, tamanos) + (
+        np.arange(tamanos.sum()) - np.repeat(np.cumsum(tamanos) - tamanos, tamanos)
+    )
+    veces_elemento = np.repeat(tamanos, tamanos)
+    filas = np.repeat(elementos, veces_elemento)
+    base = np.repeat(np.repeat(inicios, tamanos), veces_elemento)
+    desplazamiento = np.arange(len(filas)) - np.repeat(np.cumsum(veces_elemento) - veces_elemento, veces_elemento)
+    columnas = base + desplazamiento
+
+    distintos = filas != columnas
+    claves = productos[filas[distintos]].astype(np.int64) * n_productos + productos[columnas[distintos]]
+    return np.unique(claves, return_counts=True)
+
+
+def _consolidar(parciales: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    claves = np.concatenate([c for c, _ in parciales])
+    veces = np.concatenate([v for _, v in parciales])
+    unicas, inverso = np.unique(claves, return_inverse=True)
+    return unicas, np.bincount(inverso, weights=veces).astype(np.int64)
+
+
+def mejores_vecinos(claves: np.ndarray, veces: np.ndarray, n_productos: int, k: int, minimo: int):
+    """Los ``k`` vecinos con más coincidencias de cada producto (empates por índice)."""
+    origen = claves // n_productos
+    destino = claves % n_productos
+    suficientes = veces >= minimo
+    origen, destino, veces = origen[suficientes], destino[suficientes], veces[suficientes]
+
+    orden = np.lexsort((destino, -veces, origen))
+    origen, destino, veces = origen[orden], destino[orden], veces[orden]
+    inicio_grupo = np.r_[True, origen[1:] != origen[:-1]]
+    primera = np.maximum.accumulate(np.where(inicio_grupo, np.arange(len(origen)), 0))
+    posicion = np.arange(len(origen)) - primera
+    dentro = posicion < k
+    return origen[dentro], destino[dentro], posicion[dentro], veces[dentro]
+
+
+def calcular_comprados_juntos(
+    k: int = RECOMENDACIONES_POR_PRODUCTO, minimo: int = 2, lote: int = 5000
+) -> int:
+    """Recalcula todas las recomendaciones «comprados juntos»; devuelve cuántas guarda."""
+    from pedidos.models import ItemPedido, Pedido
+
+    ids_productos = np.fromiter(
+        Producto.objects.order_by("pk").values_list("pk", flat=True).iterator(), dtype=np.int64
+    )
+    n_productos = len(ids_productos)
+    lineas = (
+        ItemPedido.objects.exclude(pedido__estado=Pedido.Estados.CANCELADO)
+        .order_by("pedido_id")
+        .values_list("pedido_id", "producto_id")
+    )
+
+    parciales: List[Tuple[np.ndarray, np.ndarray]] = []
+    ultimo_pedido = 0
+    while n_productos:
+        filas = np.array(
+            list(lineas.filter(pedido_id__gt=ultimo_pedido, pedido_id__lte=ultimo_pedido + lote)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        if not len(filas):
+            siguiente = lineas.filter(pedido_id__gt=ultimo_pedido).values_list("pedido_id", flat=True).first()
+            if siguiente is None:
+                break
+            ultimo_pedido = siguiente - 1
+            continue
+        ultimo_pedido += lote
+
+        indices = np.searchsorted(ids_productos, filas[:, 1])
+        # Productos creados después de leer los identificadores: se dejan para la próxima vez.
+        conocidos = ids_productos[np.minimum(indices, n_productos - 1)] == filas[:, 1]
+        filas, indices = filas[conocidos], indices[conocidos]
+        # Una línea por (pedido, producto) aunque el producto aparezca en varias tallas.
+        pares = np.unique(filas[:, 0] * n_productos + indices)
+        parciales.append(contar_coocurrencias(pares // n_productos, pares % n_productos, n_productos))
+        if len(parciales) >= PAGINAS_POR_CONSOLIDACION:
+            parciales = [_consolidar(parciales)]
+
+    tipo = ProductoRecomendado.Tipos.COMPRADOS_JUNTOS
+    filas_nuevas = []
+    if parciales:
+        claves, veces = _consolidar(parciales)
+        origen, destino, posicion, veces = mejores_vecinos(claves, veces, n_productos, k, minimo)
+        filas_nuevas = [
+            ProductoRecomendado(
+                producto_id=int(producto_id),
+                recomendado_id=int(recomendado_id),
+                tipo=tipo,
+                posicion=int(puesto),
+                puntuacion=float(cuenta),
+            )
+            for producto_id, recomendado_id, puesto, cuenta in zip(
+                ids_productos[origen], ids_productos[destino], posicion, veces
+            )
+        ]
+
+    with transaction.atomic():
+        ProductoRecomendado.objects.filter(tipo=tipo).delete()
+        ProductoRecomendado.objects.bulk_create(filas_nuevas, batch_size=1000)
+    logger.info("Recomendaciones «comprados juntos» guardadas: %s", len(filas_nuevas))
+    return len(filas_nuevas)
+
+
+def _codificar_texto(valores) -> np.ndarray:
+    """Códigos densos de un campo de texto; vacío o nulo es -1 y no coincide con nada."""
+    normalizados = np.array([(valor or "").strip().lower() for valor in valores], dtype=object)
+    if not len(normalizados):
+        return np.empty(0, dtype=np.int32)
+    _, codigos = np.unique(normalizados, return_inverse=True)
+    codigos = codigos.astype(np.int32)
+    codigos[normalizados == ""] = -1
+    return codigos
+
+
+def vectores_productos():
+    """
+    Identificadores ordenados de todos los productos, su matriz de características
+    (``n x 6``, ``int32``) y el logaritmo del precio vigente para desempatar.
+    """
+    filas = list(
+        Producto.objects.order_by("pk").values_list(
+            "pk", "categoria_id", "marca_id", "genero", "color", "material", "precio", "precio_oferta"
+        )
+    )
+    if not filas:
+        return np.empty(0, dtype=np.int64), np.empty((0, 6), dtype=np.int32), np.empty(0)
+    ids, categorias, marcas, generos, colores, materiales, precios, ofertas = zip(*filas)
+    precio_vigente = np.array(
+        [float(oferta if oferta is not None else precio) for precio, oferta in zip(precios, ofertas)]
+    )
+    vectores = np.column_stack(
+        [
+            np.array(categorias, dtype=np.int32),
+            np.array(marcas, dtype=np.int32),
+            _codificar_texto(generos),
+            _codificar_texto(colores),
+            _codificar_texto(materiales),
+            np.digitize(precio_vigente, BANDAS_PRECIO).astype(np.int32),
+        ]
+    )
+    return np.array(ids, dtype=np.int64), vectores, np.log1p(precio_vigente)
+
+
+def similitud(origen: np.ndarray, candidatos: np.ndarray) -> np.ndarray:
+    """Matriz ``len(origen) x len(candidatos)`` con la puntuación de cada par."""
+    a, b = origen[:, None, :5], candidatos[None, :, :5]
+    iguales = (a == b) & (a >= 0)
+    puntuacion = iguales.astype(np.float32) @ PESOS_SIMILITUD
+    distancia_banda = np.abs(origen[:, None, 5] - candidatos[None, :, 5])
+    puntuacion += PESO_BANDA_PRECIO * np.clip(1 - distancia_banda / 2, 0, 1).astype(np.float32)
+    return puntuacion
+
+
+def vecinos_similares(vectores: np.ndarray, log_precios: np.ndarray, indices: np.ndarray, k: int):
+    """
+    Los ``k`` productos más parecidos a cada uno de ``indices``, por bloques para acotar la
+    memoria. Entre puntuaciones iguales gana el de precio más cercano.
+    """
+    n = len(vectores)
+    k = min(k, n - 1)
+    if k <= 0 or not len(indices):
+        return tuple(np.empty(0, dtype=np.int64) for _ in range(3)) + (np.empty(0, dtype=np.float32),)
+    resultado = ([], [], [], [])
+    bloque = max(1, CELDAS_POR_BLOQUE // (n * 6))
+    for inicio in range(0, len(indices), bloque):
+        filas = indices[inicio : inicio + bloque]
+        puntuacion = similitud(vectores[filas], vectores)
+        # Los pesos son múltiplos de 0,5: la penalización por precio nunca reordena
+        # puntuaciones distintas.
+        orden = puntuacion - 0.01 * np.minimum(np.abs(log_precios[filas, None] - log_precios[None, :]), 1)
+        orden[np.arange(len(filas)), filas] = -np.inf
+        mejores = np.argpartition(-orden, k - 1, axis=1)[:, :k]
+        claves = np.take_along_axis(orden, mejores, axis=1)
+        colocacion = np.argsort(-claves, axis=1, kind="stable")
+        mejores = np.take_along_axis(mejores, colocacion, axis=1)
+        valores = np.take_along_axis(puntuacion, mejores, axis=1)
+
+        validos = valores > 0
+        resultado[0].append(np.repeat(filas, k).reshape(-1, k)[validos])
+        resultado[1].append(mejores[validos])
+        resultado[2].append(np.broadcast_to(np.arange(k), mejores.shape)[validos])
+        resultado[3].append(valores[validos])
+    return tuple(np.concatenate(partes) for partes in resultado)
+
+
+def _guardar_similares(ids_productos, vectores, log_precios, indices, k, *, reemplazar_todo=False) -> int:
+    origen, destino, posicion, puntuacion = vecinos_similares(vectores, log_precios, indices, k)
+    tipo = ProductoRecomendado.Tipos.SIMILARES
+    filas_nuevas = [
+        ProductoRecomendado(
+            producto_id=int(producto_id),
+            recomendado_id=int(recomendado_id),
+            tipo=tipo,
+            posicion=int(puesto),
+            puntuacion=float(valor),
+        )
+        for producto_id, recomendado_id, puesto, valor in zip(
+            ids_productos[origen], ids_productos[destino], posicion, puntuacion
+        )
+    ]
+    existentes = ProductoRecomendado.objects.filter(tipo=tipo)
+    if not reemplazar_todo:
+        existentes = existentes.filter(producto_id__in=[int(pk) for pk in ids_productos[indices]])
+    with transaction.atomic():
+        existentes.delete()
+        ProductoRecomendado.objects.bulk_create(filas_nuevas, batch_size=1000)
+    return len(filas_nuevas)
+
+
+def calcular_similares(k: int = RECOMENDACIONES_POR_PRODUCTO) -> int:
+    """Recalcula los productos similares de todo el catálogo; devuelve cuántos guarda."""
+    ids_productos, vectores, log_precios = vectores_productos()
+    total = _guardar_similares(
+        ids_productos, vectores, log_precios, np.arange(len(ids_productos)), k, reemplazar_todo=True
+    )
+    logger.info("Recomendaciones «similares» guardadas: %s", total)
+    return total
+
+
+def actualizar_similares(producto_id: int, k: int = RECOMENDACIONES_POR_PRODUCTO) -> int:
+    """
+    Actualiza los similares tras crear o cambiar ``producto_id``: su propia lista y la de
+    los productos en cuya lista entra o de la que puede salir. Devuelve cuántos productos
+    se han recalculado.
+    """
+    ids_productos, vectores, log_precios = vectores_productos()
+    posicion = int(np.searchsorted(ids_productos, producto_id))
+    if posicion >= len(ids_productos) or ids_productos[posicion] != producto_id:
+        # Borrado: sus filas ya desaparecieron en cascada.
+        return 0
+    fila = similitud(vectores[posicion : posicion + 1], vectores)[0]
+
+    tipo = ProductoRecomendado.Tipos.SIMILARES
+    # Umbral de entrada en cada lista: la peor puntuación guardada si la lista está llena;
+    # con menos de k vecinos basta cualquier puntuación positiva.
+    umbral = np.zeros(len(ids_productos), dtype=np.float32)
+    listas = ProductoRecomendado.objects.filter(tipo=tipo).values("producto_id").annotate(
+        minima=Min("puntuacion"), vecinos=Count("id")
+    )
+    for lista in listas.filter(vecinos__gte=k):
+        indice = np.searchsorted(ids_productos, lista["producto_id"])
+        if indice < len(ids_productos) and ids_productos[indice] == lista["producto_id"]:
+            umbral[indice] = lista["minima"]
+    contienen = np.fromiter(
+        ProductoRecomendado.objects.filter(tipo=tipo, recomendado_id=producto_id).values_list(
+            "producto_id", flat=True
+        ),
+        dtype=np.int64,
+    )
+    contienen = contienen[np.isin(contienen, ids_productos)]
+
+    afectados = (fila > 0) & (fila >= umbral)
+    afectados[np.searchsorted(ids_productos, contienen)] = True
+    afectados[posicion] = True
+    indices = np.flatnonzero(afectados)
+    _guardar_similares(ids_productos, vectores, log_precios, indices, k)
+    return len(indices)
+
+
+def _con_recomendado(consulta):
+    imagen = ImagenProducto.objects.filter(producto=OuterRef("recomendado_id")).values("imagen")[:1]
+    return (
+        consulta.filter(recomendado__esta_disponible=True)
+        .select_related("recomendado")
+        .annotate(imagen=Subquery(imagen))
+    )
+
+
+def recomendados(producto: Producto, tipo: str, limite: int = RECOMENDACIONES_POR_PRODUCTO) -> List[ProductoRecomendado]:
+    """
+    Recomendaciones de ``producto`` con el producto recomendado y la ruta de su imagen
+    (``imagen``) en la misma consulta.
+    """
+    consulta = ProductoRecomendado.objects.filter(producto=producto, tipo=tipo)
+    return list(_con_recomendado(consulta).order_by("posicion")[:limite])
+
+
+def recomendados_por_tipo(producto: Producto, limite: int = RECOMENDACIONES_POR_PRODUCTO) -> Dict[str, List[ProductoRecomendado]]:
+    """Todas las listas de ``producto`` en una consulta; la posición ya es el puesto en cada tipo."""
+    por_tipo: Dict[str, List[ProductoRecomendado]] = {tipo: [] for tipo in ProductoRecomendado.Tipos.values}
+    consulta = ProductoRecomendado.objects.filter(producto=producto, posicion__lt=limite)
+    for recomendacion in _con_recomendado(consulta).order_by("tipo", "posicion"):
+        por_tipo[recomendacion.tipo].append(recomendacion)
+    return por_tipo
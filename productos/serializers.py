@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     Categoria,
@@ -5,6 +6,7 @@ from .models import (
     ImagenProducto,
     Marca,
     Producto,
+    ProductoRecomendado,
     Seccion,
     TallaProducto,
 )
@@ -59,3 +61,26 @@ class ProductoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Producto
         fields = "__all__"
+
+
+class ProductoRecomendadoSerializer(serializers.ModelSerializer):
+    """Tarjeta ligera del producto recomendado; la imagen viene anotada en la consulta."""
+
+    id = serializers.IntegerField(source="recomendado.id")
+    nombre = serializers.CharField(source="recomendado.nombre")
+    precio = serializers.DecimalField(source="recomendado.precio", max_digits=10, decimal_places=2)
+    precio_oferta = serializers.DecimalField(
+        source="recomendado.precio_oferta", max_digits=10, decimal_places=2, allow_null=True
+    )
+    imagen = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductoRecomendado
+        fields = ["id", "nombre", "precio", "precio_oferta", "imagen", "puntuacion"]
+
+    def get_imagen(self, obj):
+        if not obj.imagen:
+            return None
+        url = f"{settings.MEDIA_URL}{obj.imagen}"
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
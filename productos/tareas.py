@@ -0,0 +1,19 @@
+from productos import popularidad
+from productos.recomendaciones import actualizar_similares, calcular_comprados_juntos, calcular_similares
+from tareas.cola import tarea
+
+
+@tarea("productos.calcular_recomendaciones", cada=86400)
+def calcular_recomendaciones():
+    calcular_comprados_juntos()
+    calcular_similares()
+
+
+@tarea("productos.actualizar_similares")
+def actualizar_similares_producto(producto_id):
+    actualizar_similares(producto_id)
+
+
+@tarea("productos.compactar_popularidad", cada=86400)
+def compactar_popularidad():
+    popularidad.compactar()
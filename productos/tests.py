@@ -1,23 +1,35 @@
 import shutil
 import tempfile
 from decimal import Decimal
+from io import StringIO
 
+import numpy as np
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from datetime import timedelta
+
 from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from tareas.models import Tarea
+
+from . import popularidad
 from .models import (
     Categoria,
     Departamento,
+    EpocaPopularidad,
     ImagenProducto,
     Marca,
     Producto,
+    ProductoRecomendado,
     Seccion,
     TallaProducto,
 )
+from .recomendaciones import actualizar_similares, contar_coocurrencias, mejores_vecinos
 
 
 class MediaRootMixin:
@@ -296,3 +308,248 @@ class ProductoModelTestCase(MediaRootMixin, TestCase):
         self.producto.precio_oferta = None
         self.producto.save()
         self.assertEqual(self.producto.precio_vigente, Decimal("110.00"))
+
+
+class RecomendacionesTestCase(MediaRootMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.marca = Marca.objects.create(nombre="Marca Recomendaciones")
+        cls.categoria = Categoria.objects.create(nombre="Recomendaciones")
+        cls.productos = [
+            Producto.objects.create(
+                nombre=f"Modelo {letra}",
+                precio=Decimal("50.00"),
+                marca=cls.marca,
+                categoria=cls.categoria,
+                stock=5,
+            )
+            for letra in "ABCD"
+        ]
+
+    def _pedido(self, numero, productos, estado=None):
+        from pedidos.models import ItemPedido, Pedido
+
+        pedido = Pedido.objects.create(
+            numero_pedido=numero,
+            estado=estado or Pedido.Estados.ENTREGADO,
+            subtotal=Decimal("50.00"),
+            impuestos=Decimal("0.00"),
+            coste_entrega=Decimal("0.00"),
+            descuento=Decimal("0.00"),
+            total=Decimal("50.00"),
+            metodo_pago=Pedido.MetodosPago.TARJETA,
+            direccion_envio="Calle Falsa 123",
+            telefono="600000000",
+        )
+        for producto in productos:
+            for talla in ("41", "42"):
+                ItemPedido.objects.create(
+                    pedido=pedido,
+                    producto=producto,
+                    talla=talla,
+                    cantidad=1,
+                    precio_unitario=Decimal("50.00"),
+                    total=Decimal("50.00"),
+                )
+        return pedido
+
+    def test_contar_coocurrencias_cuenta_pares_del_mismo_pedido(self):
+        pedidos = np.array([1, 1, 1, 2, 2, 3])
+        productos = np.array([0, 1, 2, 0, 1, 3])
+        claves, veces = contar_coocurrencias(pedidos, productos, 4)
+
+        pares = {(int(c) // 4, int(c) % 4): int(v) for c, v in zip(claves, veces)}
+        self.assertEqual(pares, {(0, 1): 2, (1, 0): 2, (0, 2): 1, (2, 0): 1, (1, 2): 1, (2, 1): 1})
+
+        origen, destino, posicion, _ = mejores_vecinos(claves, veces, 4, k=1, minimo=1)
+        self.assertEqual(list(zip(origen, destino, posicion)), [(0, 1, 0), (1, 0, 0), (2, 0, 0)])
+
+    def test_comando_calcula_y_la_ficha_las_muestra(self):
+        from pedidos.models import Pedido
+
+        a, b, c, d = self.productos
+        self._pedido("REC1", [a, b, c])
+        self._pedido("REC2", [a, b])
+        self._pedido("REC3", [a, c, d], estado=Pedido.Estados.CANCELADO)
+        self._pedido("REC4", [a, d])
+        ImagenProducto.objects.create(
+            producto=b,
+            imagen=SimpleUploadedFile("b.jpg", b"fake image content", content_type="image/jpeg"),
+            es_principal=True,
+        )
+
+        call_command("calcular_recomendaciones", tipo="comprados_juntos", minimo=1, stdout=StringIO())
+
+        vecinos_a = list(
+            ProductoRecomendado.objects.filter(producto=a, tipo="comprados_juntos")
+            .order_by("posicion")
+            .values_list(
+                "recomendado_id", "puntuacion"
+            )
+        )
+        # REC3 está cancelado; las dos tallas de un producto cuentan como una línea.
+        self.assertEqual(vecinos_a, [(b.pk, 2.0), (c.pk, 1.0), (d.pk, 1.0)])
+
+        url = reverse("detalle-producto", args=[a.pk])
+        # Producto, imágenes, tallas (prefetch), imagen destacada, recomendaciones y tallas con stock.
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, "Comprados juntos habitualmente")
+        self.assertContains(response, reverse("detalle-producto", args=[b.pk]))
+        self.assertContains(response, "productos/b")
+
+
+class SimilaresTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.marca = Marca.objects.create(nombre="Marca Similares")
+        cls.otra_marca = Marca.objects.create(nombre="Otra Similares")
+        cls.categoria = Categoria.objects.create(nombre="Running Similares")
+        cls.otra_categoria = Categoria.objects.create(nombre="Vestir Similares")
+
+    def _producto(self, nombre, marca, categoria, precio="60.00", **extra):
+        return Producto.objects.create(
+            nombre=nombre, precio=Decimal(precio), marca=marca, categoria=categoria, stock=3, **extra
+        )
+
+    def _similares(self, producto):
+        return list(
+            ProductoRecomendado.objects.filter(producto=producto, tipo="similares")
+            .order_by("posicion")
+            .values_list("recomendado__nombre", flat=True)
+        )
+
+    def test_comando_ordena_por_caracteristicas_compartidas(self):
+        self._producto("Base", self.marca, self.categoria, genero="Hombre", color="Negro")
+        self._producto("Gemela", self.marca, self.categoria, genero="Hombre", color="negro ")
+        self._producto("Prima", self.otra_marca, self.categoria, precio="65.00", genero="Hombre")
+        self._producto("Lejana", self.otra_marca, self.otra_categoria, precio="400.00")
+
+        call_command("calcular_recomendaciones", tipo="similares", stdout=StringIO())
+
+        base = Producto.objects.get(nombre="Base")
+        self.assertEqual(self._similares(base), ["Gemela", "Prima"])
+        self.assertFalse(ProductoRecomendado.objects.filter(tipo="comprados_juntos").exists())
+
+    def test_guardar_un_producto_actualiza_su_lista_y_las_vecinas(self):
+        base = self._producto("Base", self.marca, self.categoria)
+        otro = self._producto("Otro", self.otra_marca, self.otra_categoria, precio="300.00")
+        call_command("calcular_recomendaciones", tipo="similares", stdout=StringIO())
+        self.assertEqual(self._similares(base), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = self._producto("Nuevo", self.marca, self.categoria)
+        tarea = Tarea.objects.get(nombre="productos.actualizar_similares")
+        self.assertEqual(tarea.argumentos["args"], [nuevo.pk])
+
+        self.assertEqual(actualizar_similares(nuevo.pk), 2)
+        self.assertEqual(self._similares(nuevo), ["Base"])
+        self.assertEqual(self._similares(base), ["Nuevo"])
+        self.assertEqual(self._similares(otro), [])
+
+        # Cambios que no afectan a la similitud no encolan nada.
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.save(update_fields=["descripcion"])
+        self.assertEqual(Tarea.objects.filter(nombre="productos.actualizar_similares").count(), 1)
+
+    def test_api_devuelve_los_similares(self):
+        base = self._producto("Base", self.marca, self.categoria)
+        self._producto("Gemela", self.marca, self.categoria)
+        call_command("calcular_recomendaciones", tipo="similares", stdout=StringIO())
+
+        response = self.client.get(reverse("api-producto-similares", args=[base.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["nombre"] for item in response.json()], ["Gemela"])
+        self.assertIsNone(response.json()[0]["imagen"])
+        self.assertEqual(self.client.get(reverse("api-producto-similares", args=[0])).status_code, 404)
+
+
+@override_settings(PRODUCTOS_POPULARIDAD_VIDA_MEDIA_DIAS=10)
+class PopularidadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        marca = Marca.objects.create(nombre="Marca Popular")
+        categoria = Categoria.objects.create(nombre="Popular")
+        cls.antiguo, cls.reciente, cls.sin_ventas = (
+            Producto.objects.create(
+                nombre=nombre, precio=Decimal("40.00"), marca=marca, categoria=categoria, stock=10
+            )
+            for nombre in ("Antiguo", "Reciente", "Sin ventas")
+        )
+
+    def setUp(self):
+        self.ahora = timezone.now()
+        EpocaPopularidad.objects.create(inicio=self.ahora - timedelta(days=30))
+
+    def _puntuaciones(self):
+        return dict(Producto.objects.values_list("nombre", "popularidad"))
+
+    def _pedido(self, numero, producto, cantidad, dias):
+        from pedidos.models import ItemPedido, Pedido
+
+        pedido = Pedido.objects.create(
+            numero_pedido=numero,
+            subtotal=Decimal("40.00"),
+            impuestos=Decimal("0.00"),
+            coste_entrega=Decimal("0.00"),
+            descuento=Decimal("0.00"),
+            total=Decimal("40.00"),
+            metodo_pago=Pedido.MetodosPago.CONTRAREEMBOLSO,
+            direccion_envio="Calle Falsa 123",
+            telefono="600000000",
+        )
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=self.ahora - timedelta(days=dias))
+        ItemPedido.objects.create(
+            pedido=pedido,
+            producto=producto,
+            cantidad=cantidad,
+            precio_unitario=Decimal("40.00"),
+            total=Decimal("40.00") * cantidad,
+        )
+        popularidad.sumar_ventas({producto.pk: cantidad}, self.ahora - timedelta(days=dias))
+        return pedido
+
+    def test_ventas_recientes_pesan_mas_y_compactar_conserva_el_orden(self):
+        self._pedido("POP1", self.antiguo, 3, dias=20)
+        self._pedido("POP2", self.reciente, 1, dias=0)
+        self.assertGreater(self._puntuaciones()["Reciente"], self._puntuaciones()["Antiguo"])
+
+        popularidad.compactar(self.ahora)
+
+        puntuaciones = self._puntuaciones()
+        # Tras compactar son unidades con decaimiento: 3 ventas de hace dos vidas medias = 0,75.
+        self.assertAlmostEqual(puntuaciones["Antiguo"], 0.75)
+        self.assertAlmostEqual(puntuaciones["Reciente"], 1.0)
+        self.assertEqual(puntuaciones["Sin ventas"], 0)
+        self.assertEqual(EpocaPopularidad.objects.get().inicio, self.ahora)
+
+    def test_cancelar_resta_y_recalcular_coincide_con_lo_incremental(self):
+        from pedidos.models import Pedido
+        from pedidos.services import cambiar_estado_pedidos
+
+        self._pedido("POP3", self.antiguo, 3, dias=20)
+        cancelado = self._pedido("POP4", self.reciente, 5, dias=1)
+        self._pedido("POP5", self.reciente, 1, dias=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado_pedidos([cancelado.pk], Pedido.Estados.CANCELADO)
+        popularidad.compactar()
+        incremental = self._puntuaciones()
+
+        call_command("compactar_popularidad", reiniciar=True, stdout=StringIO())
+
+        for nombre, valor in self._puntuaciones().items():
+            self.assertAlmostEqual(valor, incremental[nombre], places=4)
+        self.assertAlmostEqual(incremental["Reciente"], 1.0, places=4)
+
+    def test_orden_populares_en_catalogo_y_api(self):
+        self._pedido("POP6", self.antiguo, 1, dias=5)
+        self._pedido("POP7", self.reciente, 1, dias=0)
+
+        response = self.client.get(reverse("lista-productos"), {"orden": "populares"})
+        self.assertEqual(
+            [producto.nombre for producto in response.context["productos"]],
+            ["Reciente", "Antiguo", "Sin ventas"],
+        )
+        response = self.client.get(reverse("api-productos"), {"orden": "populares"})
+        self.assertEqual([item["nombre"] for item in response.json()], ["Reciente", "Antiguo", "Sin ventas"])
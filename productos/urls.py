@@ -6,6 +6,7 @@ from productos.views import (
     buscar_productos,
     ProductoListView,
     ProductoDetailView,
+    ProductoSimilaresView,
     CategoriaListView,
 )
 
@@ -20,5 +21,10 @@ urlpatterns = [
         ProductoDetailView.as_view(),
         name="api-producto-detalle",
     ),
+    path(
+        "api/productos/<int:pk>/similares/",
+        ProductoSimilaresView.as_view(),
+        name="api-producto-similares",
+    ),
     path("api/categorias/", CategoriaListView.as_view(), name="api-categorias"),
 ]
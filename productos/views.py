@@ -5,12 +5,17 @@ from django.shortcuts import render, get_object_or_404
 
 from rest_framework import generics
 
-from .models import Categoria, Departamento, Marca, Producto, Seccion
+from .models import Categoria, Departamento, Marca, Producto, ProductoRecomendado, Seccion
+from .recomendaciones import recomendados, recomendados_por_tipo
 
 
 HIDDEN_DEPARTAMENTOS = ("Colección General",)
 HIDDEN_SECCIONES = ("Selección Global",)
-from .serializers import CategoriaSerializer, ProductoSerializer
+# ``?orden=`` admitidos por el catálogo y la API; cada uno está respaldado por un índice.
+ORDENES_CATALOGO = {
+    "populares": ("-popularidad", "id"),
+}
+from .serializers import CategoriaSerializer, ProductoRecomendadoSerializer, ProductoSerializer
 
 
 def _resolve_by_slug_or_pk(model, raw_value):
@@ -149,6 +154,10 @@ class ProductoListView(generics.ListAPIView):
         if termino:
             queryset = apply_text_search(queryset, termino)
 
+        orden = ORDENES_CATALOGO.get(self.request.query_params.get("orden"))
+        if orden:
+            queryset = queryset.order_by(*orden)
+
         return queryset
 
 
@@ -157,6 +166,14 @@ class ProductoDetailView(generics.RetrieveAPIView):
     serializer_class = ProductoSerializer
 
 
+class ProductoSimilaresView(generics.ListAPIView):
+    serializer_class = ProductoRecomendadoSerializer
+
+    def get_queryset(self):
+        producto = get_object_or_404(Producto, pk=self.kwargs["pk"])
+        return recomendados(producto, ProductoRecomendado.Tipos.SIMILARES)
+
+
 class CategoriaListView(generics.ListAPIView):
     queryset = Categoria.objects.select_related("seccion", "seccion__departamento")
     serializer_class = CategoriaSerializer
@@ -186,6 +203,7 @@ def lista_productos(request):
         "seccion": request.GET.get("seccion"),
         "categoria": request.GET.get("categoria"),
         "fabricante": request.GET.get("fabricante"),
+        "orden": request.GET.get("orden") if request.GET.get("orden") in ORDENES_CATALOGO else None,
     }
 
     productos = (
@@ -198,6 +216,8 @@ def lista_productos(request):
     )
 
     productos, filtros_contexto = apply_catalog_filters(productos, filtros)
+    if filtros["orden"]:
+        productos = productos.order_by(*ORDENES_CATALOGO[filtros["orden"]])
 
     categorias = (
         Categoria.objects.select_related(
@@ -336,10 +356,13 @@ def detalle_producto(request, pk):
 
     imagen_principal = producto.imagen_destacada
     tallas_disponibles = producto.tallas.filter(stock__gt=0).order_by("talla")
+    recomendaciones = recomendados_por_tipo(producto)
 
     context = {
         "producto": producto,
         "imagen_principal": imagen_principal,
         "tallas": tallas_disponibles,
+        "comprados_juntos": recomendaciones[ProductoRecomendado.Tipos.COMPRADOS_JUNTOS],
+        "similares": recomendaciones[ProductoRecomendado.Tipos.SIMILARES],
     }
     return render(request, "productos/detalle_producto.html", context)
@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Tarea
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "estado", "programada_para", "intentos", "duracion_ms", "cada_segundos")
+    list_filter = ("estado", "nombre")
+    search_fields = ("nombre", "clave_unica", "ultimo_error")
+    readonly_fields = ("fecha_creacion", "fecha_inicio", "fecha_fin", "duracion_ms", "trabajador")
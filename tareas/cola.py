@@ -0,0 +1,238 @@
+"""
+Cola de tareas en base de datos.
+
+Las funciones se registran con ``@tarea("app.nombre")`` en el módulo ``tareas.py`` de cada
+app y se encolan con ``encolar``. El comando ``run_worker`` las reserva y ejecuta: en
+PostgreSQL con ``SELECT ... FOR UPDATE SKIP LOCKED`` y, en SQLite, con una reserva
+condicional marcada con un identificador único por trabajador. Mientras una tarea se
+ejecuta, un hilo renueva su reserva para que las tareas largas no se den por abandonadas.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from tareas.models import Tarea
+from tienda_virtual import metricas
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo que una tarea puede quedar reservada sin renovarse antes de considerarse
+# abandonada; el trabajador la renueva cada INTERVALO_RENOVACION mientras la ejecuta.
+RESERVA_MAXIMA = timedelta(minutes=15)
+INTERVALO_RENOVACION = RESERVA_MAXIMA / 3
+ESPERA_BASE_REINTENTO = timedelta(seconds=10)
+
+
+@dataclass(frozen=True)
+class TareaRegistrada:
+    nombre: str
+    funcion: Callable
+    cada_segundos: Optional[int] = None
+    max_intentos: int = 3
+
+
+REGISTRO: Dict[str, TareaRegistrada] = {}
+
+
+def tarea(nombre: str, *, cada: Union[int, timedelta, None] = None, max_intentos: int = 3):
+    """
+    Registra una función como tarea. Con ``cada`` se declara recurrente y el trabajador
+    la programa automáticamente al arrancar.
+    """
+    if isinstance(cada, timedelta):
+        cada = int(cada.total_seconds())
+
+    def decorador(funcion):
+        REGISTRO[nombre] = TareaRegistrada(nombre, funcion, cada, max_intentos)
+        return funcion
+
+    return decorador
+
+
+def encolar(
+    nombre: str,
+    *args,
+    programar_en: Union[datetime, timedelta, None] = None,
+    **kwargs,
+) -> Tarea:
+    if nombre not in REGISTRO:
+        raise KeyError(f"Tarea no registrada: {nombre}")
+    if isinstance(programar_en, timedelta):
+        programar_en = timezone.now() + programar_en
+    return Tarea.objects.create(
+        nombre=nombre,
+        argumentos={"args": list(args), "kwargs": kwargs},
+        programada_para=programar_en or timezone.now(),
+        max_intentos=REGISTRO[nombre].max_intentos,
+    )
+
+
+def asegurar_recurrentes() -> int:
+    """Crea (una sola vez) la fila de cada tarea recurrente declarada en el registro."""
+    creadas = 0
+    for registrada in REGISTRO.values():
+        if not registrada.cada_segundos:
+            continue
+        _, creada = Tarea.objects.update_or_create(
+            clave_unica=f"recurrente:{registrada.nombre}",
+            defaults={"cada_segundos": registrada.cada_segundos},
+            create_defaults={
+                "nombre": registrada.nombre,
+                "cada_segundos": registrada.cada_segundos,
+                "max_intentos": registrada.max_intentos,
+            },
+        )
+        creadas += int(creada)
+    return creadas
+
+
+def recuperar_abandonadas() -> int:
+    """Devuelve a la cola las tareas cuyo trabajador murió sin terminarlas."""
+    return Tarea.objects.filter(
+        estado=Tarea.Estados.EN_CURSO,
+        reservada_hasta__lt=timezone.now(),
+    ).update(estado=Tarea.Estados.PENDIENTE, trabajador="")
+
+
+def reservar(trabajador: str, limite: int = 1) -> List[int]:
+    """Reserva hasta ``limite`` tareas vencidas y devuelve sus ids."""
+    ahora = timezone.now()
+    marca = f"{trabajador}:{uuid.uuid4().hex[:8]}"
+    vencidas = Tarea.objects.filter(
+        estado=Tarea.Estados.PENDIENTE,
+        programada_para__lte=ahora,
+    ).order_by("programada_para", "id")
+    cambios = {
+        "estado": Tarea.Estados.EN_CURSO,
+        "trabajador": marca,
+        "fecha_inicio": ahora,
+        "reservada_hasta": ahora + RESERVA_MAXIMA,
+        "intentos": F("intentos") + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(vencidas.select_for_update(skip_locked=True).values_list("pk", flat=True)[:limite])
+            Tarea.objects.filter(pk__in=ids).update(**cambios)
+        return ids
+
+    # Sin SKIP LOCKED (SQLite): lectura y UPDATE condicional en autocommit. Abrir una
+    # transacción que lee y después escribe provocaría "database is locked" con varios
+    # trabajadores; la condición sobre el estado y la marca única hacen de reserva atómica.
+    ids = list(vencidas.values_list("pk", flat=True)[:limite])
+    if not ids:
+        return []
+    Tarea.objects.filter(pk__in=ids, estado=Tarea.Estados.PENDIENTE).update(**cambios)
+    return list(
+        Tarea.objects.filter(pk__in=ids, trabajador=marca)
+        .order_by("programada_para", "id")
+        .values_list("pk", flat=True)
+    )
+
+
+def renovar_reserva(tarea_id: int, trabajador: str) -> bool:
+    """Alarga la reserva de una tarea en curso si sigue siendo de ``trabajador``."""
+    return bool(
+        Tarea.objects.filter(pk=tarea_id, estado=Tarea.Estados.EN_CURSO, trabajador=trabajador).update(
+            reservada_hasta=timezone.now() + RESERVA_MAXIMA
+        )
+    )
+
+
+@contextmanager
+def _latido(tarea_id: int, trabajador: str):
+    """Renueva la reserva en un hilo aparte mientras dura el bloque."""
+    parar = threading.Event()
+
+    def renovar():
+        try:
+            while not parar.wait(INTERVALO_RENOVACION.total_seconds()):
+                if not renovar_reserva(tarea_id, trabajador):
+                    logger.warning("La tarea %s ya no está reservada por %s", tarea_id, trabajador)
+                    break
+        finally:
+            connections.close_all()
+
+    hilo = threading.Thread(target=renovar, name=f"latido-tarea-{tarea_id}", daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        hilo.join()
+
+
+def ejecutar(tarea_id: int) -> bool:
+    """Ejecuta una tarea ya reservada y registra su resultado y duración."""
+    instancia = Tarea.objects.get(pk=tarea_id)
+    registrada = REGISTRO.get(instancia.nombre)
+    inicio = time.perf_counter()
+    error = ""
+    try:
+        if registrada is None:
+            raise LookupError(f"Tarea no registrada: {instancia.nombre}")
+        argumentos = instancia.argumentos or {}
+        with _latido(instancia.pk, instancia.trabajador):
+            registrada.funcion(*argumentos.get("args", []), **argumentos.get("kwargs", {}))
+    except Exception as exc:
+        logger.exception("Error ejecutando la tarea %s (%s)", instancia.nombre, instancia.pk)
+        error = f"{type(exc).__name__}: {exc}"
+    duracion = time.perf_counter() - inicio
+
+    metricas.registrar_duracion(f"tareas.{instancia.nombre}", duracion)
+    metricas.incrementar(f"tareas.{instancia.nombre}.{'errores' if error else 'completadas'}")
+
+    ahora = timezone.now()
+    cambios = {
+        "fecha_fin": ahora,
+        "duracion_ms": int(duracion * 1000),
+        "ultimo_error": error[:2000],
+        "trabajador": "",
+        "reservada_hasta": None,
+    }
+    if registrada is None:
+        # Ya no existe en el código (tarea eliminada o renombrada): reintentarla no sirve.
+        cambios["estado"] = Tarea.Estados.FALLIDA
+    elif instancia.cada_segundos:
+        # Las recurrentes registradas vuelven siempre a la cola; los fallos quedan en ultimo_error.
+        cambios.update(
+            estado=Tarea.Estados.PENDIENTE,
+            programada_para=ahora + timedelta(seconds=instancia.cada_segundos),
+            intentos=0,
+        )
+    elif not error:
+        cambios["estado"] = Tarea.Estados.COMPLETADA
+    elif instancia.intentos < instancia.max_intentos:
+        cambios.update(
+            estado=Tarea.Estados.PENDIENTE,
+            programada_para=ahora + ESPERA_BASE_REINTENTO * (2 ** (instancia.intentos - 1)),
+        )
+    else:
+        cambios["estado"] = Tarea.Estados.FALLIDA
+    Tarea.objects.filter(pk=instancia.pk).update(**cambios)
+    return not error
+
+
+def procesar_pendientes(trabajador: str = "local", limite: int = 100) -> int:
+    """Ejecuta en el proceso actual las tareas vencidas. Útil en pruebas y scripts."""
+    ejecutadas = 0
+    while ejecutadas < limite:
+        ids = reservar(trabajador, limite=min(10, limite - ejecutadas))
+        if not ids:
+            break
+        for tarea_id in ids:
+            ejecutar(tarea_id)
+            ejecutadas += 1
+    return ejecutadas
@@ -0,0 +1,108 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from tareas import cola
+
+
+def _inicializar_proceso():
+    django.setup()
+    connections.close_all()
+
+
+def _ejecutar_en_hilo(tarea_id):
+    try:
+        return cola.ejecutar(tarea_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Ejecuta las tareas en segundo plano de la base de datos con un pool de hilos o procesos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrencia", type=int, default=2, help="Tareas simultáneas.")
+        parser.add_argument(
+            "--modo",
+            choices=["hilos", "procesos"],
+            default="hilos",
+            help="Tipo de pool: hilos (E/S, correo, APIs) o procesos (CPU).",
+        )
+        parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos de espera con la cola vacía.")
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Ejecuta las tareas vencidas y termina (útil en cron o despliegues sin proceso fijo).",
+        )
+
+    def handle(self, *args, **options):
+        self.detener = False
+        signal.signal(signal.SIGTERM, self._pedir_parada)
+        signal.signal(signal.SIGINT, self._pedir_parada)
+
+        trabajador = f"{socket.gethostname()}:{os.getpid()}"
+        cola.asegurar_recurrentes()
+        concurrencia = max(1, options["concurrencia"])
+
+        if concurrencia == 1 and options["modo"] == "hilos":
+            ejecutadas = self._bucle_en_linea(trabajador, options)
+        else:
+            ejecutadas = self._bucle_con_pool(trabajador, concurrencia, options)
+        self.stdout.write(f"Tareas ejecutadas: {ejecutadas}")
+
+    def _pedir_parada(self, *args):
+        self.detener = True
+
+    def _bucle_en_linea(self, trabajador, options):
+        ejecutadas = 0
+        while not self.detener:
+            cola.recuperar_abandonadas()
+            ids = cola.reservar(trabajador, limite=1)
+            for tarea_id in ids:
+                cola.ejecutar(tarea_id)
+                ejecutadas += 1
+            if not ids:
+                if options["una_vez"]:
+                    break
+                close_old_connections()
+                time.sleep(options["intervalo"])
+        return ejecutadas
+
+    def _bucle_con_pool(self, trabajador, concurrencia, options):
+        if options["modo"] == "procesos":
+            # Los hijos abren sus propias conexiones: no deben heredar las del padre.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=concurrencia, initializer=_inicializar_proceso)
+            funcion = cola.ejecutar
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="tareas")
+            funcion = _ejecutar_en_hilo
+
+        en_curso = set()
+        ejecutadas = 0
+        with pool:
+            while not self.detener:
+                cola.recuperar_abandonadas()
+                huecos = concurrencia - len(en_curso)
+                ids = cola.reservar(trabajador, limite=huecos) if huecos else []
+                for tarea_id in ids:
+                    en_curso.add(pool.submit(funcion, tarea_id))
+
+                if en_curso:
+                    terminadas, en_curso = wait(en_curso, timeout=options["intervalo"], return_when=FIRST_COMPLETED)
+                    ejecutadas += len(terminadas)
+                elif options["una_vez"]:
+                    break
+                else:
+                    close_old_connections()
+                    time.sleep(options["intervalo"])
+
+            terminadas, _ = wait(en_curso)
+            ejecutadas += len(terminadas)
+        return ejecutadas
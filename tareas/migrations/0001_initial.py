@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=150)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('programada_para', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cada_segundos', models.PositiveIntegerField(blank=True, help_text='Si se indica, la tarea se vuelve a programar tras cada ejecución.', null=True)),
+                ('clave_unica', models.CharField(blank=True, max_length=150, null=True, unique=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('reservada_hasta', models.DateTimeField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('duracion_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('programada_para', 'id'),
+                'indexes': [models.Index(fields=['estado', 'programada_para'], name='tarea_cola_idx')],
+            },
+        ),
+    ]
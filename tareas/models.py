@@ -0,0 +1,42 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano guardado en base de datos (sin broker externo)."""
+
+    class Estados(models.TextChoices):
+        PENDIENTE = "pendiente", _("Pendiente")
+        EN_CURSO = "en_curso", _("En curso")
+        COMPLETADA = "completada", _("Completada")
+        FALLIDA = "fallida", _("Fallida")
+
+    nombre = models.CharField(max_length=150)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=Estados.choices, default=Estados.PENDIENTE)
+    programada_para = models.DateTimeField(default=timezone.now)
+    cada_segundos = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Si se indica, la tarea se vuelve a programar tras cada ejecución.",
+    )
+    clave_unica = models.CharField(max_length=150, unique=True, null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    trabajador = models.CharField(max_length=100, blank=True)
+    reservada_hasta = models.DateTimeField(null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    duracion_ms = models.PositiveIntegerField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("programada_para", "id")
+        indexes = [
+            models.Index(fields=["estado", "programada_para"], name="tarea_cola_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} ({self.estado})"
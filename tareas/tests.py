@@ -0,0 +1,146 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from tienda_virtual import metricas
+from . import cola
+from .cola import (
+    REGISTRO,
+    asegurar_recurrentes,
+    encolar,
+    procesar_pendientes,
+    recuperar_abandonadas,
+    renovar_reserva,
+    reservar,
+    tarea,
+)
+from .models import Tarea
+
+LLAMADAS = []
+
+
+@tarea("pruebas.sumar")
+def sumar(a, b=0):
+    LLAMADAS.append(a + b)
+
+
+@tarea("pruebas.fallar", max_intentos=2)
+def fallar():
+    raise RuntimeError("fallo controlado")
+
+
+@tarea("pruebas.latido", cada=60)
+def latido():
+    LLAMADAS.append("latido")
+
+
+@tarea("pruebas.lenta")
+def lenta():
+    time.sleep(0.1)
+
+
+class ColaTareasTests(TestCase):
+    def setUp(self):
+        LLAMADAS.clear()
+        metricas.reiniciar()
+
+    def test_ejecuta_tarea_con_argumentos_y_mide_duracion(self):
+        tarea_obj = encolar("pruebas.sumar", 2, b=3)
+
+        self.assertEqual(procesar_pendientes(), 1)
+
+        tarea_obj.refresh_from_db()
+        self.assertEqual(LLAMADAS, [5])
+        self.assertEqual(tarea_obj.estado, Tarea.Estados.COMPLETADA)
+        self.assertIsNotNone(tarea_obj.duracion_ms)
+        self.assertEqual(metricas.instantanea()["duraciones"]["tareas.pruebas.sumar"]["n"], 1)
+
+    def test_tarea_programada_no_se_reserva_antes_de_tiempo(self):
+        encolar("pruebas.sumar", 1, programar_en=timedelta(hours=1))
+
+        self.assertEqual(reservar("t1"), [])
+        self.assertEqual(procesar_pendientes(), 0)
+
+    def test_una_tarea_reservada_no_la_toma_otro_trabajador(self):
+        encolar("pruebas.sumar", 1)
+
+        self.assertEqual(len(reservar("t1")), 1)
+        self.assertEqual(reservar("t2"), [])
+
+    def test_fallos_se_reintentan_y_despues_fallan(self):
+        tarea_obj = encolar("pruebas.fallar")
+
+        procesar_pendientes()
+        tarea_obj.refresh_from_db()
+        self.assertEqual(tarea_obj.estado, Tarea.Estados.PENDIENTE)
+        self.assertIn("fallo controlado", tarea_obj.ultimo_error)
+
+        Tarea.objects.filter(pk=tarea_obj.pk).update(programada_para=timezone.now())
+        procesar_pendientes()
+        tarea_obj.refresh_from_db()
+        self.assertEqual(tarea_obj.estado, Tarea.Estados.FALLIDA)
+
+    def test_recurrente_se_reprograma(self):
+        asegurar_recurrentes()
+        asegurar_recurrentes()
+        recurrente = Tarea.objects.get(clave_unica="recurrente:pruebas.latido")
+
+        procesar_pendientes()
+
+        recurrente.refresh_from_db()
+        self.assertEqual(LLAMADAS.count("latido"), 1)
+        self.assertEqual(recurrente.estado, Tarea.Estados.PENDIENTE)
+        self.assertGreater(recurrente.programada_para, timezone.now() + timedelta(seconds=50))
+
+    def test_recurrente_sin_registrar_falla_en_vez_de_reprogramarse(self):
+        huerfana = Tarea.objects.create(
+            nombre="pruebas.eliminada", cada_segundos=60, clave_unica="recurrente:pruebas.eliminada"
+        )
+
+        procesar_pendientes()
+
+        huerfana.refresh_from_db()
+        self.assertEqual(huerfana.estado, Tarea.Estados.FALLIDA)
+        self.assertIn("no registrada", huerfana.ultimo_error)
+
+    def test_renovar_reserva_evita_que_se_recupere_una_tarea_larga(self):
+        tarea_obj = encolar("pruebas.sumar", 1)
+        reservar("t1")
+        tarea_obj.refresh_from_db()
+        Tarea.objects.filter(pk=tarea_obj.pk).update(reservada_hasta=timezone.now() - timedelta(seconds=1))
+
+        self.assertFalse(renovar_reserva(tarea_obj.pk, "otro"))
+        self.assertTrue(renovar_reserva(tarea_obj.pk, tarea_obj.trabajador))
+
+        self.assertEqual(recuperar_abandonadas(), 0)
+        tarea_obj.refresh_from_db()
+        self.assertGreater(tarea_obj.reservada_hasta, timezone.now() + timedelta(minutes=14))
+
+    def test_ejecutar_renueva_la_reserva_mientras_dura_la_tarea(self):
+        tarea_obj = encolar("pruebas.lenta")
+        reservar("t1")
+        tarea_obj.refresh_from_db()
+
+        with mock.patch.object(cola, "INTERVALO_RENOVACION", timedelta(milliseconds=10)), mock.patch.object(
+            cola, "renovar_reserva", return_value=True
+        ) as renovar:
+            self.assertTrue(cola.ejecutar(tarea_obj.pk))
+
+        renovar.assert_called_with(tarea_obj.pk, tarea_obj.trabajador)
+        llamadas = renovar.call_count
+        time.sleep(0.05)
+        self.assertEqual(renovar.call_count, llamadas)
+
+    def test_run_worker_una_vez(self):
+        encolar("pruebas.sumar", 4)
+        salida = StringIO()
+
+        call_command("run_worker", "--una-vez", "--concurrencia", "1", stdout=salida)
+
+        self.assertIn(4, LLAMADAS)
+        self.assertIn("pedidos.procesar_correos", REGISTRO)
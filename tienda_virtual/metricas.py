@@ -0,0 +1,48 @@
+"""
+Contadores y tiempos en memoria del proceso.
+
+No sustituyen a un sistema de monitorización: sirven para exponer valores en el panel,
+en los comandos de diagnóstico y en las pruebas sin añadir dependencias externas.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_contadores: Dict[str, int] = defaultdict(int)
+_duraciones: Dict[str, Dict[str, float]] = {}
+
+
+def incrementar(nombre: str, cantidad: int = 1) -> None:
+    with _lock:
+        _contadores[nombre] += cantidad
+
+
+def registrar_duracion(nombre: str, segundos: float) -> None:
+    with _lock:
+        datos = _duraciones.get(nombre)
+        if datos is None:
+            _duraciones[nombre] = {"n": 1, "total": segundos, "max": segundos}
+            return
+        datos["n"] += 1
+        datos["total"] += segundos
+        datos["max"] = max(datos["max"], segundos)
+
+
+def instantanea() -> Dict[str, Dict]:
+    """Copia de los valores actuales; las duraciones incluyen la media en segundos."""
+    with _lock:
+        duraciones = {
+            nombre: {**datos, "media": datos["total"] / datos["n"]}
+            for nombre, datos in _duraciones.items()
+        }
+        return {"contadores": dict(_contadores), "duraciones": duraciones}
+
+
+def reiniciar() -> None:
+    with _lock:
+        _contadores.clear()
+        _duraciones.clear()
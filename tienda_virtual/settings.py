@@ -48,7 +48,9 @@ INSTALLED_APPS = [
     'clientes',
     'productos',
     'carrito',
-    'pedidos'
+    'pedidos',
+    'tareas',
+    'informes',
 ]
 
 MIDDLEWARE = [
@@ -92,6 +94,26 @@ DATABASES = {
     }
 }
 
+# Caché compartida por todos los procesos (workers web y `run_worker`): las invalidaciones
+# del seguimiento y el refresco de los indicadores del panel tienen que verse en todos.
+# Por defecto es una tabla de la base de datos (`python manage.py createcachetable`);
+# con CACHE_REDIS_URL se usa Redis (requiere el paquete `redis`).
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "cache_compartida",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -157,6 +179,11 @@ PEDIDOS_IVA = os.getenv('PEDIDOS_IVA', '0.21')
 PEDIDOS_COSTE_ENTREGA = os.getenv('PEDIDOS_COSTE_ENTREGA', '5.00')
 ENVIO_GRATIS_DESDE = 125.00
 COSTE_ENVIO_ESTANDAR = 4.99
+# Reintentos ante deadlocks/serializacion al confirmar pedidos (picos de demanda).
+PEDIDOS_MAX_INTENTOS_TRANSACCION = int(os.getenv('PEDIDOS_MAX_INTENTOS_TRANSACCION', '3'))
+PEDIDOS_ESPERA_BASE_REINTENTO = float(os.getenv('PEDIDOS_ESPERA_BASE_REINTENTO', '0.05'))
+# Vigencia de las cabeceras Idempotency-Key de la API de pedidos.
+PEDIDOS_IDEMPOTENCIA_TTL_HORAS = float(os.getenv('PEDIDOS_IDEMPOTENCIA_TTL_HORAS', '24'))
 
 
 def _bool_env(var_name: str, default: str = "false") -> bool:
@@ -186,12 +213,26 @@ EMAIL_USE_TLS = _bool_env('EMAIL_USE_TLS', 'true')
 EMAIL_USE_SSL = _bool_env('EMAIL_USE_SSL')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Zapateria Hermanos Parera <no-reply@zapateria.local>')
 
+# Bandeja de salida (python manage.py procesar_correos): reintentos con espera exponencial.
+PEDIDOS_CORREO_MAX_INTENTOS = int(os.getenv('PEDIDOS_CORREO_MAX_INTENTOS', '5'))
+PEDIDOS_CORREO_ESPERA_BASE_SEGUNDOS = int(os.getenv('PEDIDOS_CORREO_ESPERA_BASE_SEGUNDOS', '60'))
+PEDIDOS_CORREO_RESERVA_SEGUNDOS = int(os.getenv('PEDIDOS_CORREO_RESERVA_SEGUNDOS', '300'))
+
 
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 STRIPE_DEFAULT_CURRENCY = os.getenv("STRIPE_DEFAULT_CURRENCY", "eur")
 STRIPE_API_VERSION = os.getenv("STRIPE_API_VERSION", "")
+# Dirección alternativa de la API (p. ej. el servidor de ``manage.py stripe_falso``).
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")
+# Límites de las llamadas a Stripe: tiempos de espera en segundos, reintentos de red y
+# cortacircuitos (fallos seguidos antes de abrirlo y segundos que permanece abierto).
+STRIPE_TIMEOUT_CONEXION = float(os.getenv("STRIPE_TIMEOUT_CONEXION", "3"))
+STRIPE_TIMEOUT_LECTURA = float(os.getenv("STRIPE_TIMEOUT_LECTURA", "10"))
+STRIPE_MAX_REINTENTOS = int(os.getenv("STRIPE_MAX_REINTENTOS", "2"))
+STRIPE_CIRCUITO_UMBRAL = int(os.getenv("STRIPE_CIRCUITO_UMBRAL", "5"))
+STRIPE_CIRCUITO_ESPERA = float(os.getenv("STRIPE_CIRCUITO_ESPERA", "30"))
 
 
 FORCE_HTTPS = _bool_env("FORCE_HTTPS", "true" if not DEBUG else "false")
@@ -206,6 +247,32 @@ SECURE_HSTS_PRELOAD = FORCE_HTTPS
 LOGIN_URL = "/panel/login/"
 LOGIN_REDIRECT_URL = "/panel/"
 
+# Panel: segundos que los indicadores del dashboard se consideran frescos y umbral de
+# unidades por debajo del cual un producto cuenta como stock bajo.
+PANEL_INDICADORES_TTL = int(os.getenv("PANEL_INDICADORES_TTL", "60"))
+PANEL_UMBRAL_STOCK_BAJO = int(os.getenv("PANEL_UMBRAL_STOCK_BAJO", "5"))
+
+# Segundos que se guardan en caché las páginas públicas de seguimiento y detalle de pedido.
+PEDIDOS_SEGUIMIENTO_TTL = int(os.getenv("PEDIDOS_SEGUIMIENTO_TTL", "300"))
+# Eventos en vivo del seguimiento: latido para mantener la conexión, duración máxima de
+# cada conexión y cada cuánto se consultan los cambios hechos por otros procesos.
+PEDIDOS_SEGUIMIENTO_LATIDO = int(os.getenv("PEDIDOS_SEGUIMIENTO_LATIDO", "15"))
+PEDIDOS_SEGUIMIENTO_DURACION = int(os.getenv("PEDIDOS_SEGUIMIENTO_DURACION", "300"))
+PEDIDOS_SEGUIMIENTO_SONDEO = int(os.getenv("PEDIDOS_SEGUIMIENTO_SONDEO", "5"))
+
+# Vida media (en días) de una venta en la puntuación de popularidad del catálogo.
+PRODUCTOS_POPULARIDAD_VIDA_MEDIA_DIAS = float(os.getenv("PRODUCTOS_POPULARIDAD_VIDA_MEDIA_DIAS", "14"))
+
+# Reposición: días de ventas usados para prever la demanda, plazo del proveedor, días de
+# venta que debe cubrir cada pedido sugerido y destinatarios del aviso diario (separados
+# por comas; vacío, no se envía).
+INFORMES_REPOSICION_VENTANA_DIAS = int(os.getenv("INFORMES_REPOSICION_VENTANA_DIAS", "56"))
+INFORMES_REPOSICION_PLAZO_DIAS = int(os.getenv("INFORMES_REPOSICION_PLAZO_DIAS", "7"))
+INFORMES_REPOSICION_COBERTURA_DIAS = int(os.getenv("INFORMES_REPOSICION_COBERTURA_DIAS", "30"))
+INFORMES_REPOSICION_DESTINATARIOS = [
+    email.strip() for email in os.getenv("INFORMES_REPOSICION_DESTINATARIOS", "").split(",") if email.strip()
+]
+
 
 print("=== EMAIL CONFIG EN PRODUCCIÓN ===")
 print("DEBUG:", DEBUG)
@@ -5,7 +5,7 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.static import serve
-from pedidos.views import seguimiento_pedido
+from pedidos.views import seguimiento_eventos, seguimiento_pedido
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,10 +13,12 @@ urlpatterns = [
     path('carrito/', include('carrito.urls')),
     path('clientes/', include('clientes.urls')),
     path('pedidos/', include('pedidos.urls')),
+    path('panel/informes/', include('informes.urls')),
     path('panel/', include('admin_panel.urls')),
     path('api/', include('clientes.api_urls')),
     path('api/', include('pedidos.api_urls')),
     path('pedido/seguimiento/<slug:tracking_token>/', seguimiento_pedido, name='seguimiento_pedido'),
+    path('pedido/seguimiento/<slug:tracking_token>/eventos/', seguimiento_eventos, name='seguimiento_eventos'),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
 ]
 